@@ -0,0 +1,286 @@
+"""
+Sales analytics served from precomputed rollups.
+
+crud keeps the rollup tables (ShowSales, MovieSales, HallSales, SalesBucket in
+models.py) up to date inside the same transaction as every booking and
+cancellation, using the ticket price at booking time. Reads are then primary
+key lookups or index scans instead of COUNT joins over bookings. Bookings
+moved to bookings_archive (archive.py) stay counted; movie_sales_archive
+holds their share so live-only totals are a subtraction. `rebuild`
+recomputes everything from the raw tables:
+
+    python analytics.py rebuild
+"""
+from datetime import datetime
+from sqlalchemy import func, delete, literal, select
+from sqlalchemy.orm import Session
+from database import dialect_insert
+import models
+
+
+def _bump(db: Session, model, keys: dict, **deltas):
+    """
+    Upsert `keys` and add `deltas` to the existing counters. Runs in the caller's transaction.
+    """
+    stmt = dialect_insert(db, model).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={k: getattr(model, k) + v for k, v in deltas.items()},
+    )
+    db.execute(stmt)
+
+
+def hour_bucket(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def show_pricing(db: Session, show_id: int):
+    """
+    (movie_id, hall_id, current ticket price) for a show, or None.
+    """
+    return (
+        db.query(models.Show.movie_id, models.Show.hall_id, models.Movie.price)
+        .join(models.Movie, models.Movie.id == models.Show.movie_id)
+        .filter(models.Show.id == show_id)
+        .first()
+    )
+
+
+# ---------- Incremental maintenance (called from crud, before commit) ----------
+def register_show(db: Session, show):
+    capacity = db.query(func.count(models.Seat.id)).filter(models.Seat.hall_id == show.hall_id).scalar() or 0
+    db.execute(models.ShowSales.__table__.insert().values(
+        show_id=show.id, movie_id=show.movie_id, hall_id=show.hall_id, capacity=capacity, tickets=0, revenue=0.0
+    ))
+    _bump(db, models.HallSales, {"hall_id": show.hall_id}, capacity=capacity, tickets=0)
+
+
+def record_sales(db: Session, show_id: int, items):
+    """
+    Apply ticket deltas for one show. `items` is an iterable of (tickets, price, booked_at):
+    positive tickets for bookings, negative for cancellations.
+    """
+    pricing = None
+    tickets = 0
+    revenue = 0.0
+    buckets = {}
+    for n, price, at in items:
+        if price is None:
+            # booked before prices were recorded -> fall back to the current price
+            pricing = pricing or show_pricing(db, show_id)
+            price = pricing.price if pricing else 0.0
+        tickets += n
+        revenue += n * price
+        if at is not None:
+            b = buckets.setdefault(hour_bucket(at), [0, 0.0])
+            b[0] += n
+            b[1] += n * price
+    if not tickets:
+        return
+    ss = db.query(models.ShowSales.movie_id, models.ShowSales.hall_id).filter(models.ShowSales.show_id == show_id).first()
+    if ss is None:
+        show = db.query(models.Show).filter(models.Show.id == show_id).first()
+        if show is None:
+            return
+        register_show(db, show)
+        ss = show
+    db.query(models.ShowSales).filter(models.ShowSales.show_id == show_id).update(
+        {models.ShowSales.tickets: models.ShowSales.tickets + tickets,
+         models.ShowSales.revenue: models.ShowSales.revenue + revenue},
+        synchronize_session=False,
+    )
+    _bump(db, models.MovieSales, {"movie_id": ss.movie_id}, tickets=tickets, revenue=revenue)
+    _bump(db, models.HallSales, {"hall_id": ss.hall_id}, tickets=tickets, capacity=0)
+    for start, (n, rev) in buckets.items():
+        _bump(db, models.SalesBucket, {"movie_id": ss.movie_id, "bucket_start": start}, tickets=n, revenue=rev)
+
+
+def record_archived(db: Session, totals):
+    """
+    Bookings moved to the archive (archive.py): {movie_id: (tickets, revenue)}. The main rollups keep counting them.
+    """
+    for movie_id, (n, rev) in totals.items():
+        _bump(db, models.ArchivedMovieSales, {"movie_id": movie_id}, tickets=n, revenue=rev)
+
+
+def register_bulk(db: Session, shows, buckets):
+    """
+    Rollups for shows loaded in bulk (seed.py) without a full rebuild. `shows` are new
+    ShowSales rows (show_id, movie_id, hall_id, capacity, tickets, revenue); `buckets` maps
+    (movie_id, hour start) -> [tickets, revenue] for their bookings.
+    """
+    if not shows:
+        return
+    db.execute(models.ShowSales.__table__.insert(), shows)
+    movies, halls = {}, {}
+    for s in shows:
+        m = movies.setdefault(s["movie_id"], [0, 0.0])
+        m[0] += s["tickets"]
+        m[1] += s["revenue"]
+        h = halls.setdefault(s["hall_id"], [0, 0])
+        h[0] += s["capacity"]
+        h[1] += s["tickets"]
+    for movie_id, (n, rev) in movies.items():
+        _bump(db, models.MovieSales, {"movie_id": movie_id}, tickets=n, revenue=rev)
+    for hall_id, (cap, n) in halls.items():
+        _bump(db, models.HallSales, {"hall_id": hall_id}, capacity=cap, tickets=n)
+    for (movie_id, start), (n, rev) in buckets.items():
+        _bump(db, models.SalesBucket, {"movie_id": movie_id, "bucket_start": start}, tickets=n, revenue=rev)
+
+
+# ---------- Reads ----------
+def movie_totals(db: Session, movie_id: int, include_archived: bool = True):
+    r = db.query(models.MovieSales.tickets, models.MovieSales.revenue).filter(models.MovieSales.movie_id == movie_id).first()
+    tickets, revenue = (r.tickets, r.revenue) if r else (0, 0.0)
+    if not include_archived:
+        a = (db.query(models.ArchivedMovieSales.tickets, models.ArchivedMovieSales.revenue)
+             .filter(models.ArchivedMovieSales.movie_id == movie_id).first())
+        if a:
+            tickets, revenue = tickets - a.tickets, revenue - a.revenue
+    return tickets, revenue
+
+
+def top_movies(db: Session, n: int = 10, by: str = "tickets"):
+    col = models.MovieSales.revenue if by == "revenue" else models.MovieSales.tickets
+    rows = (
+        db.query(models.MovieSales.movie_id, models.Movie.title, models.MovieSales.tickets, models.MovieSales.revenue)
+        .join(models.Movie, models.Movie.id == models.MovieSales.movie_id)
+        .order_by(col.desc())
+        .limit(n)
+        .all()
+    )
+    return [{"movie_id": r.movie_id, "title": r.title, "tickets_sold": r.tickets, "gmv": float(r.revenue)} for r in rows]
+
+
+def _occupancy(tickets, capacity):
+    return round(tickets / capacity, 4) if capacity else 0.0
+
+
+def show_occupancy(db: Session, show_id: int):
+    r = db.query(models.ShowSales).filter(models.ShowSales.show_id == show_id).first()
+    if r is None:
+        return None
+    return {"show_id": show_id, "capacity": r.capacity, "tickets_sold": r.tickets,
+            "occupancy": _occupancy(r.tickets, r.capacity), "gmv": float(r.revenue)}
+
+
+def hall_occupancy(db: Session, hall_id: int):
+    r = db.query(models.HallSales).filter(models.HallSales.hall_id == hall_id).first()
+    if r is None:
+        return None
+    return {"hall_id": hall_id, "capacity": r.capacity, "tickets_sold": r.tickets,
+            "occupancy": _occupancy(r.tickets, r.capacity)}
+
+
+def sales_series(db: Session, movie_id: int, start: datetime = None, end: datetime = None, bucket: str = "hour"):
+    """
+    Tickets and revenue per hour (or per day, folded from the hourly buckets) in [start, end).
+    """
+    q = db.query(models.SalesBucket).filter(models.SalesBucket.movie_id == movie_id)
+    if start is not None:
+        q = q.filter(models.SalesBucket.bucket_start >= start)
+    if end is not None:
+        q = q.filter(models.SalesBucket.bucket_start < end)
+    series = {}
+    for r in q.order_by(models.SalesBucket.bucket_start):
+        key = r.bucket_start.replace(hour=0) if bucket == "day" else r.bucket_start
+        b = series.setdefault(key, [0, 0.0])
+        b[0] += r.tickets
+        b[1] += r.revenue
+    return [{"bucket_start": k.isoformat(), "tickets_sold": n, "gmv": float(rev)} for k, (n, rev) in series.items()]
+
+
+# ---------- Rebuild / reconcile ----------
+def rebuild(db: Session, chunk: int = 5000):
+    """
+    Recompute every rollup from shows, seats and bookings, backfilling missing booking
+    prices with the movie's current price. Returns how many show/movie rows changed.
+    """
+    before_shows = {r.show_id: (r.tickets, round(r.revenue, 2)) for r in db.query(models.ShowSales)}
+    before_movies = {r.movie_id: (r.tickets, round(r.revenue, 2)) for r in db.query(models.MovieSales)}
+
+    price_of_show = (
+        db.query(models.Movie.price)
+        .join(models.Show, models.Show.movie_id == models.Movie.id)
+        .filter(models.Show.id == models.Booking.show_id)
+        .scalar_subquery()
+    )
+    db.query(models.Booking).filter(models.Booking.price.is_(None)).update(
+        {"price": price_of_show}, synchronize_session=False
+    )
+
+    capacity = dict(db.query(models.Seat.hall_id, func.count(models.Seat.id)).group_by(models.Seat.hall_id).all())
+    shows = {}
+    for s in db.query(models.Show.id, models.Show.movie_id, models.Show.hall_id):
+        shows[s.id] = {"show_id": s.id, "movie_id": s.movie_id, "hall_id": s.hall_id,
+                       "capacity": capacity.get(s.hall_id, 0), "tickets": 0, "revenue": 0.0}
+    buckets, archived = {}, {}
+    # archived bookings (archive.py) still count in every rollup; movie_sales_archive tracks their share
+    result = db.execute(
+        select(models.Booking.show_id, models.Booking.price, models.Booking.created_at, literal(False))
+        .union_all(select(models.ArchivedBooking.show_id, models.ArchivedBooking.price,
+                          models.ArchivedBooking.created_at, literal(True)))
+        .execution_options(yield_per=chunk)
+    )
+    for show_id, price, at, is_archived in result:
+        s = shows.get(show_id)
+        if s is None:
+            continue
+        s["tickets"] += 1
+        s["revenue"] += price or 0.0
+        if is_archived:
+            a = archived.setdefault(s["movie_id"], {"movie_id": s["movie_id"], "tickets": 0, "revenue": 0.0})
+            a["tickets"] += 1
+            a["revenue"] += price or 0.0
+        if at is not None:
+            b = buckets.setdefault((s["movie_id"], hour_bucket(at)), [0, 0.0])
+            b[0] += 1
+            b[1] += price or 0.0
+
+    movies, halls = {}, {}
+    for s in shows.values():
+        m = movies.setdefault(s["movie_id"], {"movie_id": s["movie_id"], "tickets": 0, "revenue": 0.0})
+        m["tickets"] += s["tickets"]
+        m["revenue"] += s["revenue"]
+        h = halls.setdefault(s["hall_id"], {"hall_id": s["hall_id"], "capacity": 0, "tickets": 0})
+        h["capacity"] += s["capacity"]
+        h["tickets"] += s["tickets"]
+
+    for model in (models.ShowSales, models.MovieSales, models.HallSales, models.SalesBucket, models.ArchivedMovieSales):
+        db.execute(delete(model))
+    for model, rows in (
+        (models.ShowSales, list(shows.values())),
+        (models.ArchivedMovieSales, [a for a in archived.values() if a["movie_id"] is not None]),
+        (models.MovieSales, [m for m in movies.values() if m["movie_id"] is not None]),
+        (models.HallSales, [h for h in halls.values() if h["hall_id"] is not None]),
+        (models.SalesBucket, [{"movie_id": k[0], "bucket_start": k[1], "tickets": v[0], "revenue": v[1]}
+                              for k, v in buckets.items() if k[0] is not None]),
+    ):
+        if rows:
+            db.execute(model.__table__.insert(), rows)
+    db.commit()
+
+    shows_fixed = sum(1 for k, s in shows.items() if before_shows.get(k) != (s["tickets"], round(s["revenue"], 2)))
+    movies_fixed = sum(1 for k, m in movies.items() if before_movies.get(k) != (m["tickets"], round(m["revenue"], 2)))
+    return {"shows": len(shows), "movies": len(movies), "shows_fixed": shows_fixed, "movies_fixed": movies_fixed}
+
+
+def backfill(db: Session):
+    """
+    Fill the rollups once for a database that already had shows before they existed.
+    """
+    if db.query(models.Show.id).first() and not db.query(models.ShowSales.show_id).first():
+        return rebuild(db)
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+    from database import SessionLocal
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python analytics.py rebuild")
+    db = SessionLocal()
+    try:
+        print(rebuild(db))
+    finally:
+        db.close()
@@ -0,0 +1,152 @@
+"""
+Move bookings of past shows out of the hot bookings table.
+
+    python archive.py move --before 2026-01-01 [--batch 10000] [--jsonl archive.jsonl.gz]
+    python archive.py status
+
+`move` takes shows that started before the cutoff (which may not be in the
+future) and moves their bookings to bookings_archive. It works in batches of
+about `--batch` bookings, whole shows at a time. Each batch is one
+transaction: DELETE ... RETURNING, insert into the archive, archive rollup.
+An interrupted run leaves every batch either fully moved or untouched, so
+running it again simply continues.
+With --jsonl, each batch is also appended to a gzip'd JSON-lines file, one
+booking per line, as a cold copy that lives outside the database. A batch
+whose commit fails may already be in the file; the booking id identifies
+duplicates.
+
+Shows stay in place, so seat maps, search, rollups and the booking history
+joins keep working. Archived seats still count as booked (seatmap.load reads
+both tables), so they can't be sold again. The rollups keep counting archived
+bookings, and movie_sales_archive records their share.
+crud.bookings_for_user and crud.movie_analytics only include archived
+bookings when asked to (include_archived=True).
+
+Archived rows keep their booking id. Booking ids are never reused (the bookings
+table is AUTOINCREMENT on SQLite, see migration 10), so an archived id can't
+come back as a live booking.
+"""
+import gzip
+import json
+from datetime import datetime, timezone
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.orm import Session
+import models, analytics
+
+ARCHIVE_BATCH = 10000
+
+
+def _candidates(db: Session, before: datetime):
+    """
+    (show_id, movie_id, movie price, live ticket count) for past shows that still have live bookings.
+    """
+    return db.execute(
+        select(models.Show.id, models.Show.movie_id, models.Movie.price, models.ShowSales.tickets)
+        .join(models.Movie, models.Movie.id == models.Show.movie_id, isouter=True)
+        .join(models.ShowSales, models.ShowSales.show_id == models.Show.id, isouter=True)
+        .where(models.Show.start_time < before)
+        .where(exists().where(models.Booking.show_id == models.Show.id))
+        .order_by(models.Show.start_time, models.Show.id)
+    ).all()
+
+
+def move_batch(db: Session, shows, jsonl=None):
+    """
+    Move every booking of `shows` (candidate rows) in one transaction. Returns the count.
+    """
+    show_ids = [s.id for s in shows]
+    movie = {s.id: (s.movie_id, s.price) for s in shows}
+    B = models.Booking
+    # the DELETE's RETURNING rows are what gets archived, so a concurrent cancellation can't end up in both
+    rows = db.execute(
+        delete(B).where(B.show_id.in_(show_ids))
+        .returning(B.id, B.user_id, B.show_id, B.seat_id, B.price, B.created_at)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0
+    now = datetime.utcnow()
+    archived, totals = [], {}
+    for r in rows:
+        movie_id, current_price = movie[r.show_id]
+        price = r.price if r.price is not None else current_price  # booked before prices were recorded
+        archived.append({"id": r.id, "user_id": r.user_id, "show_id": r.show_id, "seat_id": r.seat_id,
+                         "price": price, "created_at": r.created_at, "archived_at": now})
+        t = totals.setdefault(movie_id, [0, 0.0])
+        t[0] += 1
+        t[1] += price or 0.0
+    db.execute(models.ArchivedBooking.__table__.insert(), archived)
+    analytics.record_archived(db, {m: tuple(t) for m, t in totals.items() if m is not None})
+    if jsonl is not None:
+        jsonl.write("".join(json.dumps(a, default=datetime.isoformat) + "\n" for a in archived).encode())
+        jsonl.flush()
+    db.commit()
+    return len(archived)
+
+
+def move(db: Session, before: datetime, batch: int = ARCHIVE_BATCH, jsonl_path: str = None, progress=None):
+    """
+    Archive the bookings of every show that started before `before`. Returns {"shows": n, "bookings": n}.
+    A naive `before` is taken as UTC; an aware one is converted (start times are stored as naive UTC).
+    """
+    if before.tzinfo is not None:
+        before = before.astimezone(timezone.utc).replace(tzinfo=None)
+    if before > datetime.utcnow():
+        raise ValueError("cutoff is in the future: only bookings of past shows can be archived")
+    candidates = _candidates(db, before)
+    moved = shows = 0
+    jsonl = gzip.open(jsonl_path, "ab") if jsonl_path else None  # gzip members append cleanly
+    try:
+        group, size = [], 0
+        for s in candidates:
+            group.append(s)
+            size += s.tickets or 1
+            if size >= batch:
+                moved += move_batch(db, group, jsonl)
+                shows += len(group)
+                group, size = [], 0
+                if progress:
+                    progress(shows, moved)
+        if group:
+            moved += move_batch(db, group, jsonl)
+            shows += len(group)
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+    return {"shows": shows, "bookings": moved}
+
+
+def status(db: Session):
+    return {
+        "live_bookings": db.execute(select(func.count(models.Booking.id))).scalar(),
+        "archived_bookings": db.execute(select(func.count(models.ArchivedBooking.id))).scalar(),
+        "oldest_live_show": db.execute(
+            select(func.min(models.Show.start_time)).where(exists().where(models.Booking.show_id == models.Show.id))
+        ).scalar(),
+    }
+
+
+if __name__ == "__main__":
+    import argparse, time
+    from database import SessionLocal, engine
+    import migrations
+    ap = argparse.ArgumentParser(description="Archive bookings of past shows")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mv = sub.add_parser("move")
+    mv.add_argument("--before", type=datetime.fromisoformat, required=True, help="archive shows that started before this (ISO, UTC)")
+    mv.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="bookings per transaction (whole shows)")
+    mv.add_argument("--jsonl", help="also append archived rows to this .jsonl.gz file")
+    sub.add_parser("status")
+    args = ap.parse_args()
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    try:
+        if args.cmd == "status":
+            print(status(db))
+        else:
+            t0 = time.perf_counter()
+            res = move(db, args.before, args.batch, args.jsonl,
+                       progress=lambda shows, n: print(f"  {shows} shows, {n} bookings moved"))
+            print(res, f"in {time.perf_counter() - t0:.1f}s")
+    finally:
+        db.close()
@@ -0,0 +1,84 @@
+"""
+Group booking throughput: legacy commit-per-seat loop vs. single-statement bulk insert.
+
+    python benchmarks/bulk_booking.py [--shows 5] [--size 10]
+
+Runs against a throwaway SQLite file so fsync costs are real.
+"""
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+import crud, models, schemas, seatmap
+from database import Base
+
+
+def legacy_book_specific_seats(db, user_id, show_id, seat_ids):
+    # the pre-bulk implementation: one commit + refresh per seat
+    success, failed = [], []
+    for sid in seat_ids:
+        b = models.Booking(user_id=user_id, show_id=show_id, seat_id=sid)
+        db.add(b)
+        try:
+            db.commit()
+            db.refresh(b)
+            success.append(b)
+        except IntegrityError:
+            db.rollback()
+            failed.append(sid)
+    return {"success": success, "failed": failed}
+
+
+def legacy_cancel(db, booking_ids):
+    for bid in booking_ids:
+        b = db.query(models.Booking).filter(models.Booking.id == bid).first()
+        if b:
+            db.delete(b)
+            db.commit()
+
+
+def setup(path, num_shows, seats_per_row):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    m = crud.create_movie(db, schemas.MovieCreate(title="Bench", price=10))
+    t = crud.create_theater(db, schemas.TheaterCreate(name="Bench"))
+    h = crud.create_hall(db, schemas.HallCreate(name="H", theater_id=t.id), num_rows=10, seats_per_row=seats_per_row)
+    u = crud.create_user(db, schemas.UserCreate(name="B", email="b@x"))
+    shows = [crud.create_show(db, schemas.ShowCreate(time="12:00", movie_id=m.id, hall_id=h.id)).id for _ in range(num_shows)]
+    seat_ids = [s.id for s in crud.list_seats_by_hall(db, h.id)]
+    return db, u.id, shows, seat_ids
+
+
+def run(label, db, book, cancel, user_id, shows, seat_ids, size):
+    groups = [(show, seat_ids[i:i + size]) for show in shows for i in range(0, len(seat_ids) - size + 1, size)]
+    t0 = time.perf_counter()
+    ids = []
+    for show, group in groups:
+        ids.extend(b.id for b in book(db, user_id, show, group)["success"])
+    t1 = time.perf_counter()
+    cancel(db, ids)
+    t2 = time.perf_counter()
+    n = len(groups)
+    print(f"{label:8s} book: {n / (t1 - t0):9.1f} groups/s ({len(ids) / (t1 - t0):9.1f} seats/s)   cancel: {len(ids) / (t2 - t1):9.1f} bookings/s")
+    db.execute(delete(models.Booking))
+    db.commit()
+    seatmap.invalidate()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shows", type=int, default=5)
+    ap.add_argument("--size", type=int, default=10)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        db, user_id, shows, seat_ids = setup(os.path.join(d, "bench.db"), args.shows, args.size * 2)
+        run("legacy", db, legacy_book_specific_seats, legacy_cancel, user_id, shows, seat_ids, args.size)
+        run("bulk", db, lambda *a: crud.book_specific_seats(*a, all_or_nothing=True), crud.cancel_bookings, user_id, shows, seat_ids, args.size)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Booking throughput per engine profile with several concurrent worker processes.
+
+    python benchmarks/db_profiles.py [--workers 4] [--seconds 5] [--url postgresql://...]
+
+Without --url each SQLite profile ("default" = stock settings, "tuned" = WAL,
+synchronous=NORMAL, mmap, busy_timeout) gets a fresh throwaway file. With --url
+the given database is used with its own profile (tables are created if missing,
+and the bench rows are left behind).
+"""
+import argparse, multiprocessing as mp, os, random, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+import crud, schemas
+from database import Base, make_engine
+
+
+def setup(url, profile, num_shows):
+    eng = make_engine(url, profile)
+    Base.metadata.create_all(bind=eng)
+    db = sessionmaker(bind=eng)()
+    tag = str(time.time_ns())
+    m = crud.create_movie(db, schemas.MovieCreate(title=f"Bench {tag}", price=10))
+    t = crud.create_theater(db, schemas.TheaterCreate(name=f"Bench {tag}"))
+    h = crud.create_hall(db, schemas.HallCreate(name="H", theater_id=t.id), num_rows=20, seats_per_row=25)
+    u = crud.create_user(db, schemas.UserCreate(name="B", email=f"b{tag}@x"))
+    shows = [crud.create_show(db, schemas.ShowCreate(time="12:00", movie_id=m.id, hall_id=h.id)).id for _ in range(num_shows)]
+    seats = [s.id for s in crud.list_seats_by_hall(db, h.id)]
+    user_id = u.id
+    db.close()
+    eng.dispose()
+    return user_id, shows, seats
+
+
+def worker(url, profile, user_id, shows, seats, seconds, seed, out):
+    eng = make_engine(url, profile)
+    Session = sessionmaker(bind=eng, autoflush=False)
+    rnd = random.Random(seed)
+    booked = conflicts = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        db = Session()
+        try:
+            res = crud.create_booking(db, schemas.BookingCreate(user_id=user_id, show_id=rnd.choice(shows), seat_id=rnd.choice(seats)))
+            if isinstance(res, dict):
+                conflicts += 1
+            else:
+                booked += 1
+        except OperationalError:
+            # "database is locked" when a worker gives up waiting for the write lock
+            db.rollback()
+            errors += 1
+        finally:
+            db.close()
+    out.put((booked, conflicts, errors))
+
+
+def run(url, profile, workers, seconds):
+    user_id, shows, seats = setup(url, profile, num_shows=50)
+    out = mp.Queue()
+    procs = [mp.Process(target=worker, args=(url, profile, user_id, shows, seats, seconds, i, out)) for i in range(workers)]
+    for p in procs:
+        p.start()
+    totals = [0, 0, 0]
+    for _ in procs:
+        for i, v in enumerate(out.get()):
+            totals[i] += v
+    for p in procs:
+        p.join()
+    booked, conflicts, errors = totals
+    print(f"{profile:8s} {workers} workers: {booked / seconds:8.1f} bookings/s  ({conflicts} conflicts, {errors} lock errors)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--url")
+    args = ap.parse_args()
+    if args.url:
+        run(args.url, "tuned", args.workers, args.seconds)
+        return
+    with tempfile.TemporaryDirectory() as d:
+        for profile in ("default", "tuned"):
+            run(f"sqlite:///{os.path.join(d, profile + '.db')}", profile, args.workers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
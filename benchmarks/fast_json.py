@@ -0,0 +1,71 @@
+"""
+Default (response_model validation + jsonable_encoder) vs. fast JSON path (FAST_JSON,
+see fastjson.py) for the large read endpoints, through main.app in-process.
+
+    python benchmarks/fast_json.py [--seats 5000] [--occupancy 0.3] [--iterations 200]
+
+Seeds one hall of --seats seats with a few shows at --occupancy (seed.py), then times
+GET /available_seats/{show}, /bookings/?limit=1000 and /seats/{hall} on both paths and
+checks that the two bodies decode to the same JSON. /seats is a cached endpoint, so
+the cache is cleared before every request to time the miss (serialization) path.
+"""
+import argparse, asyncio, json, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'fast_json.db')}"
+os.environ["FAST_JSON"] = "1"  # so main verifies the fast endpoints at import; toggled per run below
+
+import httpx
+import cache, fastjson, seed
+from database import SessionLocal
+import main
+
+
+async def timed(client, url, iterations, clear_cache):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        if clear_cache:
+            cache.responses.clear()
+        r = await client.get(url)
+    assert r.status_code == 200, (url, r.status_code)
+    return r.content, (time.perf_counter() - t0) / iterations * 1e6
+
+
+async def run(iterations, show_id=1, hall_id=1):
+    print(f"{'endpoint':28s} {'rows':>6s} {'bytes':>8s} {'default us':>11s} {'fast us':>9s} {'speedup':>8s}  same")
+    ok = True
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        for label, url, clear in (
+            ("/available_seats/{show}", f"/available_seats/{show_id}", False),
+            ("/bookings/?limit=1000", "/bookings/?limit=1000", False),
+            ("/seats/{hall} (cache miss)", f"/seats/{hall_id}", True),
+        ):
+            fastjson.FAST_JSON = False
+            slow_body, slow_us = await timed(client, url, iterations, clear)
+            fastjson.FAST_JSON = True
+            fast_body, fast_us = await timed(client, url, iterations, clear)
+            same = json.loads(slow_body) == json.loads(fast_body)
+            ok &= same
+            print(f"{label:28s} {len(json.loads(fast_body)):6d} {len(fast_body):8d} {slow_us:11.0f} {fast_us:9.0f} "
+                  f"{slow_us / fast_us:7.1f}x  {'yes' if same else 'NO'}")
+    return ok
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seats", type=int, default=5000)
+    ap.add_argument("--occupancy", type=float, default=0.3)
+    ap.add_argument("--iterations", type=int, default=200)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    seed.generate(db, movies=1, theaters=1, halls=1, seats=args.seats, shows=2, users=500, occupancy=args.occupancy)
+    db.close()
+    print(f"encoder: {'orjson' if fastjson.orjson else 'json'}; fast path verified for: {', '.join(sorted(fastjson._verified))}")
+    # one event loop for every run: the async engine's pool is bound to the loop that first used it
+    sys.exit(0 if asyncio.run(run(args.iterations)) else 1)
+
+
+if __name__ == "__main__":
+    main_()
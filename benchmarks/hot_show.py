@@ -0,0 +1,90 @@
+"""
+Bookings/sec on a single hot show: the regular per-request transaction path vs.
+the per-show booking queue (booking_queue.py, BOOKING_QUEUE=1).
+
+    python benchmarks/hot_show.py [--clients 500] [--requests 4000] [--rows 40 --seats 50]
+
+Each path gets its own fresh show in the same hall. Clients POST /bookings/ for
+random seats (so a growing share of requests conflict as the show fills) through
+main.app in-process. Reported: accepted bookings/sec, requests/sec, conflicts,
+p50/p99 and, for the queue, the number of commits (batches).
+"""
+import argparse, asyncio, os, random, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'hot_show.db')}"
+
+import httpx
+from sqlalchemy import func, select
+import booking_queue, crud, models, schemas
+from database import SessionLocal
+import main
+
+
+def seed(rows, seats, users):
+    db = SessionLocal()
+    m = crud.create_movie(db, schemas.MovieCreate(title="Hot", price=12))
+    t = crud.create_theater(db, schemas.TheaterCreate(name="Hot"))
+    h = crud.create_hall(db, schemas.HallCreate(name="IMAX", theater_id=t.id, rows=rows, seats_per_row=seats))
+    user_ids = [crud.create_user(db, schemas.UserCreate(name=f"u{i}", email=f"u{i}@hot.example")).id for i in range(users)]
+    seat_ids = [s.id for s in crud.list_seats_by_hall(db, h.id)]
+    shows = [crud.create_show(db, schemas.ShowCreate(time=f"{18 + i}:00", movie_id=m.id, hall_id=h.id)).id for i in range(2)]
+    db.close()
+    return user_ids, seat_ids, shows
+
+
+async def hammer(show_id, user_ids, seat_ids, clients, requests, seed=5):
+    rnd = random.Random(seed)
+    jobs = [{"user_id": rnd.choice(user_ids), "show_id": show_id, "seat_id": rnd.choice(seat_ids)} for _ in range(requests)]
+    sem = asyncio.Semaphore(clients)
+    latencies, status = [], {}
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", limits=limits, timeout=None) as client:
+        async def one(body):
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/bookings/", json=body)
+                latencies.append(time.perf_counter() - t0)
+                status[r.status_code] = status.get(r.status_code, 0) + 1
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(j) for j in jobs))
+        elapsed = time.perf_counter() - t0
+    q = statistics.quantiles(latencies, n=100)
+    return elapsed, status, q[49] * 1000, q[98] * 1000
+
+
+def booked(show_id):
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count(models.Booking.id), func.count(func.distinct(models.Booking.seat_id)))
+                          .where(models.Booking.show_id == show_id)).one()
+    finally:
+        db.close()
+
+
+async def run(args):
+    user_ids, seat_ids, shows = seed(args.rows, args.seats, 200)
+    print(f"hall of {len(seat_ids)} seats, {args.requests} booking requests, {args.clients} concurrent clients\n")
+    for label, enabled, show_id in (("direct", False, shows[0]), ("queue", True, shows[1])):
+        booking_queue.ENABLED = enabled
+        elapsed, status, p50, p99 = await hammer(show_id, user_ids, seat_ids, args.clients, args.requests)
+        n, distinct = booked(show_id)
+        batches = sum(w.batches for reg in booking_queue._workers.values() for w in reg.values()) if enabled else n
+        print(f"{label:7s} {n / elapsed:8.1f} bookings/s {args.requests / elapsed:8.1f} req/s  "
+              f"accepted {status.get(200, 0):5d} conflicts {status.get(400, 0):5d} errors {sum(v for k, v in status.items() if k >= 500):3d}  "
+              f"p50 {p50:7.1f} ms p99 {p99:7.1f} ms  commits {batches}  {'OK' if n == distinct == status.get(200, 0) else 'MISMATCH'}")
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=500)
+    ap.add_argument("--requests", type=int, default=4000)
+    ap.add_argument("--rows", type=int, default=40)
+    ap.add_argument("--seats", type=int, default=50)
+    args = ap.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,105 @@
+"""
+Latency under concurrency: async routes (main.app) vs. the old sync-def routes.
+
+    python benchmarks/load_latency.py [--concurrency 1000] [--requests 5000]
+
+Both apps are driven in-process through httpx's ASGI transport against the same
+throwaway SQLite file. The sync app mirrors the pre-async route shape (sync
+`def` + database.get_db), so its handlers queue on FastAPI's threadpool.
+"""
+import argparse, asyncio, os, random, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy.orm import Session
+import crud, schemas
+from database import SessionLocal, get_db
+import main
+
+
+def sync_app():
+    app = FastAPI()
+
+    @app.get("/available_seats/{show_id}")
+    def available_seats(show_id: int, db: Session = Depends(get_db)):
+        avail = crud.available_seats_for_show(db, show_id)
+        if avail is None:
+            raise HTTPException(status_code=404, detail="Show not found")
+        return [{"seat_id": s.id, "seat": f"{s.row}{s.number}"} for s in avail]
+
+    @app.get("/user_bookings/{user_id}")
+    def user_bookings(user_id: int, db: Session = Depends(get_db)):
+        return crud.bookings_for_user(db, user_id)
+
+    @app.post("/bookings/")
+    def create_booking(booking: schemas.BookingCreate, db: Session = Depends(get_db)):
+        res = crud.create_booking(db, booking)
+        if isinstance(res, dict):
+            raise HTTPException(status_code=400, detail=res["error"])
+        return {"id": res.id}
+
+    return app
+
+
+def seed(num_shows=20):
+    db = SessionLocal()
+    m = crud.create_movie(db, schemas.MovieCreate(title=f"Bench {time.time_ns()}", price=10))
+    t = crud.create_theater(db, schemas.TheaterCreate(name=f"Bench {time.time_ns()}"))
+    h = crud.create_hall(db, schemas.HallCreate(name="H", theater_id=t.id), num_rows=20, seats_per_row=20)
+    users = [crud.create_user(db, schemas.UserCreate(name="B", email=f"b{i}.{time.time_ns()}@x")).id for i in range(50)]
+    shows = [crud.create_show(db, schemas.ShowCreate(time="12:00", movie_id=m.id, hall_id=h.id)).id for _ in range(num_shows)]
+    seats = [s.id for s in crud.list_seats_by_hall(db, h.id)]
+    db.close()
+    return users, shows, seats
+
+
+def workload(rnd, users, shows, seats):
+    r = rnd.random()
+    if r < 0.6:
+        return "GET", f"/available_seats/{rnd.choice(shows)}", None
+    if r < 0.8:
+        return "GET", f"/user_bookings/{rnd.choice(users)}", None
+    return "POST", "/bookings/", {"user_id": rnd.choice(users), "show_id": rnd.choice(shows), "seat_id": rnd.choice(seats)}
+
+
+async def drive(app, concurrency, total, users, shows, seats):
+    rnd = random.Random(7)
+    jobs = [workload(rnd, users, shows, seats) for _ in range(total)]
+    latencies = {"GET": [], "POST": []}
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", limits=limits) as client:
+        async def one(method, url, body):
+            async with sem:
+                t0 = time.perf_counter()
+                await client.request(method, url, json=body)
+                latencies[method].append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(*j) for j in jobs))
+        elapsed = time.perf_counter() - t0
+    return total / elapsed, {k: _p50_p99(v) for k, v in [("all", latencies["GET"] + latencies["POST"]), *latencies.items()]}
+
+
+def _p50_p99(latencies):
+    q = statistics.quantiles(latencies, n=100)
+    return q[49] * 1000, q[98] * 1000
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=1000)
+    ap.add_argument("--requests", type=int, default=5000)
+    args = ap.parse_args()
+    users, shows, seats = seed()
+    for label, app in (("sync", sync_app()), ("async", main.app)):
+        rps, q = asyncio.run(drive(app, args.concurrency, args.requests, users, shows, seats))
+        print(f"{label:6s} c={args.concurrency}: {rps:8.1f} req/s  " + "  ".join(
+            f"{kind} p50 {p50:7.1f} ms p99 {p99:7.1f} ms" for kind, (p50, p99) in q.items()))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,261 @@
+"""
+Multi-worker consistency check for the change-notification bus (bus.py).
+
+    python benchmarks/multiworker_consistency.py [--workers 4] [--seconds 5] [--seats 200] [--rounds 50]
+    python benchmarks/multiworker_consistency.py --no-bus     # same run with BUS=0, expected to fail
+
+Starts --workers processes, each importing main.app (its own seat maps, response cache and
+bus listener) on one shared SQLite file and driving it in-process through httpx's ASGI
+transport, the way separate uvicorn workers would. Phases, separated by barriers:
+
+1. churn: every worker books random seats, books pairs of consecutive seats and cancels its
+   own bookings on two shows for --seconds, with its seat maps warm from the start;
+2. convergence: each worker compares /available_seats for both shows with the bookings
+   table, and /movies/ after another worker created a movie, until they agree (or 2 s pass);
+3. propagation: --rounds times one worker books a seat and every other worker polls its own
+   /available_seats until the seat is gone. The time from the booking response to the seat
+   being gone is an upper bound: it includes the barrier hand-off, and most of the time the
+   seat is already gone when the other worker first looks;
+4. holds: worker 0 holds two seats, and right away every other worker tries to book them (one
+   single booking, one by seat ids), then waits for /available_seats to show them taken. Worker
+   1 releases the hold and every worker waits for the seats to come back;
+5. waitlist: worker 1 listens on a user's notification topic while worker 0 puts that user on
+   the waitlist of a show with free seats, which books them at once.
+
+Fails (exit status 1) if any worker never converges, books a held seat, or misses the hold, its
+release or the waitlist notification.
+"""
+import argparse, asyncio, multiprocessing, os, random, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# spawned workers re-run this module: they inherit the parent's database instead of making their own
+if "MW_DATABASE_URL" not in os.environ:
+    os.environ["MW_DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'multiworker.db')}"
+os.environ["DATABASE_URL"] = os.environ["MW_DATABASE_URL"]
+
+CONVERGE_TIMEOUT = 2.0
+SHOWS = (1, 2)
+
+
+def _truth(SessionLocal, models, show_id, hall_seats):
+    db = SessionLocal()
+    try:
+        booked = {r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == show_id)}
+    finally:
+        db.close()
+    return hall_seats - booked
+
+
+async def _available(client, show_id):
+    r = await client.get(f"/available_seats/{show_id}")
+    return {s["seat_id"] for s in r.json()}
+
+
+async def _until(check):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < CONVERGE_TIMEOUT:
+        if await check():
+            return True
+        await asyncio.sleep(0.001)
+    return False
+
+
+async def _worker(wid, n, seconds, rounds, barrier, shared, results):
+    import httpx
+    import models
+    from database import SessionLocal
+    import main
+
+    rnd = random.Random(wid)
+    out = {"worker": wid, "ops": 0, "booked": 0, "rejected": 0, "cancelled": 0, "latencies_ms": [], "write_ms": [], "first_look": 0,
+           "held_booked": 0, "hold_seen": True, "release_seen": True, "notified": True}
+    wait = lambda: barrier.wait()  # noqa: E731
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://worker") as c:
+        hall_seats = {s["id"] for s in (await c.get("/seats/1")).json()}
+        seat_list = sorted(hall_seats)
+        for show_id in SHOWS:
+            await _available(c, show_id)  # warm the seat maps
+            await asyncio.to_thread(_truth, SessionLocal, models, show_id, hall_seats)  # and the checker's connection
+        await c.get("/movies/")           # and the cached list
+        await asyncio.to_thread(wait)
+
+        # 1. churn
+        mine = []
+        stop = time.monotonic() + seconds
+        while time.monotonic() < stop:
+            show_id, user_id, op = rnd.choice(SHOWS), rnd.randint(1, 50), rnd.random()
+            if op < 0.3 and mine:
+                r = await c.delete(f"/bookings/{mine.pop(rnd.randrange(len(mine)))}")
+                out["cancelled"] += r.status_code == 200
+            elif op < 0.45:
+                r = await c.post("/book_group/", json={"user_id": user_id, "show_id": show_id, "num_seats": 2})
+                if "bookings" in r.json():  # no consecutive pair: 200 with "error" and suggestions
+                    mine += [b["id"] for b in r.json()["bookings"]]
+                    out["booked"] += 2
+                else:
+                    out["rejected"] += 1
+            else:
+                r = await c.post("/bookings/", json={"user_id": user_id, "show_id": show_id, "seat_id": rnd.choice(seat_list)})
+                if r.status_code == 200:
+                    mine.append(r.json()["id"])
+                    out["booked"] += 1
+                else:
+                    out["rejected"] += 1
+            out["ops"] += 1
+        if wid == 0:
+            r = await c.post("/movies/", json={"title": "Bus check", "price": 9.0})
+            shared["movie_id"] = r.json()["id"]
+        await asyncio.to_thread(wait)
+
+        # 2. convergence
+        t0 = time.perf_counter()
+        converged = False
+        while time.perf_counter() - t0 < CONVERGE_TIMEOUT:
+            truth = [await asyncio.to_thread(_truth, SessionLocal, models, s, hall_seats) for s in SHOWS]
+            seen = [await _available(c, s) for s in SHOWS]
+            movies = {m["id"] for m in (await c.get("/movies/")).json()}
+            if seen == truth and shared["movie_id"] in movies:
+                converged = True
+                break
+            await asyncio.sleep(0.001)
+        out["converged"] = converged
+        out["converge_ms"] = (time.perf_counter() - t0) * 1000
+        out["mismatched_seats"] = sum(len(a ^ b) for a, b in zip(seen, truth))
+        await asyncio.to_thread(wait)
+
+        # 3. propagation: the writer rotates; wall-clock timestamps are shared between processes
+        for rnd_no in range(rounds):
+            writer = rnd_no % n
+            if wid == writer:
+                free = sorted(await _available(c, SHOWS[0]))
+                if free:
+                    seat = rnd.choice(free)
+                    t0 = time.time()
+                    r = await c.post("/bookings/", json={"user_id": 1, "show_id": SHOWS[0], "seat_id": seat})
+                    shared["t0"] = time.time()
+                    out["write_ms"].append((shared["t0"] - t0) * 1000)
+                    shared["seat"] = seat if r.status_code == 200 else None
+                else:
+                    shared["seat"] = None
+            await asyncio.to_thread(wait)
+            seat = shared["seat"]
+            if wid != writer and seat is not None:
+                t0, first = shared["t0"], True
+                while seat in await _available(c, SHOWS[0]) and time.time() - t0 < CONVERGE_TIMEOUT:
+                    first = False
+                    await asyncio.sleep(0.0002)
+                out["latencies_ms"].append((time.time() - t0) * 1000)
+                out["first_look"] += first
+            await asyncio.to_thread(wait)
+
+        # 4. holds taken in one worker, booked / shown / released in the others
+        show_id = SHOWS[1]
+        if wid == 0:
+            seats = sorted(await _available(c, show_id))[:2]
+            r = await c.post("/holds/", json={"user_id": 1, "show_id": show_id, "seat_ids": seats})
+            shared["hold"] = r.json()["hold_id"] if r.status_code == 200 else None
+            shared["held"] = seats
+        await asyncio.to_thread(wait)
+        hold, held = shared["hold"], set(shared["held"])
+        if hold is None:
+            out["hold_seen"] = False
+        elif wid != 0:
+            # no waiting for this worker's listener: bookings check seat_holds themselves
+            a, b = sorted(held)
+            r = await c.post("/bookings/", json={"user_id": 2, "show_id": show_id, "seat_id": a})
+            out["held_booked"] += r.status_code == 200
+            r = await c.post("/book_group_seats/", json={"user_id": 2, "show_id": show_id, "seat_ids": [b]})
+            out["held_booked"] += r.json().get("success_count", 0)
+
+            async def taken():
+                return not held & await _available(c, show_id)
+            out["hold_seen"] = await _until(taken)
+        await asyncio.to_thread(wait)
+        if hold is not None:
+            if wid == 1 % n:
+                r = await c.delete(f"/holds/{hold}")
+                out["release_seen"] = r.status_code == 200
+            await asyncio.to_thread(wait)
+
+            async def back():
+                return held <= await _available(c, show_id)
+            out["release_seen"] = out["release_seen"] and await _until(back)
+        await asyncio.to_thread(wait)
+
+        # 5. a waitlist entry fulfilled in worker 0 notifies the user's stream in worker 1
+        user_id = 50
+        sub = main.broker.subscribe(("user", user_id)) if wid == 1 % n else None
+        await asyncio.to_thread(wait)
+        if wid == 0:
+            await c.post("/waitlist/", json={"user_id": user_id, "show_id": show_id, "num_seats": 1})
+        if sub is not None:
+            try:
+                ev = await asyncio.wait_for(sub.get(), CONVERGE_TIMEOUT)
+                out["notified"] = ev.get("type") == "waitlist_fulfilled"
+            except asyncio.TimeoutError:
+                out["notified"] = False
+            main.broker.unsubscribe(sub)
+        await asyncio.to_thread(wait)
+    out["bus"] = main.bus.metrics()
+    results.put(out)
+
+
+def _run_worker(*args):
+    asyncio.run(_worker(*args))
+
+
+def _pct(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--seats", type=int, default=200)
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("--no-bus", action="store_true", help="run with BUS=0 to see the stale state it prevents")
+    args = ap.parse_args()
+    if args.no_bus:
+        os.environ["BUS"] = "0"
+
+    import migrations, seed
+    from database import SessionLocal, engine
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    seed.generate(db, movies=1, theaters=1, halls=1, seats=args.seats, shows=len(SHOWS), users=50)
+    db.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        barrier, shared, results = ctx.Barrier(args.workers), manager.dict(movie_id=None), ctx.Queue()
+        procs = [ctx.Process(target=_run_worker, args=(w, args.workers, args.seconds, args.rounds, barrier, shared, results))
+                 for w in range(args.workers)]
+        for p in procs:
+            p.start()
+        outs = sorted((results.get() for _ in procs), key=lambda o: o["worker"])
+        for p in procs:
+            p.join()
+
+    print(f"{args.workers} workers, bus {'off' if args.no_bus else 'on'}, {args.seconds:g}s churn on {len(SHOWS)} shows of {args.seats} seats")
+    print(f"{'worker':>6s} {'ops':>6s} {'booked':>7s} {'rejected':>9s} {'cancelled':>10s} {'events':>7s} {'converged':>10s} {'after ms':>9s} {'diff':>5s}")
+    for o in outs:
+        print(f"{o['worker']:6d} {o['ops']:6d} {o['booked']:7d} {o['rejected']:9d} {o['cancelled']:10d} {o['bus']['applied']:7d} "
+              f"{'yes' if o['converged'] else 'NO':>10s} {o['converge_ms']:9.1f} {o['mismatched_seats']:5d}")
+    lat = [v for o in outs for v in o["latencies_ms"]]
+    writes = [v for o in outs for v in o["write_ms"]]
+    if lat:
+        print(f"booking request: p50 {statistics.median(writes):.1f} ms; seat gone in another worker after the response: "
+              f"p50 {statistics.median(lat):.1f} ms, p99 {_pct(lat, 0.99):.1f} ms, max {max(lat):.1f} ms; "
+              f"already gone at the first look in {sum(o['first_look'] for o in outs)} of {len(lat)}")
+    print(f"holds: held seats booked in other workers {sum(o['held_booked'] for o in outs)}, "
+          f"hold seen everywhere: {'yes' if all(o['hold_seen'] for o in outs) else 'NO'}, "
+          f"release seen everywhere: {'yes' if all(o['release_seen'] for o in outs) else 'NO'}; "
+          f"waitlist notification relayed: {'yes' if all(o['notified'] for o in outs) else 'NO'}")
+    ok = all(o["converged"] and o["hold_seen"] and o["release_seen"] and o["notified"] and not o["held_booked"] for o in outs)
+    print("consistency OK" if ok else "consistency FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_()
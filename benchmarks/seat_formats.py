@@ -0,0 +1,71 @@
+"""
+Seat layout payloads: current JSON (layout dict + ASCII, available-seat list) vs. the
+packed bitset / binary formats, raw and compressed.
+
+    python benchmarks/seat_formats.py [--layout imax|grid] [--occupancy 0.6] [--iterations 2000]
+
+Works on an in-memory SeatMap (no DB), so it measures serialization only.
+"""
+import argparse, gzip, json, os, random, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import provisioning, seatmap
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 400-seat IMAX-style hall: 16 rows of 26 positions with two aisles, wheelchair row at the back
+IMAX = "/".join(["SSSSS.SSSSSSSSSSSSSS.SSSSS"] * 15 + ["AAAAA.SSSSSSSSSSSSSS.AAAAA"])
+
+
+def build(layout: str, occupancy: float, held: float, seed: int = 7):
+    seats = provisioning.hall_seats(layout=layout)
+    hall = seatmap.HallIndex(1, [(i + 1, row, n) for i, (row, n, _) in enumerate(seats)])
+    rnd = random.Random(seed)
+    ids = list(hall.pos)
+    booked = rnd.sample(ids, int(len(ids) * occupancy))
+    rest = [sid for sid in ids if sid not in set(booked)]
+    return seatmap.SeatMap(1, hall, booked), set(rnd.sample(rest, int(len(ids) * held))), len(ids)
+
+
+def timed(fn, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        out = fn()
+    return out, (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--layout", choices=["imax", "grid"], default="imax")
+    ap.add_argument("--occupancy", type=float, default=0.6)
+    ap.add_argument("--held", type=float, default=0.05)
+    ap.add_argument("--iterations", type=int, default=2000)
+    args = ap.parse_args()
+
+    layout = IMAX if args.layout == "imax" else "/".join(["S" * 20] * 20)
+    sm, held, n = build(layout, args.occupancy, args.held)
+    dumps = lambda o: json.dumps(o).encode()
+    cases = [
+        ("layout json (current)", lambda: dumps(sm.layout(held=held))),
+        ("layout bitset", lambda: dumps(seatmap.encode_bitset(*sm.planes("layout", held)))),
+        ("layout binary", lambda: seatmap.encode_binary(*sm.planes("layout", held))),
+        ("available json (current)", lambda: dumps([{"seat_id": s.id, "seat": f"{s.row}{s.number}"} for s in sm.available(held=held)])),
+        ("available bitset", lambda: dumps(seatmap.encode_bitset(*sm.planes("available", held)))),
+        ("available binary", lambda: seatmap.encode_binary(*sm.planes("available", held))),
+    ]
+    print(f"{n} seats, {args.occupancy:.0%} booked, {args.held:.0%} held, {args.iterations} iterations\n")
+    cols = f"{'format':26s} {'bytes':>8s} {'gzip':>7s} {'br':>7s} {'encode us':>10s} {'+gzip us':>9s}"
+    print(cols)
+    print("-" * len(cols))
+    for name, fn in cases:
+        body, us = timed(fn, args.iterations)
+        gz, gz_us = timed(lambda: gzip.compress(body, compresslevel=6), max(1, args.iterations // 10))
+        br = len(brotli.compress(body)) if brotli else None
+        print(f"{name:26s} {len(body):8d} {len(gz):7d} {br if br is not None else '-':>7} {us:10.1f} {gz_us:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Mixed-workload benchmark for the booking hot paths, driven in-process through
+httpx's ASGI transport against main.app on a throwaway SQLite file.
+
+    python benchmarks/workload.py                        # seed + mixed workload + contention
+    python benchmarks/workload.py --scenario mixed --requests 20000 --concurrency 200
+    python benchmarks/workload.py --scenario contention --clients 500
+    python benchmarks/workload.py --replay traffic.ndjson
+
+Seeding: --theaters theaters x --halls halls of 100-500 seats (random layouts with
+aisles) and --shows shows per hall, plus users and ~20% pre-booked seats on a
+slice of the shows (bulk inserts, then analytics.rebuild).
+
+Reports per endpoint: request count, throughput, p50/p95/p99 latency, error count
+and DB statements per request (counted on both engines -- on SQLite crud_async runs the
+sync crud on database.engine in worker threads -- attributed with a contextvar set around
+each request). A run that counts no statements at all fails, since that means the counter
+isn't on the engine the requests actually use.
+
+The contention scenario has --clients clients racing for the same show: half
+book single random seats, half book groups of 2-6 consecutive seats. Afterwards
+it checks that no seat was sold twice and that the rollup agrees with the bookings.
+
+--replay takes NDJSON lines {"method": "GET", "path": "/available_seats/3", "json": null}
+(e.g. exported from an access log) and replays them with the same reporting.
+"""
+import argparse, asyncio, contextvars, json, os, random, statistics, sys, tempfile, time
+from collections import defaultdict
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'workload.db')}"
+
+import httpx
+from sqlalchemy import event, func, insert, select
+import analytics, models, provisioning
+from database import SessionLocal, async_engine, engine
+import main
+
+_endpoint = contextvars.ContextVar("endpoint", default=None)
+_queries = defaultdict(int)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    name = _endpoint.get()
+    if name is not None:
+        _queries[name] += 1
+
+
+# a statement runs on exactly one of the two, so listening on both doesn't double count
+event.listen(engine, "before_cursor_execute", _count_query)
+event.listen(async_engine.sync_engine, "before_cursor_execute", _count_query)
+
+
+# ---------- Seeding ----------
+def random_layout(rnd, min_seats=100, max_seats=500):
+    """
+    Rows of 10-30 positions with one or two aisles, sized to land in [min_seats, max_seats].
+    """
+    target = rnd.randint(min_seats, max_seats)
+    width = rnd.randint(10, 30)
+    aisles = sorted(rnd.sample(range(3, width - 3), rnd.choice((1, 2))))
+    row = "".join("." if i in aisles else "S" for i in range(width))
+    rows = max(1, round(target / row.count("S")))
+    return "/".join([row] * min(rows, provisioning.MAX_ROWS))
+
+
+def seed(theaters, halls, shows_per_hall, users, booked_shows, seed=7):
+    rnd = random.Random(seed)
+    db = SessionLocal()
+    t0 = time.perf_counter()
+    movies = db.execute(insert(models.Movie).returning(models.Movie.id), [
+        {"title": f"Movie {i}", "price": rnd.choice((8.0, 10.0, 12.5, 15.0))} for i in range(50)
+    ]).scalars().all()
+    user_ids = db.execute(insert(models.User).returning(models.User.id), [
+        {"name": f"user{i}", "email": f"user{i}@bench.example"} for i in range(users)
+    ]).scalars().all()
+    hall_seats = {}
+    show_ids = []
+    for t in range(theaters):
+        theater = models.Theater(name=f"Theater {t}")
+        db.add(theater)
+        db.flush()
+        for h in range(halls):
+            hall = models.Hall(name=f"Hall {h}", theater_id=theater.id)
+            db.add(hall)
+            db.flush()
+            provisioning.insert_seats(db, hall.id, provisioning.hall_seats(layout=random_layout(rnd)))
+            hall_seats[hall.id] = db.execute(select(models.Seat.id).where(models.Seat.hall_id == hall.id)).scalars().all()
+            show_ids += db.execute(insert(models.Show).returning(models.Show.id), [
+                {"time": f"{10 + s % 14:02d}:{(s * 15) % 60:02d}", "movie_id": rnd.choice(movies), "hall_id": hall.id}
+                for s in range(shows_per_hall)
+            ]).scalars().all()
+    show_hall = dict(db.execute(select(models.Show.id, models.Show.hall_id)).all())
+    bookings = []
+    for show_id in rnd.sample(show_ids, min(booked_shows, len(show_ids))):
+        seats = hall_seats[show_hall[show_id]]
+        for seat_id in rnd.sample(seats, len(seats) // 5):
+            bookings.append({"user_id": rnd.choice(user_ids), "show_id": show_id, "seat_id": seat_id})
+    if bookings:
+        db.execute(insert(models.Booking), bookings)
+    db.commit()
+    analytics.rebuild(db)  # rollups + booking prices for the pre-booked rows
+    db.close()
+    print(f"seeded {theaters * halls} halls, {len(show_ids)} shows, {sum(map(len, hall_seats.values()))} seats, "
+          f"{len(user_ids)} users, {len(bookings)} bookings in {time.perf_counter() - t0:.1f}s")
+    return {"movies": movies, "users": user_ids, "shows": show_ids, "show_hall": show_hall, "hall_seats": hall_seats}
+
+
+# ---------- Workloads ----------
+MIX = [
+    ("available_seats", 0.30),
+    ("seat_layout", 0.15),
+    ("user_bookings", 0.15),
+    ("create_booking", 0.20),
+    ("book_group", 0.10),
+    ("analytics", 0.10),
+]
+
+
+def mixed_job(rnd, data):
+    r = rnd.random()
+    for name, weight in MIX:
+        r -= weight
+        if r < 0:
+            break
+    show = rnd.choice(data["shows"])
+    user = rnd.choice(data["users"])
+    if name == "available_seats":
+        return name, "GET", f"/available_seats/{show}", None
+    if name == "seat_layout":
+        return name, "GET", f"/seat_layout/{show}", None
+    if name == "user_bookings":
+        return name, "GET", f"/user_bookings/{user}?limit=50", None
+    if name == "create_booking":
+        seat = rnd.choice(data["hall_seats"][data["show_hall"][show]])
+        return name, "POST", "/bookings/", {"user_id": user, "show_id": show, "seat_id": seat}
+    if name == "book_group":
+        return name, "POST", "/book_group/", {"user_id": user, "show_id": show, "num_seats": rnd.randint(2, 6)}
+    return name, "GET", rnd.choice(("/analytics/top_movies", f"/analytics/movie/{rnd.choice(data['movies'])}",
+                                     f"/analytics/show/{show}/occupancy")), None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status = defaultdict(lambda: defaultdict(int))
+
+    def report(self, elapsed):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"{total} requests in {elapsed:.2f}s -> {total / elapsed:.1f} req/s")
+        cols = f"{'endpoint':18s} {'n':>6s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'5xx':>5s} {'q/req':>6s}  status"
+        print(cols)
+        print("-" * len(cols))
+        for name in sorted(self.latencies):
+            lat = sorted(self.latencies[name])
+            q = statistics.quantiles(lat, n=100) if len(lat) > 1 else [lat[0]] * 99
+            print(f"{name:18s} {len(lat):6d} {len(lat) / elapsed:8.1f} {q[49] * 1000:8.1f} {q[94] * 1000:8.1f} "
+                  f"{q[98] * 1000:8.1f} {self.errors[name]:5d} {_queries[name] / len(lat):6.1f}  "
+                  + " ".join(f"{k}:{v}" for k, v in sorted(self.status[name].items())))
+
+
+async def drive(jobs, concurrency):
+    stats = Stats()
+    _queries.clear()
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", limits=limits, timeout=None) as client:
+        async def one(name, method, url, body):
+            async with sem:
+                _endpoint.set(name)
+                t0 = time.perf_counter()
+                r = await client.request(method, url, json=body)
+                stats.latencies[name].append(time.perf_counter() - t0)
+                stats.status[name][r.status_code] += 1
+                if r.status_code >= 500:
+                    stats.errors[name] += 1
+                return r
+        t0 = time.perf_counter()
+        responses = await asyncio.gather(*(one(*j) for j in jobs))
+        elapsed = time.perf_counter() - t0
+    if jobs and not sum(_queries.values()):
+        raise SystemExit("no DB statements were counted: the query counter isn't attached to the engine crud runs on")
+    return stats, elapsed, responses
+
+
+async def run_mixed(data, requests, concurrency, seed=11):
+    rnd = random.Random(seed)
+    jobs = [mixed_job(rnd, data) for _ in range(requests)]
+    print(f"\n== mixed workload: {requests} requests, concurrency {concurrency} ==")
+    stats, elapsed, _ = await drive(jobs, concurrency)
+    stats.report(elapsed)
+
+
+async def run_contention(data, clients, seed=13):
+    rnd = random.Random(seed)
+    show = data["shows"][0]
+    seats = data["hall_seats"][data["show_hall"][show]]
+    jobs = []
+    for i in range(clients):
+        user = rnd.choice(data["users"])
+        if i % 2:
+            jobs.append(("race_single", "POST", "/bookings/", {"user_id": user, "show_id": show, "seat_id": rnd.choice(seats)}))
+        else:
+            jobs.append(("race_group", "POST", "/book_group/", {"user_id": user, "show_id": show, "num_seats": rnd.randint(2, 6)}))
+    print(f"\n== contention: {clients} clients racing for show {show} ({len(seats)} seats) ==")
+    stats, elapsed, responses = await drive(jobs, clients)
+    stats.report(elapsed)
+    booked = sum(1 for r in responses if r.status_code == 200 and ("id" in r.json() or "bookings" in r.json()))
+    db = SessionLocal()
+    try:
+        n, distinct = db.execute(
+            select(func.count(models.Booking.id), func.count(func.distinct(models.Booking.seat_id)))
+            .where(models.Booking.show_id == show)
+        ).one()
+        sold = analytics.show_occupancy(db, show)["tickets_sold"]
+    finally:
+        db.close()
+    print(f"successful requests {booked}, bookings {n}, distinct seats {distinct}, rollup tickets {sold}")
+    ok = n == distinct == sold
+    print("consistency OK" if ok else "CONSISTENCY FAILURE")
+    return ok
+
+
+async def run_replay(path, concurrency):
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                path_ = r["path"]
+                name = r.get("name") or path_.strip("/").split("/")[0].split("?")[0] or "root"
+                jobs.append((name, r.get("method", "GET").upper(), path_, r.get("json")))
+    print(f"\n== replay {path}: {len(jobs)} requests, concurrency {concurrency} ==")
+    stats, elapsed, _ = await drive(jobs, concurrency)
+    stats.report(elapsed)
+
+
+async def run(args, data):
+    # one event loop for every scenario: the async engine's pool is bound to the loop that first used it
+    if args.replay:
+        await run_replay(args.replay, args.concurrency)
+        return True
+    ok = True
+    if args.scenario in ("all", "mixed"):
+        await run_mixed(data, args.requests, args.concurrency)
+    if args.scenario in ("all", "contention"):
+        ok = await run_contention(data, args.clients)
+    return ok
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenario", choices=["all", "mixed", "contention"], default="all")
+    ap.add_argument("--theaters", type=int, default=10)
+    ap.add_argument("--halls", type=int, default=5)
+    ap.add_argument("--shows", type=int, default=40, help="shows per hall")
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--booked-shows", type=int, default=200)
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--clients", type=int, default=300)
+    ap.add_argument("--replay")
+    args = ap.parse_args()
+
+    data = seed(args.theaters, args.halls, args.shows, args.users, args.booked_shows)
+    sys.exit(0 if asyncio.run(run(args, data)) else 1)
+
+
+if __name__ == "__main__":
+    main_()
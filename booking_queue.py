@@ -0,0 +1,200 @@
+"""
+Optional single-writer booking path (BOOKING_QUEUE=1).
+
+Every booking request for a show is handed to that show's asyncio worker
+instead of opening its own transaction. The worker drains its queue in
+batches (up to BATCH_MAX requests, waiting at most BATCH_WINDOW_MS for
+stragglers), decides every request in memory against the show's seat map,
+the live holds and the seats already claimed earlier in the same batch, and
+writes all accepted bookings with one INSERT and one commit. Each caller's
+future then gets a success or conflict result. Losers are rejected without
+ever touching the unique constraint, and a hot show costs one transaction
+per batch instead of one per request.
+
+The INSERT still uses ON CONFLICT DO NOTHING, so bookings made by another
+process (or the regular path) in the meantime are detected. A group that
+comes back partially inserted is removed again before the commit.
+
+Workers are per event loop and per show, and exit after IDLE_SECONDS
+without requests.
+"""
+import asyncio
+import os
+import weakref
+from datetime import datetime
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+import models, seatmap, holds, analytics, crud_async, bus
+from database import AsyncSessionLocal, dialect_insert, _env_bool
+
+ENABLED = _env_bool("BOOKING_QUEUE", False)
+BATCH_WINDOW_MS = float(os.getenv("BOOKING_BATCH_WINDOW_MS", "2"))
+BATCH_MAX = int(os.getenv("BOOKING_BATCH_MAX", "256"))
+IDLE_SECONDS = 30
+
+
+class Request:
+    """
+    One queued booking: explicit seat ids, or `num_seats` consecutive seats to be found by the worker.
+    """
+    __slots__ = ("user_id", "show_id", "seat_ids", "num_seats", "all_or_nothing", "future")
+
+    def __init__(self, user_id, show_id, seat_ids=None, num_seats=None, all_or_nothing=True):
+        self.user_id = user_id
+        self.show_id = show_id
+        self.seat_ids = list(dict.fromkeys(seat_ids)) if seat_ids else []
+        self.num_seats = num_seats
+        self.all_or_nothing = all_or_nothing
+        self.future = asyncio.get_running_loop().create_future()
+
+
+# ---------- Batch decision + commit (sync, runs through AsyncSession.run_sync) ----------
+def _decide(sm, batch, holders):
+    """
+    Seat ids to insert per request, resolving conflicts within the batch in arrival order.
+    `holders` is {seat_id: user_id} of the show's holds in seat_holds (see holds.py).
+    Returns {request index: [seat ids]} and {request index: result dict} for rejected requests.
+    """
+    claimed = set()
+    accepted, rejected = {}, {}
+    for i, r in enumerate(batch):
+        held = holds.store.held_seats(r.show_id, except_user=r.user_id)
+        held.update(sid for sid, uid in holders.items() if uid != r.user_id)
+        if r.num_seats is not None:
+            found = sm.find_consecutive(r.num_seats, held=held | claimed)
+            if not found:
+                rejected[i] = {"success": [], "failed": [], "error": "Could not find consecutive seats"}
+                continue
+            wanted = [s.id for s in found[1]]
+        else:
+            wanted = r.seat_ids
+        bad = [sid for sid in wanted if sid not in sm.hall.pos or sm.is_booked(sid) or sid in held or sid in claimed]
+        ok = [sid for sid in wanted if sid not in bad]
+        if not ok or (bad and r.all_or_nothing):
+            rejected[i] = {"success": [], "failed": list(wanted)}
+            continue
+        claimed.update(ok)
+        accepted[i] = ok
+    return accepted, rejected
+
+
+def commit_batch(db: Session, show_id: int, batch):
+    """
+    Decide and write one batch for a show in a single transaction. Returns one result per request:
+    {"success": [rows with id, seat_id], "failed": [seat ids]} (+ "error" for a missing show / no seats).
+    """
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return [{"success": [], "failed": r.seat_ids, "error": "Show not found"} for r in batch]
+    accepted, rejected = _decide(sm, batch, holds.store.holders(db, show_id))
+    results = [None] * len(batch)
+    for i, res in rejected.items():
+        results[i] = res
+    if not accepted:
+        return results
+    pricing = analytics.show_pricing(db, show_id)
+    price = pricing.price if pricing else None
+    now = datetime.utcnow()
+    values = [{"user_id": batch[i].user_id, "show_id": show_id, "seat_id": sid, "price": price, "created_at": now}
+              for i, seat_ids in accepted.items() for sid in seat_ids]
+    stmt = dialect_insert(db, models.Booking).values(values).on_conflict_do_nothing(index_elements=["show_id", "seat_id"])
+    rows = {r.seat_id: r for r in db.execute(stmt.returning(models.Booking.id, models.Booking.seat_id)).all()}
+    # seats booked elsewhere since the map was loaded: all-or-nothing requests give back what they got
+    undo = []
+    for i, seat_ids in accepted.items():
+        if batch[i].all_or_nothing and any(sid not in rows for sid in seat_ids):
+            undo += [rows.pop(sid).id for sid in seat_ids if sid in rows]
+    if undo:
+        db.execute(delete(models.Booking).where(models.Booking.id.in_(undo)))
+    if rows:
+        analytics.record_sales(db, show_id, [(len(rows), price, now)])
+        bus.publish(db, "seats", show_id, "booked", list(rows))
+    db.commit()
+    if len(rows) < len(values):
+        seatmap.invalidate(show_id)  # the map missed someone else's bookings
+    if rows:
+        seatmap.mark_booked(show_id, list(rows))  # with the map dropped this only relays the change
+    for i, seat_ids in accepted.items():
+        success = [rows[sid] for sid in seat_ids if sid in rows]
+        results[i] = {"success": success, "failed": [sid for sid in batch[i].seat_ids or seat_ids if sid not in rows]}
+    return results
+
+
+_commit_batch = crud_async._async_write(commit_batch)
+
+
+# ---------- Workers ----------
+class ShowWorker:
+    def __init__(self, show_id: int, registry: dict):
+        self.show_id = show_id
+        self.queue = asyncio.Queue()
+        self.registry = registry
+        self.batches = 0
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(self.queue.get(), IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    if self.queue.empty():
+                        return
+                    continue
+                batch = [first]
+                deadline = asyncio.get_running_loop().time() + BATCH_WINDOW_MS / 1000
+                while len(batch) < BATCH_MAX:
+                    if self.queue.empty():
+                        timeout = deadline - asyncio.get_running_loop().time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        batch.append(self.queue.get_nowait())
+                await self.flush(batch)
+        finally:
+            if self.registry.get(self.show_id) is self:
+                del self.registry[self.show_id]
+            # only reached with requests still queued if the worker was cancelled (shutdown)
+            while not self.queue.empty():
+                self.queue.get_nowait().future.cancel()
+
+    async def flush(self, batch):
+        try:
+            async with AsyncSessionLocal() as db:
+                results = await _commit_batch(db, self.show_id, batch)
+        except Exception as e:
+            for r in batch:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            return
+        self.batches += 1
+        for r, res in zip(batch, results):
+            if not r.future.done():
+                r.future.set_result(res)
+
+
+_workers = weakref.WeakKeyDictionary()  # event loop -> {show_id: ShowWorker}
+
+
+def _worker(show_id: int) -> ShowWorker:
+    loop = asyncio.get_running_loop()
+    registry = _workers.get(loop)
+    if registry is None:
+        registry = _workers[loop] = {}
+    w = registry.get(show_id)
+    if w is None or w.task.done():
+        w = registry[show_id] = ShowWorker(show_id, registry)
+    return w
+
+
+async def submit(user_id: int, show_id: int, seat_ids=None, num_seats: int = None, all_or_nothing: bool = True):
+    """
+    Queue a booking on the show's worker and wait for its batch. Same result shape as crud.book_specific_seats.
+    """
+    r = Request(user_id, show_id, seat_ids=seat_ids, num_seats=num_seats, all_or_nothing=all_or_nothing)
+    _worker(show_id).queue.put_nowait(r)
+    return await r.future
@@ -0,0 +1,117 @@
+"""
+In-process pub/sub for seat-state changes, feeding the /seat_updates SSE stream.
+
+Publishers (seatmap.mark_booked / mark_free, the hold store) call `seat_event`
+from whatever thread they run on; every subscriber owns a bounded asyncio
+queue on its own event loop and events are handed over with
+call_soon_threadsafe, so publishing never blocks on a slow client. Each show
+has a sequence number; a subscriber that falls behind is flagged `lagged`
+and resynchronises from a fresh snapshot instead of growing its queue.
+
+Delta wire format (one SSE "delta" event per change):
+    {"seq": 42, "X": [seat ids now booked], "A": [seat ids freed by a cancel],
+     "H": [seat ids now held], "R": [seat ids whose hold ended]}
+Empty keys are omitted. A seat shows as booked if X, else held if H, else
+available, so applying deltas in seq order on top of any snapshot taken
+after `seq` was read converges to the server state.
+
+Only subscribers in this process see the events. Seat changes made by other
+worker processes arrive through bus.py, which replays them via seatmap.
+"""
+import asyncio
+import threading
+
+QUEUE_SIZE = 256
+
+
+class Subscription:
+    __slots__ = ("topic", "loop", "queue", "lagged")
+
+    def __init__(self, topic, loop, maxsize):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def _offer(self, event):
+        # runs on the subscriber's loop
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def resync(self):
+        """
+        Drop queued events after a lag; the caller sends a fresh snapshot next.
+        """
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.lagged = False
+
+
+class Broker:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs = {}  # topic -> set of Subscription
+        self._seq = {}   # topic -> last published sequence number
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topic) -> Subscription:
+        sub = Subscription(topic, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subs.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.topic]
+
+    def seq(self, topic) -> int:
+        with self._lock:
+            return self._seq.get(topic, 0)
+
+    def publish(self, topic, event: dict):
+        """
+        Stamp `event` with the topic's next seq and hand it to every subscriber. Thread-safe.
+        """
+        with self._lock:
+            seq = self._seq[topic] = self._seq.get(topic, 0) + 1
+            event["seq"] = seq
+            self.published += 1
+            # delivered under the lock so every subscriber sees the topic's events in seq order
+            for sub in self._subs.get(topic, ()):
+                try:
+                    sub.loop.call_soon_threadsafe(sub._offer, event)
+                    self.delivered += 1
+                except RuntimeError:
+                    pass  # subscriber's loop is closed; it is dropped on unsubscribe
+        return seq
+
+    def subscribers(self, topic=None) -> int:
+        with self._lock:
+            if topic is None:
+                return sum(len(s) for s in self._subs.values())
+            return len(self._subs.get(topic, ()))
+
+
+broker = Broker()
+
+
+def seat_event(show_id: int, booked=(), freed=(), held=(), released=()):
+    event = {}
+    for key, ids in (("X", booked), ("A", freed), ("H", held), ("R", released)):
+        if ids:
+            event[key] = list(ids)
+    if event:
+        broker.publish(show_id, event)
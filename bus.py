@@ -0,0 +1,310 @@
+"""
+Change notifications between worker processes, so their in-memory state doesn't go stale.
+
+Every uvicorn worker keeps its own seat maps (seatmap.py), its own response
+cache with the memory / fakeredis backend (cache.py), and its own
+/seat_updates subscribers (broker.py). crud's write functions call `publish`
+before they commit. That adds an (entity, id) event row to change_log in the
+same transaction, so the event exists exactly when the write does, and its
+row id is its version. Each worker runs a `Listener` thread. On SQLite it
+checks `PRAGMA data_version` every BUS_POLL_MS, which changes once another
+connection commits. When it changes, the listener reads the new events in
+version order:
+
+    seats     booked / freed seat ids of a show: patch that show's seat map
+              (which also relays the change to local /seat_updates streams)
+    holds     held / released seats of a show: reload the show's holds from
+              seat_holds (see holds.py), relaying the difference the same way
+    waitlist  a fulfilled waitlist entry: notify its user's local
+              /notifications streams, if any
+    hall      drop the hall's seat index and maps, and the halls / seats:<id> tags
+    movie, theater, show, catalog (bulk loads)    invalidate the cached lists
+
+The writer patches its own seat map right after the commit (read-your-writes)
+and relays the change to its own /seat_updates streams, so the listener skips
+events from its own process. An older event from another worker can still
+arrive after that patch. So each process remembers, per (show, seat), the version
+of its latest committed seat event (a high-water mark), and a foreign event
+older than that leaves the seat alone. Entries are dropped once the listener
+has read past their version. Cache tags only need bumping in the other
+workers, and not at all when the cache backend is shared (Redis).
+
+change_log keeps the newest BUS_KEEP events. A worker that falls further
+behind than that drops all its seat maps and cached responses and reloads on
+demand, and reloads every live hold. It does the same for holds when it starts.
+Idempotency keys need no events: they are read from their table (idempotency.py).
+
+On SQLite only one transaction writes at a time, so ids are handed out in
+commit order. Other databases have no data_version, so the table is polled
+instead. A sequence id that was skipped is watched for BUS_GAP_SECONDS,
+because its transaction may still commit.
+
+    BUS=0             don't publish or listen (single worker)
+    BUS_POLL_MS=5     poll interval (each idle check is one PRAGMA)
+    BUS_KEEP=100000   events kept in change_log
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import delete, event, func, or_, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import models, seatmap, cache, holds, waitlist
+from broker import broker
+from database import _env_bool
+
+ENABLED = _env_bool("BUS", True)
+BUS_POLL_MS = float(os.getenv("BUS_POLL_MS", "5"))
+BUS_KEEP = int(os.getenv("BUS_KEEP", "100000"))
+BUS_GAP_SECONDS = 5
+READ_BATCH = 1000
+PRUNE_SECONDS = 30
+
+CATALOG_TAGS = ("movies", "theaters", "halls", "shows", "users")
+
+ORIGIN = uuid.uuid4().hex[:16]  # this process, so it can skip its own events
+
+_own = {}  # (show_id, seat_id) -> version of this process's latest committed seats event
+_own_lock = threading.Lock()
+
+log = logging.getLogger("moviebooking.bus")
+
+
+def publish(db, entity: str, entity_id: int = None, op: str = "changed", seat_ids=None):
+    """
+    Add an event to the session's transaction; the other workers see it once that commits.
+    """
+    if not ENABLED:
+        return
+    res = db.execute(models.Change.__table__.insert().values(
+        entity=entity, entity_id=entity_id, op=op,
+        seat_ids=",".join(map(str, seat_ids)) if seat_ids is not None else None,
+        origin=ORIGIN, created_at=datetime.utcnow(),
+    ))
+    if entity == "seats" and listener is not None:
+        # takes effect in _own once the transaction commits (see _own_committed)
+        db.info.setdefault("bus_own", []).append((entity_id, seat_ids, res.inserted_primary_key[0]))
+
+
+def _own_committed(session):
+    with _own_lock:
+        for show_id, seat_ids, version in session.info.pop("bus_own", ()):
+            for sid in seat_ids:
+                _own[(show_id, sid)] = max(_own.get((show_id, sid), 0), version)
+
+
+def _forget_own(version: int):
+    # no event at or below `version` is still to come, so these marks can't matter any more
+    with _own_lock:
+        for k in [k for k, v in _own.items() if v <= version]:
+            del _own[k]
+
+
+def _own_rolled_back(session):
+    session.info.pop("bus_own", None)
+
+
+event.listen(Session, "after_commit", _own_committed)
+event.listen(Session, "after_rollback", _own_rolled_back)
+
+
+def _invalidate(*tags):
+    if not cache.responses.backend.shared:
+        cache.invalidate(*tags)
+
+
+def _notify_fulfilled(conn, entry_id: int):
+    W, B = models.WaitlistEntry, models.Booking
+    e = conn.execute(select(W.user_id, W.show_id, W.seat_ids).where(W.id == entry_id)).first()
+    if e is None or not broker.subscribers(("user", e.user_id)):
+        return  # the user has no /notifications stream open on this worker
+    seat_ids = waitlist.parse_seat_ids(e.seat_ids)
+    booked = dict(conn.execute(
+        select(B.seat_id, B.id).where(B.show_id == e.show_id, B.user_id == e.user_id, B.seat_id.in_(seat_ids))
+    ).all())
+    waitlist.fulfilled(e.user_id, entry_id, e.show_id, seat_ids, [booked[s] for s in seat_ids if s in booked])
+
+
+def apply(e, conn):
+    """
+    Bring this process's in-memory state up to date with one change_log row (holds: see Listener.poll).
+    """
+    if e.entity == "seats":
+        seat_ids = [int(s) for s in e.seat_ids.split(",")] if e.seat_ids else []
+        if e.origin == ORIGIN:
+            return  # the writer patched its map and relayed the change right after the commit
+        with _own_lock:
+            # older than this process's own latest change to the seat: that change already won
+            seat_ids = [sid for sid in seat_ids if _own.get((e.entity_id, sid), 0) < e.id]
+        if not seat_ids:
+            return
+        if e.op == "booked":
+            seatmap.mark_booked(e.entity_id, seat_ids)
+        else:
+            seatmap.mark_free(e.entity_id, seat_ids)
+        return
+    if e.origin == ORIGIN:
+        return  # the writer invalidated its own cache right after the commit
+    if e.entity == "hall":
+        seatmap.invalidate_hall(e.entity_id)
+        _invalidate("halls", f"seats:{e.entity_id}")
+    elif e.entity in ("movie", "theater", "show"):
+        _invalidate(e.entity + "s")
+    elif e.entity == "catalog":
+        _invalidate(*CATALOG_TAGS)
+    elif e.entity == "waitlist":
+        _notify_fulfilled(conn, e.entity_id)
+
+
+def resync():
+    """
+    Forget every seat map and cached response (events were missed); both reload from the DB.
+    """
+    seatmap.invalidate()
+    with _own_lock:
+        _own.clear()  # the reloaded maps come straight from the DB
+    if not cache.responses.backend.shared:
+        cache.responses.clear()
+
+
+class Listener:
+    def __init__(self, engine, poll_ms: float = BUS_POLL_MS, clock=time.monotonic):
+        self.engine = engine
+        self.interval = poll_ms / 1000
+        self.clock = clock
+        self.last = 0       # highest version applied
+        self.applied = 0
+        self.resyncs = 0
+        self._gaps = {}     # skipped id -> when it was first skipped (non-SQLite only)
+        self._holds_stale = True  # reload every live hold at the next poll
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self.engine.connect() as conn:
+            self.last = conn.execute(select(func.max(models.Change.id))).scalar() or 0
+        self._thread = threading.Thread(target=self._run, name="bus-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        sqlite = self.engine.dialect.name == "sqlite"
+        while not self._stop.is_set():
+            version = None
+            next_prune = self.clock() + PRUNE_SECONDS
+            try:
+                with self.engine.connect() as conn:
+                    # the idle check runs every few ms, so it goes straight to the driver
+                    cur = conn.connection.dbapi_connection.cursor() if sqlite else None
+                    while not self._stop.is_set():
+                        time.sleep(self.interval)  # cheaper than Event.wait at this rate
+                        if sqlite:
+                            # per connection; changes whenever another connection commits
+                            v = cur.execute("PRAGMA data_version").fetchone()[0]
+                            if v == version:
+                                continue
+                            version = v
+                        self.poll(conn)
+                        conn.rollback()
+                        if self.clock() >= next_prune:
+                            self.prune(conn)
+                            next_prune = self.clock() + PRUNE_SECONDS
+            except Exception:
+                log.exception("change listener failed, resyncing")
+                resync()
+                self._holds_stale = True
+                self.resyncs += 1
+                self._stop.wait(1)
+
+    def poll(self, conn):
+        """
+        Apply the events committed since the last poll, in version order. Returns how many were applied.
+        """
+        C = models.Change
+        n = 0
+        hold_shows = set()
+        while True:
+            cond = C.id > self.last
+            if self._gaps:
+                cond = or_(cond, C.id.in_(list(self._gaps)))
+            rows = conn.execute(select(C).where(cond).order_by(C.id).limit(READ_BATCH)).all()
+            for e in rows:
+                if e.id > self.last:
+                    if e.id > self.last + 1 and self.last:
+                        self._skipped(conn, self.last + 1, e.id)
+                    self.last = e.id
+                else:
+                    del self._gaps[e.id]  # committed after a higher id was read
+                if e.entity != "holds":
+                    apply(e, conn)
+                elif e.origin != ORIGIN:
+                    hold_shows.add(e.entity_id)  # the writer updated its own holds after the commit
+            n += len(rows)
+            if len(rows) < READ_BATCH:
+                break
+        if self._holds_stale or hold_shows:
+            # one reload per show however many events, read after all of them committed
+            holds.store.reload(conn, None if self._holds_stale else hold_shows)
+            self._holds_stale = False
+        now = self.clock()
+        for gid in [g for g, t in self._gaps.items() if now - t > BUS_GAP_SECONDS]:
+            del self._gaps[gid]
+        if _own:
+            _forget_own(min(self._gaps) - 1 if self._gaps else self.last)
+        self.applied += n
+        return n
+
+    def _skipped(self, conn, lo: int, hi: int):
+        """
+        Ids lo..hi-1 were passed over: pruned before this worker read them (resync), or still uncommitted.
+        """
+        oldest = conn.execute(select(func.min(models.Change.id))).scalar()
+        if oldest is not None and oldest > lo:
+            log.warning("change log pruned past version %d, resyncing", lo)
+            resync()
+            self._holds_stale = True
+            self.resyncs += 1
+            return
+        now = self.clock()
+        for gid in range(lo, min(hi, lo + READ_BATCH)):
+            self._gaps.setdefault(gid, now)
+
+    def prune(self, conn):
+        try:
+            conn.execute(delete(models.Change).where(models.Change.id <= self.last - BUS_KEEP))
+            conn.commit()
+        except OperationalError:
+            conn.rollback()  # the write lock is busy; next round
+
+
+listener = None
+
+
+def start(engine):
+    """
+    Start this process's listener (main does at import). None if BUS=0 or the database is in-memory SQLite.
+    """
+    global listener
+    if not ENABLED or listener is not None:
+        return listener
+    if engine.dialect.name == "sqlite" and engine.url.database in (None, "", ":memory:"):
+        return None
+    listener = Listener(engine)
+    listener.start()
+    return listener
+
+
+def metrics():
+    l = listener
+    return {
+        "version": l.last if l else 0,
+        "applied": l.applied if l else 0,
+        "resyncs": l.resyncs if l else 0,
+    }
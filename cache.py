@@ -0,0 +1,214 @@
+"""
+Read-through cache of pre-serialized JSON responses for the catalog endpoints.
+
+Entries are grouped under a tag ("movies", "shows", "seats:<hall_id>", ...).
+Every tag has a generation counter that is part of the entry keys, so
+invalidating a tag is a single counter bump: stale entries are never read
+again and age out through LRU/TTL eviction. crud's create_* functions
+invalidate exactly the tags they affect. With a per-process backend the
+other workers learn about those writes through bus.py.
+
+Backends (CACHE_URL):
+  memory          in-process LRU with TTL (default)
+  fakeredis       in-process stand-in speaking the Redis client API, for local runs
+  redis://...     a Redis-protocol server (needs the `redis` package; use a
+                  volatile-* eviction policy so the generation counters, which
+                  have no TTL, are never evicted)
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_URL = os.getenv("CACHE_URL", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class MemoryBackend:
+    shared = False  # per process: other workers' writes arrive through bus.py
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}         # incr() keys, kept out of LRU eviction
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] is not None and item[0] <= self.clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value, ttl: int = None):
+        with self._lock:
+            self._data[key] = (self.clock() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            n = self._counters[key] = self._counters.get(key, 0) + 1
+            return n
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self._counters.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class FakeRedis:
+    """
+    Minimal in-process stand-in for a redis.Redis client (get / set ex= / incr / delete / flushdb).
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[0] is not None and item[0] <= self.clock()):
+                self._data.pop(key, None)
+                return None
+            return item[1]
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, int):
+            value = str(value).encode()
+        with self._lock:
+            self._data[key] = (self.clock() + ex if ex else None, value)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            n = int(item[1]) + 1 if item else 1
+            self._data[key] = (None, str(n).encode())
+            return n
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """
+    Adapter over any redis.Redis-compatible client; TTL and eviction are left to the server (maxmemory-policy).
+    """
+    evictions = 0
+
+    def __init__(self, client, prefix: str = "mb:", shared: bool = True):
+        self.client = client
+        self.prefix = prefix
+        self.shared = shared  # False for the in-process FakeRedis
+
+    def get(self, key: str):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value, ttl: int = None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def make_backend(url: str = CACHE_URL):
+    if url == "memory":
+        return MemoryBackend()
+    if url == "fakeredis":
+        return RedisBackend(FakeRedis(), shared=False)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis  # optional dependency, only needed for a real Redis server
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported CACHE_URL {url!r}")
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key_for(self, tag: str, key: str) -> str:
+        """
+        Backend key for `key` under the tag's current generation. Take it *before* reading
+        the DB and store with it, so a write racing the read files the result under a
+        generation that is already dead.
+        """
+        g = self.backend.get("gen:" + tag)
+        return f"{tag}:{0 if g is None else int(g)}:{key}"
+
+    def get(self, cache_key: str):
+        """
+        Cached (etag, next_after, body) or None.
+        """
+        raw = self.backend.get(cache_key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, next_after, body = raw.split(b"\n", 2)
+        return etag.decode(), next_after.decode() or None, body
+
+    def put(self, cache_key: str, body: bytes, next_after=None):
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        nxt = "" if next_after is None else str(next_after)
+        self.backend.set(cache_key, f"{etag}\n{nxt}\n".encode() + body, self.ttl)
+        return etag, nxt or None, body
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self.backend.incr("gen:" + tag)
+            self.invalidations += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": getattr(self.backend, "evictions", 0),
+        }
+
+
+responses = ResponseCache(make_backend())
+
+
+def invalidate(*tags: str):
+    responses.invalidate(*tags)
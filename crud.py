@@ -1,67 +1,163 @@
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import and_, func
-import models, schemas
+from sqlalchemy import and_, func, delete, select, union_all
+from database import dialect_insert
+import models, schemas, seatmap, holds, analytics, provisioning, cache, waitlist, seed, bus
+
+# ---------- Listing (keyset pagination + column projections) ----------
+# columns each list endpoint publishes (mirrors the response schemas)
+LIST_FIELDS = {
+    models.Movie: ("id", "title", "price"),
+    models.Theater: ("id", "name"),
+    models.Hall: ("id", "name", "theater_id"),
+    models.Show: ("id", "time", "start_time", "movie_id", "hall_id"),
+    models.User: ("id", "name", "email"),
+    models.Booking: ("id", "user_id", "show_id", "seat_id"),
+    models.Seat: ("id", "row", "number", "hall_id", "accessible"),
+}
+STREAM_CHUNK = 1000
+
+def _columns(model):
+    return [getattr(model, f) for f in LIST_FIELDS[model]]
+
+def list_page(db: Session, model, after_id: int = None, limit: int = None):
+    """
+    Rows (column tuples, no ORM objects) of `model` in id order, starting after `after_id`.
+    """
+    q = db.query(*_columns(model))
+    if after_id is not None:
+        q = q.filter(model.id > after_id)
+    q = q.order_by(model.id)
+    if limit is not None:
+        q = q.limit(limit)
+    return q.all()
+
+def stream_rows(db: Session, model, after_id: int = None, chunk: int = STREAM_CHUNK):
+    """
+    Yield lists of plain dicts, `chunk` rows at a time, reading with yield_per so
+    memory stays flat however large the table is.
+    """
+    stmt = select(*_columns(model)).order_by(model.id)
+    if after_id is not None:
+        stmt = stmt.where(model.id > after_id)
+    result = db.execute(stmt.execution_options(yield_per=chunk))
+    for part in result.mappings().partitions():
+        yield [dict(r) for r in part]
 
 # ---------- Movies ----------
 def create_movie(db: Session, movie: schemas.MovieCreate):
     db_movie = models.Movie(**movie.dict())
     db.add(db_movie)
+    db.flush()
+    bus.publish(db, "movie", db_movie.id)
     db.commit()
     db.refresh(db_movie)
+    cache.invalidate("movies")
     return db_movie
 
-def list_movies(db: Session):
-    return db.query(models.Movie).all()
+def list_movies(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.Movie, after_id, limit)
 
 # ---------- Theaters ----------
 def create_theater(db: Session, theater: schemas.TheaterCreate):
     db_theater = models.Theater(**theater.dict())
     db.add(db_theater)
+    db.flush()
+    bus.publish(db, "theater", db_theater.id)
     db.commit()
     db.refresh(db_theater)
+    cache.invalidate("theaters")
     return db_theater
 
-def list_theaters(db: Session):
-    return db.query(models.Theater).all()
+def list_theaters(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.Theater, after_id, limit)
 
 # ---------- Halls ----------
 def create_hall(db: Session, hall: schemas.HallCreate, num_rows:int=5, seats_per_row:int=6):
     """
-    Create hall and auto-seed seats (rows A.., seats 1..N).
-    Default creates 5 rows x 6 seats (changeable).
+    Create hall and auto-seed seats (rows A.., seats 1..N) in one transaction.
+    The layout comes from the request (layout string, row_counts or rows x seats_per_row),
+    falling back to num_rows x seats_per_row (default 5 x 6).
+    Returns dict with "error" for an invalid layout.
     """
+    try:
+        seats = provisioning.hall_seats(
+            rows=num_rows if hall.rows is None else hall.rows,
+            seats_per_row=seats_per_row if hall.seats_per_row is None else hall.seats_per_row,
+            row_counts=hall.row_counts, layout=hall.layout,
+        )
+    except provisioning.LayoutError as e:
+        return {"error": str(e)}
     db_hall = models.Hall(**{"name": hall.name, "theater_id": hall.theater_id})
     db.add(db_hall)
+    db.flush()
+    # single executemany for every seat
+    provisioning.insert_seats(db, db_hall.id, seats)
+    bus.publish(db, "hall", db_hall.id)
     db.commit()
     db.refresh(db_hall)
-
-    # create seats: rows A.., at least 6 seats per row
-    for r in range(num_rows):
-        row_letter = chr(65 + r)
-        for n in range(1, seats_per_row + 1):
-            seat = models.Seat(row=row_letter, number=n, hall_id=db_hall.id)
-            db.add(seat)
-    db.commit()
+    seatmap.invalidate_hall(db_hall.id)
+    cache.invalidate("halls", f"seats:{db_hall.id}")
     return db_hall
 
-def list_halls(db: Session):
-    return db.query(models.Hall).all()
+def list_halls(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.Hall, after_id, limit)
 
 # ---------- Shows ----------
 def create_show(db: Session, show: schemas.ShowCreate):
-    db_show = models.Show(**show.dict())
+    try:
+        time, start = provisioning.show_times(show.time, show.start_time)
+    except ValueError as e:
+        return {"error": str(e)}
+    db_show = models.Show(time=time, start_time=start, movie_id=show.movie_id, hall_id=show.hall_id)
     db.add(db_show)
+    db.flush()
+    analytics.register_show(db, db_show)
+    bus.publish(db, "show", db_show.id)
     db.commit()
     db.refresh(db_show)
+    cache.invalidate("shows")
     return db_show
 
-def list_shows(db: Session):
-    return db.query(models.Show).all()
+def list_shows(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.Show, after_id, limit)
+
+def search_shows(db: Session, movie_id: int = None, theater_id: int = None, start: datetime = None,
+                 end: datetime = None, min_seats: int = None, limit: int = 50):
+    """
+    Shows by movie / theater / start-time window [start, end), earliest first, with seats remaining
+    read from the show_sales counter. Legacy shows without a start_time only match when no window is given.
+    """
+    S, H, M, SS = models.Show, models.Hall, models.Movie, models.ShowSales
+    # start times are stored as naive UTC (see provisioning.show_times)
+    start, end = [t.astimezone(timezone.utc).replace(tzinfo=None) if t is not None and t.tzinfo else t for t in (start, end)]
+    remaining = (func.coalesce(SS.capacity, 0) - func.coalesce(SS.tickets, 0)).label("seats_remaining")
+    q = (
+        db.query(S.id, S.time, S.start_time, S.movie_id, M.title, H.theater_id, S.hall_id,
+                 H.name.label("hall"), func.coalesce(SS.capacity, 0).label("capacity"), remaining)
+        .join(H, H.id == S.hall_id)
+        .join(M, M.id == S.movie_id)
+        .outerjoin(SS, SS.show_id == S.id)
+    )
+    if movie_id is not None:
+        q = q.filter(S.movie_id == movie_id)
+    if theater_id is not None:
+        q = q.filter(H.theater_id == theater_id)
+    if start is not None:
+        q = q.filter(S.start_time >= start)
+    if end is not None:
+        q = q.filter(S.start_time < end)
+    if min_seats is not None:
+        q = q.filter(remaining >= min_seats)
+    return q.order_by(S.start_time, S.id).limit(limit).all()
+
+def get_show(db: Session, show_id: int):
+    return db.query(models.Show).filter(models.Show.id == show_id).first()
 
 # ---------- Seats ----------
 def list_seats_by_hall(db: Session, hall_id: int):
-    return db.query(models.Seat).filter(models.Seat.hall_id == hall_id).order_by(models.Seat.row, models.Seat.number).all()
+    return db.query(*_columns(models.Seat)).filter(models.Seat.hall_id == hall_id).order_by(func.length(models.Seat.row), models.Seat.row, models.Seat.number).all()
 
 # ---------- Users ----------
 def create_user(db: Session, user: schemas.UserCreate):
@@ -71,172 +167,421 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
-def list_users(db: Session):
-    return db.query(models.User).all()
+def list_users(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.User, after_id, limit)
 
 # ---------- Bookings (single) ----------
 def create_booking(db: Session, booking: schemas.BookingCreate):
-    db_booking = models.Booking(**booking.dict())
+    # cheap in-memory rejections before touching the bookings table
+    sm = seatmap.get(db, booking.show_id)
+    if sm is not None and sm.is_booked(booking.seat_id):
+        return {"error": "Seat already booked for this show"}
+    if booking.seat_id in holds.store.held_seats(booking.show_id, except_user=booking.user_id, db=db):
+        return {"error": "Seat is held by another customer"}
+    pricing = analytics.show_pricing(db, booking.show_id)
+    db_booking = models.Booking(**booking.dict(), price=pricing.price if pricing else None, created_at=datetime.utcnow())
     try:
         db.add(db_booking)
+        db.flush()
+        analytics.record_sales(db, db_booking.show_id, [(1, db_booking.price, db_booking.created_at)])
+        bus.publish(db, "seats", db_booking.show_id, "booked", [db_booking.seat_id])
         db.commit()
         db.refresh(db_booking)
+        seatmap.mark_booked(db_booking.show_id, [db_booking.seat_id])
         return db_booking
     except IntegrityError:
         db.rollback()
+        seatmap.invalidate(booking.show_id)  # booked elsewhere (another worker): the map was stale
         return {"error": "Seat already booked for this show"}
 
-def list_bookings(db: Session):
-    return db.query(models.Booking).all()
+def list_bookings(db: Session, after_id: int = None, limit: int = None):
+    return list_page(db, models.Booking, after_id, limit)
 
 def cancel_booking(db: Session, booking_id: int):
     b = db.query(models.Booking).filter(models.Booking.id == booking_id).first()
     if not b:
         return {"error": "Booking not found"}
+    show_id, seat_id = b.show_id, b.seat_id
+    analytics.record_sales(db, show_id, [(-1, b.price, b.created_at)])
     db.delete(b)
+    bus.publish(db, "seats", show_id, "freed", [seat_id])
     db.commit()
+    seatmap.mark_free(show_id, [seat_id])
+    waitlist.seats_freed(show_id)
     return {"message": f"Booking {booking_id} cancelled"}
 
+def cancel_bookings(db: Session, booking_ids: list[int]):
+    """
+    Cancel several bookings with a single DELETE ... WHERE id IN (...) and one commit.
+    Returns dict with keys: cancelled, not_found (booking ids, in request order)
+    """
+    if not booking_ids:
+        return {"cancelled": [], "not_found": []}
+    rows = db.execute(
+        delete(models.Booking)
+        .where(models.Booking.id.in_(booking_ids))
+        .returning(models.Booking.id, models.Booking.show_id, models.Booking.seat_id,
+                   models.Booking.price, models.Booking.created_at)
+    ).all()
+    freed = {}
+    for r in rows:
+        freed.setdefault(r.show_id, []).append(r.seat_id)
+    for show_id, seat_ids in freed.items():
+        analytics.record_sales(db, show_id, [(-1, r.price, r.created_at) for r in rows if r.show_id == show_id])
+        bus.publish(db, "seats", show_id, "freed", seat_ids)
+    db.commit()
+    for show_id, seat_ids in freed.items():
+        seatmap.mark_free(show_id, seat_ids)
+        waitlist.seats_freed(show_id)
+    done = {r.id for r in rows}
+    return {
+        "cancelled": [bid for bid in booking_ids if bid in done],
+        "not_found": [bid for bid in booking_ids if bid not in done],
+    }
+
 # ---------- Group booking (consecutive seats) ----------
 def book_consecutive_seats(db: Session, show_id: int, num_seats: int, user_id: int):
     """
     Try to find and book `num_seats` consecutive seats in the SAME row for the given show.
-    Returns list of created Booking objects on success, else None.
-    """
-    # available seats for show (seat ids that are not booked for this show)
-    # find all seats (with row, number) -> group by row
-    # then search for consecutive numbers in same row
-    all_seats = db.query(models.Seat).order_by(models.Seat.row, models.Seat.number).all()
-
-    # booked seat ids for the show
-    booked_ids = {r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == show_id).all()}
-
-    rows = {}
-    for s in all_seats:
-        rows.setdefault(s.row, []).append(s)
-
-    for row, seats in rows.items():
-        # build list of available seat objects in this row (in order)
-        avail = [s for s in seats if s.id not in booked_ids]
-        # scan for consecutive groups by seat.number
-        for i in range(0, len(avail) - num_seats + 1):
-            group = avail[i:i+num_seats]
-            expected = list(range(group[0].number, group[0].number + num_seats))
-            if [s.number for s in group] == expected:
-                # attempt booking transactionally
-                bookings = []
-                try:
-                    for s in group:
-                        b = models.Booking(user_id=user_id, show_id=show_id, seat_id=s.id)
-                        db.add(b)
-                        bookings.append(b)
-                    db.commit()
-                    for b in bookings:
-                        db.refresh(b)
-                    return bookings
-                except IntegrityError:
-                    db.rollback()
-                    # concurrent race -> try continue or return failure
-                    return None
-    return None
+    Returns list of created bookings (id, seat_id rows) on success, else None.
+    The search runs on the show's seat bitmap (see seatmap.py), so only seats of the show's hall are considered.
+    """
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return None
+    found = sm.find_consecutive(num_seats, held=holds.store.held_seats(show_id, except_user=user_id))
+    if not found:
+        return None
+    row, group = found
+    res = book_specific_seats(db, user_id, show_id, [s.id for s in group], all_or_nothing=True)
+    if not res["success"]:
+        # concurrent race -> map was stale, reload it next time
+        seatmap.invalidate(show_id)
+        return None
+    return res["success"]
 
 # ---------- Group booking by seat ids (friends pick specific seats) ----------
-def book_specific_seats(db: Session, user_id: int, show_id: int, seat_ids: list[int]):
+def book_specific_seats(db: Session, user_id: int, show_id: int, seat_ids: list[int], all_or_nothing: bool = False):
     """
     Attempt to book list of specific seat_ids for a show for the user.
-    Returns dict with keys: success (list), failed (list)
+    Returns dict with keys: success (list of id, seat_id rows), failed (list of seat ids)
+    All rows go in one INSERT and one commit. With all_or_nothing=True a single
+    conflict books nothing; otherwise conflicting seats are skipped (ON CONFLICT DO NOTHING).
+    Seats held by other users (see holds.py) count as conflicts.
     Uses DB unique constraint + transaction to prevent double booking.
     """
-    success = []
-    failed = []
-    for sid in seat_ids:
-        b = models.Booking(user_id=user_id, show_id=show_id, seat_id=sid)
-        db.add(b)
-        try:
-            db.commit()
-            db.refresh(b)
-            success.append(b)
-        except IntegrityError:
-            db.rollback()
-            failed.append(sid)
+    held = holds.store.held_seats(show_id, except_user=user_id, db=db)
+    if all_or_nothing and held.intersection(seat_ids):
+        return {"success": [], "failed": list(seat_ids)}
+    wanted = [sid for sid in dict.fromkeys(seat_ids) if sid not in held]
+    dupes = [sid for i, sid in enumerate(seat_ids) if sid in seat_ids[:i] or sid in held]
+    if not wanted:
+        return {"success": [], "failed": dupes}
+    pricing = analytics.show_pricing(db, show_id)
+    price = pricing.price if pricing else None
+    now = datetime.utcnow()
+    values = [{"user_id": user_id, "show_id": show_id, "seat_id": sid, "price": price, "created_at": now} for sid in wanted]
+    stmt = dialect_insert(db, models.Booking).values(values)
+    if all_or_nothing:
+        if dupes:
+            return {"success": [], "failed": list(seat_ids)}
+        sm = seatmap.get(db, show_id)
+        if sm is not None and any(sm.is_booked(sid) for sid in wanted):
+            # known conflict -> reject without a DB write
+            return {"success": [], "failed": list(seat_ids)}
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["show_id", "seat_id"])
+    try:
+        rows = db.execute(stmt.returning(models.Booking.id, models.Booking.seat_id)).all()
+        analytics.record_sales(db, show_id, [(len(rows), price, now)])
+        if rows:
+            bus.publish(db, "seats", show_id, "booked", [r.seat_id for r in rows])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        seatmap.invalidate(show_id)  # booked elsewhere: the map was stale
+        return {"success": [], "failed": list(seat_ids)}
+    by_seat = {r.seat_id: r for r in rows}
+    success = [by_seat[sid] for sid in wanted if sid in by_seat]
+    failed = [sid for sid in wanted if sid not in by_seat] + dupes
+    if len(by_seat) < len(wanted):
+        seatmap.invalidate(show_id)  # ON CONFLICT skipped seats the map thought were free
+    if by_seat:
+        seatmap.mark_booked(show_id, list(by_seat))
     return {"success": success, "failed": failed}
 
 # ---------- Suggest alternate shows where consecutive seats exist ----------
 def suggest_alternate_shows_for_consecutive(db: Session, movie_id: int, num_seats: int):
     suggestions = []
-    shows = db.query(models.Show).filter(models.Show.movie_id == movie_id).all()
+    shows = db.query(models.Show.id, models.Show.time).filter(models.Show.movie_id == movie_id).all()
     for s in shows:
-        # count available consecutive spots
-        bookings = {r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == s.id).all()}
-        seats = db.query(models.Seat).order_by(models.Seat.row, models.Seat.number).all()
-        rows = {}
-        for seat in seats:
-            rows.setdefault(seat.row, []).append(seat)
-        found = False
-        for row, row_seats in rows.items():
-            avail = [seat for seat in row_seats if seat.id not in bookings]
-            for i in range(0, len(avail) - num_seats + 1):
-                group = avail[i:i+num_seats]
-                expected = list(range(group[0].number, group[0].number + num_seats))
-                if [s.number for s in group] == expected:
-                    suggestions.append({"show_id": s.id, "time": s.time, "row": row, "start_number": group[0].number})
-                    found = True
-                    break
-            if found:
-                break
+        # each show's map is scoped to its own hall and indexed by free runs per row
+        sm = seatmap.get(db, s.id)
+        found = sm.find_consecutive(num_seats, held=holds.store.held_seats(s.id)) if sm else None
+        if found:
+            row, group = found
+            suggestions.append({"show_id": s.id, "time": s.time, "row": row, "start_number": group[0].number})
     return suggestions
 
 # ---------- Seats availability ----------
 def available_seats_for_show(db: Session, show_id: int):
-    show = db.query(models.Show).filter(models.Show.id == show_id).first()
-    if not show:
+    sm = seatmap.get(db, show_id)
+    if sm is None:
         return None
-    all_seats = db.query(models.Seat).filter(models.Seat.hall_id == show.hall_id).order_by(models.Seat.row, models.Seat.number).all()
-    booked = {r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == show_id).all()}
-    avail = [s for s in all_seats if s.id not in booked]
-    return avail
+    return sm.available(held=holds.store.held_seats(show_id))
 
 # ---------- Seat layout visualization ----------
 def seat_layout_for_show(db: Session, show_id: int):
-    show = db.query(models.Show).filter(models.Show.id == show_id).first()
-    if not show:
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return None
+    return sm.layout(held=holds.store.held_seats(show_id))
+
+def seat_planes_for_show(db: Session, show_id: int, kind: str = "layout"):
+    """
+    (header, row masks) for the packed seat formats (see SeatMap.planes), or None if the show doesn't exist.
+    """
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return None
+    return sm.planes(kind, held=holds.store.held_seats(show_id))
+
+def seat_snapshot_for_show(db: Session, show_id: int):
+    """
+    Compact seat state for /seat_updates (see SeatMap.snapshot), or None if the show doesn't exist.
+    """
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return None
+    return sm.snapshot(held=holds.store.held_seats(show_id))
+
+# ---------- Seat holds ----------
+def hold_seats(db: Session, hold: schemas.HoldCreate):
+    """
+    Hold seats for a user (a seat_holds row per seat, no bookings). Returns the Hold, None if the show
+    doesn't exist, or dict with "error" (and the unavailable seat ids) on conflict.
+    """
+    sm = seatmap.get(db, hold.show_id)
+    if sm is None:
+        return None
+    unknown = [sid for sid in hold.seat_ids if sid not in sm.hall.pos]
+    if unknown:
+        return {"error": "Seats not in this show's hall", "unavailable": unknown}
+    booked = [sid for sid in hold.seat_ids if sm.is_booked(sid)]
+    if booked:
+        return {"error": "Seats already booked", "unavailable": booked}
+    ttl = hold.ttl_seconds or holds.DEFAULT_TTL
+    h, taken = holds.store.hold(db, hold.user_id, hold.show_id, hold.seat_ids, ttl)
+    if h is None:
+        return {"error": "Seats held by another customer", "unavailable": taken}
+    return h
+
+def confirm_hold(db: Session, hold_id: str):
+    """
+    Turn a live hold into bookings (all or nothing). Returns None if the hold is unknown or expired,
+    else the book_specific_seats result. The hold is released either way.
+    """
+    h = holds.store.get(db, hold_id)
+    if h is None:
         return None
-    all_seats = db.query(models.Seat).filter(models.Seat.hall_id == show.hall_id).order_by(models.Seat.row, models.Seat.number).all()
-    booked = {r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == show_id).all()}
-    layout = {}
-    for s in all_seats:
-        layout.setdefault(s.row, {})[s.number] = ("Booked" if s.id in booked else "Available")
-    # ascii map
-    ascii_lines = []
-    for row in sorted(layout.keys()):
-        rowvals = "".join("[X]" if layout[row][n]=="Booked" else "[ ]" for n in sorted(layout[row].keys()))
-        ascii_lines.append(f"{row} {rowvals}")
-    return {"layout": layout, "ascii": "\n".join(ascii_lines)}
+    res = book_specific_seats(db, h.user_id, h.show_id, h.seat_ids, all_or_nothing=True)
+    holds.store.release(db, hold_id)
+    return res
+
+def release_hold(db: Session, hold_id: str):
+    return holds.store.release(db, hold_id)
+
+# ---------- Waitlist ----------
+def join_waitlist(db: Session, entry: schemas.WaitlistCreate):
+    """
+    Queue a request for seats of a show. Returns the entry, None if the show doesn't exist,
+    or dict with "error" if the request can never be served in the show's hall.
+    """
+    sm = seatmap.get(db, entry.show_id)
+    if sm is None:
+        return None
+    if entry.num_seats <= 0 or entry.num_seats > len(sm.hall.pos):
+        return {"error": "Invalid number of seats for this hall"}
+    if entry.consecutive and entry.num_seats > max((len(n) for n in sm.hall.numbers.values()), default=0):
+        return {"error": "No row in this hall is long enough"}
+    e = models.WaitlistEntry(**entry.dict(), status="waiting", created_at=datetime.utcnow())
+    db.add(e)
+    db.commit()
+    db.refresh(e)
+    # seats may already be free (e.g. the user gave up on /book_group/ a moment ago)
+    waitlist.seats_freed(entry.show_id)
+    return e
+
+def get_waitlist_entry(db: Session, entry_id: int):
+    return db.query(models.WaitlistEntry).filter(models.WaitlistEntry.id == entry_id).first()
+
+def leave_waitlist(db: Session, entry_id: int):
+    n = db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.id == entry_id, models.WaitlistEntry.status == "waiting"
+    ).update({"status": "cancelled"}, synchronize_session=False)
+    db.commit()
+    return n == 1
+
+def allocate_waitlist(db: Session, show_id: int):
+    """
+    Book free seats for waiting entries of a show, highest priority first, then FIFO.
+    An entry that doesn't fit yet is skipped, so a smaller request behind it can still be served.
+    Each entry is claimed with a conditional UPDATE and booked all-or-nothing in the same
+    transaction, so concurrent allocators never serve an entry twice.
+    Returns the fulfilled entries.
+    """
+    sm = seatmap.get(db, show_id)
+    if sm is None:
+        return []
+    W = models.WaitlistEntry
+    entries = (
+        db.query(W.id, W.user_id, W.num_seats, W.consecutive)
+        .filter(W.show_id == show_id, W.status == "waiting")
+        .order_by(W.priority.desc(), W.id)
+        .limit(waitlist.ALLOCATE_SCAN)
+        .all()
+    )
+    fulfilled = []
+    for e in entries:
+        seat_ids = waitlist.pick_seats(sm, e.num_seats, e.consecutive, held=holds.store.held_seats(show_id, except_user=e.user_id))
+        if seat_ids is None:
+            if not sm.available():
+                break  # sold out again
+            continue
+        claimed = db.query(W).filter(W.id == e.id, W.status == "waiting").update(
+            {"status": "fulfilled", "seat_ids": ",".join(map(str, seat_ids)), "fulfilled_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+        if not claimed:
+            db.rollback()
+            continue
+        bus.publish(db, "waitlist", e.id, "fulfilled")
+        # commits the claim and its event together with the bookings, or rolls all back
+        res = book_specific_seats(db, e.user_id, show_id, seat_ids, all_or_nothing=True)
+        if not res["success"]:
+            db.rollback()
+            continue
+        fulfilled.append(e.id)
+        waitlist.fulfilled(e.user_id, e.id, show_id, seat_ids, [b.id for b in res["success"]])
+    if not fulfilled:
+        return []
+    return db.query(W).filter(W.id.in_(fulfilled)).order_by(W.id).all()
 
 # ---------- User bookings ----------
-def bookings_for_user(db: Session, user_id: int):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+def _history(model, user_id: int, movie_id: int = None, show_id: int = None, after_booking_id: int = None):
+    stmt = (
+        select(model.id, model.show_id, models.Movie.title, models.Seat.row, models.Seat.number)
+        .outerjoin(models.Show, models.Show.id == model.show_id)
+        .outerjoin(models.Movie, models.Movie.id == models.Show.movie_id)
+        .outerjoin(models.Seat, models.Seat.id == model.seat_id)
+        .where(model.user_id == user_id)
+    )
+    if movie_id is not None:
+        stmt = stmt.where(models.Show.movie_id == movie_id)
+    if show_id is not None:
+        stmt = stmt.where(model.show_id == show_id)
+    if after_booking_id is not None:
+        stmt = stmt.where(model.id > after_booking_id)
+    return stmt
+
+def bookings_for_user(db: Session, user_id: int, after_booking_id: int = None, limit: int = None,
+                      movie_id: int = None, show_id: int = None, include_archived: bool = False):
+    """
+    Booking history as one joined projection (booking -> show -> movie, seat), so the
+    query count stays constant however many bookings the user has.
+    Keyset pagination: pass the previous page's `next_after` as `after_booking_id`.
+    `include_archived` merges in bookings moved to bookings_archive (see archive.py).
+    """
+    user = db.query(models.User.id, models.User.name).filter(models.User.id == user_id).first()
     if not user:
         return None
-    bookings = db.query(models.Booking).filter(models.Booking.user_id == user_id).all()
-    result = []
-    for b in bookings:
-        show = db.query(models.Show).filter(models.Show.id == b.show_id).first()
-        movie = db.query(models.Movie).filter(models.Movie.id == show.movie_id).first() if show else None
-        seat = db.query(models.Seat).filter(models.Seat.id == b.seat_id).first()
-        result.append({
-            "booking_id": b.id,
-            "movie_title": movie.title if movie else None,
-            "show_id": b.show_id,
-            "seat": f"{seat.row}{seat.number}" if seat else None
-        })
-    return {"user_id": user_id, "user_name": user.name, "bookings": result}
+    filters = {"movie_id": movie_id, "show_id": show_id, "after_booking_id": after_booking_id}
+    stmt = _history(models.Booking, user_id, **filters)
+    if include_archived:
+        # archived rows keep their booking id, and booking ids are never reused (see models.Booking)
+        merged = union_all(stmt, _history(models.ArchivedBooking, user_id, **filters)).subquery()
+        stmt = select(merged).order_by(merged.c.id)
+    else:
+        stmt = stmt.order_by(models.Booking.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = db.execute(stmt).all()
+    result = [{
+        "booking_id": r.id,
+        "movie_title": r.title,
+        "show_id": r.show_id,
+        "seat": f"{r.row}{r.number}" if r.row is not None else None
+    } for r in rows]
+    next_after = rows[-1].id if limit is not None and len(rows) == limit else None
+    return {"user_id": user_id, "user_name": user.name, "bookings": result, "next_after": next_after}
 
 # ---------- Analytics ----------
-def movie_analytics(db: Session, movie_id: int):
-    movie = db.query(models.Movie).filter(models.Movie.id == movie_id).first()
+def movie_analytics(db: Session, movie_id: int, include_archived: bool = False):
+    movie = db.query(models.Movie.id, models.Movie.title).filter(models.Movie.id == movie_id).first()
     if not movie:
         return None
-    total_tickets = db.query(func.count(models.Booking.id)).join(models.Show, models.Booking.show_id==models.Show.id).filter(models.Show.movie_id==movie_id).scalar()
-    gmv = (total_tickets or 0) * (movie.price or 0)
-    return {"movie_id": movie_id, "title": movie.title, "tickets_sold": total_tickets or 0, "gmv": float(gmv)}
+    # served from the movie_sales rollup; GMV uses the price each ticket was sold at
+    tickets, gmv = analytics.movie_totals(db, movie_id, include_archived=include_archived)
+    return {"movie_id": movie_id, "title": movie.title, "tickets_sold": tickets, "gmv": float(gmv)}
+
+# ---------- Idempotency keys (see idempotency.py) ----------
+def claim_idempotency_key(db: Session, scope: str, key: str, fingerprint: str, lease_seconds: float):
+    """
+    Claim a key for a request that's about to run. Returns None if the caller now owns it, else the
+    live row (fingerprint, status, body); status None means another request is still running it.
+    An expired row (replay TTL over, or a claim whose request never finished) is taken over.
+    """
+    K = models.IdempotencyKey
+    while True:
+        now = datetime.utcnow()
+        row = db.query(K.fingerprint, K.status, K.body, K.expires_at).filter(K.scope == scope, K.key == key).first()
+        if row is not None and row.expires_at > now:
+            return row
+        if row is not None:
+            db.query(K).filter(K.scope == scope, K.key == key, K.expires_at <= now).delete(synchronize_session=False)
+        res = db.execute(dialect_insert(db, K).values(
+            scope=scope, key=key, fingerprint=fingerprint, created_at=now, expires_at=now + timedelta(seconds=lease_seconds),
+        ).on_conflict_do_nothing(index_elements=["scope", "key"]))
+        db.commit()
+        if res.rowcount == 1:
+            return None
+        # another worker claimed it between the read and the insert: report that claim
+
+def finish_idempotency_key(db: Session, scope: str, key: str, status: int, body: bytes, ttl_seconds: float):
+    K = models.IdempotencyKey
+    db.query(K).filter(K.scope == scope, K.key == key, K.status.is_(None)).update(
+        {"status": status, "body": body, "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)},
+        synchronize_session=False,
+    )
+    db.commit()
+
+def release_idempotency_key(db: Session, scope: str, key: str):
+    """
+    Drop an unfinished claim (its request failed), so a retry runs again.
+    """
+    K = models.IdempotencyKey
+    db.query(K).filter(K.scope == scope, K.key == key, K.status.is_(None)).delete(synchronize_session=False)
+    db.commit()
+
+def prune_idempotency_keys(db: Session, max_keys: int):
+    """
+    Delete expired keys, then the stored responses closest to expiry beyond `max_keys`. Returns how many went.
+    """
+    K = models.IdempotencyKey
+    n = db.query(K).filter(K.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+    cutoff = db.query(K.expires_at).order_by(K.expires_at.desc()).offset(max_keys).limit(1).scalar()
+    if cutoff is not None:
+        n += db.query(K).filter(K.expires_at <= cutoff, K.status.isnot(None)).delete(synchronize_session=False)
+    db.commit()
+    return n
+
+# ---------- Demo data ----------
+def seed_demo(db: Session, **params):
+    """
+    Synthetic dataset (see seed.py); the defaults are a small demo. {"error"} for bad sizes.
+    """
+    try:
+        return seed.generate(db, **params)
+    except ValueError as e:
+        db.rollback()
+        return {"error": str(e)}
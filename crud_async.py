@@ -0,0 +1,120 @@
+"""
+Async versions of the crud (and analytics) functions, for use from the async routes.
+
+The logic lives in one place, the sync crud functions, and the sync crud API
+stays available for scripts, benchmarks and any callers that have not migrated
+yet. How a call is run depends on the database:
+
+- PostgreSQL: through AsyncSession.run_sync, so statements are awaited on
+  asyncpg and never block the event loop or occupy FastAPI's threadpool.
+- SQLite: the whole call runs on a thread with a sync session, reads on a small
+  reader pool (one thread per pooled connection) and writes one at a time on a
+  dedicated writer thread. aiosqlite is a thread per connection underneath and
+  costs an event-loop round trip for every execute, fetch and commit; with a
+  thousand requests in flight each round trip waits behind every other ready
+  coroutine, and a write transaction held SQLite's write lock through all of
+  them. One hop per call keeps that out of the tail latency, and the single
+  writer keeps write transactions from interleaving into "database is locked"
+  errors.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+import crud, analytics, provisioning
+from database import engine
+
+_sqlite_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+_sqlite_readers = ThreadPoolExecutor(max_workers=int(os.getenv("DB_POOL_SIZE") or 5), thread_name_prefix="sqlite-reader")
+# same settings as AsyncSessionLocal: results are used after the session is closed
+_ThreadSession = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def _call(fn, args, kwargs):
+    with _ThreadSession() as db:
+        return fn(db, *args, **kwargs)
+
+
+def _on_thread(executor, fn, args, kwargs):
+    # copy_context: the request's instrumentation stats follow the statements onto the thread
+    return asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, _call, fn, args, kwargs)
+
+
+def _async(fn):
+    @wraps(fn)
+    async def run(db: AsyncSession, *args, **kwargs):
+        if db.bind.dialect.name != "sqlite":
+            return await db.run_sync(fn, *args, **kwargs)
+        return await _on_thread(_sqlite_readers, fn, args, kwargs)
+    return run
+
+
+def _async_write(fn):
+    @wraps(fn)
+    async def run(db: AsyncSession, *args, **kwargs):
+        if db.bind.dialect.name != "sqlite":
+            return await db.run_sync(fn, *args, **kwargs)
+        return await _on_thread(_sqlite_writer, fn, args, kwargs)
+    return run
+
+
+# ---------- Catalog ----------
+create_movie = _async_write(crud.create_movie)
+list_movies = _async(crud.list_movies)
+create_theater = _async_write(crud.create_theater)
+list_theaters = _async(crud.list_theaters)
+create_hall = _async_write(crud.create_hall)
+list_halls = _async(crud.list_halls)
+create_show = _async_write(crud.create_show)
+list_shows = _async(crud.list_shows)
+get_show = _async(crud.get_show)
+search_shows = _async(crud.search_shows)
+import_batch = _async_write(provisioning.import_batch)
+list_seats_by_hall = _async(crud.list_seats_by_hall)
+create_user = _async_write(crud.create_user)
+list_users = _async(crud.list_users)
+
+# ---------- Bookings ----------
+create_booking = _async_write(crud.create_booking)
+list_bookings = _async(crud.list_bookings)
+cancel_booking = _async_write(crud.cancel_booking)
+cancel_bookings = _async_write(crud.cancel_bookings)
+book_consecutive_seats = _async_write(crud.book_consecutive_seats)
+book_specific_seats = _async_write(crud.book_specific_seats)
+suggest_alternate_shows_for_consecutive = _async(crud.suggest_alternate_shows_for_consecutive)
+
+# ---------- Seats / holds ----------
+available_seats_for_show = _async(crud.available_seats_for_show)
+seat_layout_for_show = _async(crud.seat_layout_for_show)
+seat_snapshot_for_show = _async(crud.seat_snapshot_for_show)
+seat_planes_for_show = _async(crud.seat_planes_for_show)
+hold_seats = _async_write(crud.hold_seats)
+confirm_hold = _async_write(crud.confirm_hold)
+release_hold = _async_write(crud.release_hold)
+
+# ---------- Waitlist ----------
+join_waitlist = _async_write(crud.join_waitlist)
+get_waitlist_entry = _async(crud.get_waitlist_entry)
+leave_waitlist = _async_write(crud.leave_waitlist)
+allocate_waitlist = _async_write(crud.allocate_waitlist)
+
+# ---------- History / analytics ----------
+bookings_for_user = _async(crud.bookings_for_user)
+movie_analytics = _async(crud.movie_analytics)
+top_movies = _async(analytics.top_movies)
+show_occupancy = _async(analytics.show_occupancy)
+hall_occupancy = _async(analytics.hall_occupancy)
+sales_series = _async(analytics.sales_series)
+rebuild_analytics = _async_write(analytics.rebuild)
+
+# ---------- Idempotency keys ----------
+claim_idempotency_key = _async_write(crud.claim_idempotency_key)
+finish_idempotency_key = _async_write(crud.finish_idempotency_key)
+release_idempotency_key = _async_write(crud.release_idempotency_key)
+prune_idempotency_keys = _async_write(crud.prune_idempotency_keys)
+
+# ---------- Demo data ----------
+seed_demo = _async_write(crud.seed_demo)
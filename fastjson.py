@@ -0,0 +1,80 @@
+"""
+Opt-in fast JSON path for large read responses (FAST_JSON=1).
+
+By default FastAPI validates every returned row against the route's
+response_model and then runs jsonable_encoder over the result. For pages of
+thousands of seats or bookings that costs more than the query. With
+FAST_JSON on, the hot read endpoints (/available_seats, /bookings/ and the
+cached catalog lists) encode their plain row tuples directly with orjson
+(stdlib json if orjson is not installed) and return the bytes.
+
+The fast path skips validation, so `verify` runs at startup. For each fast
+endpoint it checks that the projected columns are exactly the response
+model's fields, and that a sample row encodes to the same JSON the
+model would produce. An endpoint that fails the check keeps the default path
+and a warning is logged.
+
+    FAST_JSON=1      enable the fast path (default off)
+"""
+import json
+import logging
+from fastapi.encoders import jsonable_encoder
+from database import _env_bool
+
+try:
+    import orjson  # optional: several times faster than json.dumps, returns bytes
+except ImportError:
+    orjson = None
+
+FAST_JSON = _env_bool("FAST_JSON", False)
+
+log = logging.getLogger("moviebooking.fastjson")
+
+_verified = set()
+
+
+def _default(o):
+    # datetimes (shows.start_time) in the same ISO form the response models produce
+    return o.isoformat()
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default)
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=_default).encode()
+
+
+def rows(fields, tuples) -> bytes:
+    """
+    JSON array of objects from row tuples, keys taken from `fields`.
+    """
+    return dumps([dict(zip(fields, t)) for t in tuples])
+
+
+def _model_fields(schema):
+    fields = getattr(schema, "model_fields", None)
+    return tuple(fields if fields is not None else schema.__fields__)
+
+
+def verify(name: str, schema, fields, sample) -> bool:
+    """
+    Check that `fields` / a `sample` row encode like `schema` does; enable the fast path for `name` if so.
+    """
+    expected = _model_fields(schema)
+    if set(fields) != set(expected) or len(fields) != len(expected):
+        log.warning("fast JSON disabled for %s: columns %s != %s fields %s", name, tuple(fields), schema.__name__, expected)
+        return False
+    row = dict(zip(fields, sample))
+    # compared as canonical JSON text: decoded values would let 1 == true slip through
+    fast = json.dumps(json.loads(dumps([row])), sort_keys=True)
+    if fast != json.dumps([jsonable_encoder(schema(**row))], sort_keys=True):
+        log.warning("fast JSON disabled for %s: encoding differs from %s", name, schema.__name__)
+        return False
+    _verified.add(name)
+    return True
+
+
+def enabled(name: str) -> bool:
+    return FAST_JSON and name in _verified
@@ -0,0 +1,240 @@
+"""
+Seat holds: short-lived reservations that sit in front of the Booking table.
+
+A hold pins seats for one user until it expires, is confirmed (turned into
+bookings) or is released. Holds are rows of seat_holds, one per seat, so every
+worker process sees the same ones: the table's primary key (show, seat) lets
+only one live hold per seat in, whichever worker takes it. Rows of expired
+holds are deleted by the next hold.
+
+Reads (available seats, layouts, the consecutive-seat finder) look at an
+in-memory copy per process instead of the table. Expiry is handled there by
+a min-heap of (expires_at, hold_id) that is swept lazily on every store
+access; expires_at is wall-clock time, so every worker expires a hold at the
+same moment. The worker that takes or releases a hold updates its copy right
+after the commit; the others reload the show's holds from the table when the
+change_log event arrives (see bus.py), within a poll interval. Bookings don't
+wait for that: they check the table as well (`held_seats(..., db=db)`).
+
+Every hold and release is published to broker.py so /seat_updates
+subscribers see it.
+"""
+import heapq
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+import broker, bus, models
+
+DEFAULT_TTL = 300  # seconds
+MAX_TTL = 900
+
+
+def _utc(ts: float) -> datetime:
+    # seat_holds.expires_at is naive UTC, like every other timestamp in the schema
+    return datetime.utcfromtimestamp(ts)
+
+
+def _epoch(dt: datetime) -> float:
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+class Hold:
+    __slots__ = ("hold_id", "user_id", "show_id", "seat_ids", "expires_at")
+
+    def __init__(self, hold_id, user_id, show_id, seat_ids, expires_at):
+        self.hold_id = hold_id
+        self.user_id = user_id
+        self.show_id = show_id
+        self.seat_ids = seat_ids
+        self.expires_at = expires_at
+
+
+def _from_rows(rows):
+    """
+    Holds from seat_holds rows (show_id, seat_id, hold_id, user_id, expires_at), by hold id.
+    """
+    found = {}
+    for r in rows:
+        h = found.get(r.hold_id)
+        if h is None:
+            h = found[r.hold_id] = Hold(r.hold_id, r.user_id, r.show_id, [], _epoch(r.expires_at))
+        h.seat_ids.append(r.seat_id)
+    return found
+
+
+class HoldStore:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._holds = {}    # hold_id -> Hold
+        self._by_show = {}  # show_id -> {seat_id: hold_id}
+        self._heap = []     # (expires_at, hold_id)
+
+    def sweep(self):
+        """
+        Drop every hold whose TTL has passed. Returns the expired holds.
+        """
+        now = self.clock()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, hold_id = heapq.heappop(self._heap)
+                h = self._holds.get(hold_id)
+                if h is not None and h.expires_at <= now:
+                    self._drop(h)
+                    expired.append(h)
+        return expired
+
+    def _add(self, h: Hold):
+        self._holds[h.hold_id] = h
+        seats = self._by_show.setdefault(h.show_id, {})
+        for sid in h.seat_ids:
+            seats[sid] = h.hold_id
+        heapq.heappush(self._heap, (h.expires_at, h.hold_id))
+
+    def _drop(self, h: Hold):
+        del self._holds[h.hold_id]
+        seats = self._by_show.get(h.show_id, {})
+        released = []
+        for sid in h.seat_ids:
+            if seats.get(sid) == h.hold_id:
+                del seats[sid]
+                released.append(sid)
+        if not seats:
+            self._by_show.pop(h.show_id, None)
+        broker.seat_event(h.show_id, released=released)
+
+    def hold(self, db, user_id: int, show_id: int, seat_ids, ttl: float = DEFAULT_TTL):
+        """
+        Hold every seat or none. Returns (Hold, []) on success, (None, conflicting seat ids) otherwise.
+        """
+        self.sweep()
+        seat_ids = list(dict.fromkeys(seat_ids))
+        with self._lock:
+            seats = self._by_show.get(show_id, {})
+            taken = [sid for sid in seat_ids if sid in seats]
+        if taken:
+            return None, taken
+        now = self.clock()
+        h = Hold(uuid.uuid4().hex, user_id, show_id, seat_ids, now + ttl)
+        SH = models.SeatHold
+        try:
+            db.execute(delete(SH).where(SH.expires_at <= _utc(now)))
+            db.execute(SH.__table__.insert(), [
+                {"show_id": show_id, "seat_id": sid, "hold_id": h.hold_id, "user_id": user_id, "expires_at": _utc(h.expires_at)}
+                for sid in seat_ids
+            ])
+            bus.publish(db, "holds", show_id, "held", seat_ids)
+            db.commit()
+        except IntegrityError:
+            # held in another worker since its change reached this one
+            db.rollback()
+            taken = db.execute(select(SH.seat_id).where(
+                SH.show_id == show_id, SH.seat_id.in_(seat_ids), SH.expires_at > _utc(now),
+            )).scalars().all()
+            db.rollback()
+            return None, sorted(taken) or seat_ids
+        with self._lock:
+            self._add(h)
+            broker.seat_event(show_id, held=seat_ids)
+        return h, []
+
+    def get(self, db, hold_id: str):
+        """
+        The live hold with this id, also if another worker took it and its change hasn't arrived yet.
+        """
+        self.sweep()
+        with self._lock:
+            h = self._holds.get(hold_id)
+        if h is not None:
+            return h
+        SH = models.SeatHold
+        rows = db.execute(
+            select(SH.show_id, SH.seat_id, SH.hold_id, SH.user_id, SH.expires_at)
+            .where(SH.hold_id == hold_id, SH.expires_at > _utc(self.clock()))
+            .order_by(SH.seat_id)
+        ).all()
+        return _from_rows(rows).get(hold_id)
+
+    def release(self, db, hold_id: str):
+        h = self.get(db, hold_id)
+        if h is None:
+            return None
+        SH = models.SeatHold
+        db.execute(delete(SH).where(SH.hold_id == hold_id))
+        bus.publish(db, "holds", h.show_id, "released", h.seat_ids)
+        db.commit()
+        with self._lock:
+            if h.hold_id in self._holds:
+                self._drop(h)
+            else:
+                broker.seat_event(h.show_id, released=h.seat_ids)
+        return h
+
+    def held_seats(self, show_id: int, except_user: int = None, db=None):
+        """
+        Seat ids currently held for a show, optionally ignoring one user's own holds.
+        With `db`, holds other workers took that haven't reached this process yet count too
+        (one query; the booking paths pass it, reads don't).
+        """
+        self.sweep()
+        with self._lock:
+            seats = self._by_show.get(show_id)
+            if not seats:
+                held = set()
+            elif except_user is None:
+                held = set(seats)
+            else:
+                held = {sid for sid, hid in seats.items() if self._holds[hid].user_id != except_user}
+        if db is not None:
+            held.update(sid for sid, uid in self.holders(db, show_id).items() if uid != except_user)
+        return held
+
+    def holders(self, db, show_id: int):
+        """
+        {seat_id: user_id} for the live holds of a show in seat_holds, whichever worker took them.
+        """
+        SH = models.SeatHold
+        return dict(db.execute(
+            select(SH.seat_id, SH.user_id).where(SH.show_id == show_id, SH.expires_at > _utc(self.clock()))
+        ).all())
+
+    def reload(self, conn, show_ids=None):
+        """
+        Replace the holds of `show_ids` (every show if None) with the live rows of seat_holds, after
+        another worker took or released some. The rows are read under the store lock in a fresh
+        transaction, so a hold this process commits meanwhile is either among them or added after.
+        """
+        SH = models.SeatHold
+        with self._lock:
+            conn.rollback()
+            stmt = select(SH.show_id, SH.seat_id, SH.hold_id, SH.user_id, SH.expires_at).where(SH.expires_at > _utc(self.clock()))
+            if show_ids is not None:
+                stmt = stmt.where(SH.show_id.in_(list(show_ids)))
+            loaded = _from_rows(conn.execute(stmt).all())
+            conn.rollback()
+            shows = set(self._by_show) | {h.show_id for h in loaded.values()} if show_ids is None else set(show_ids)
+            before = {s: set(self._by_show.pop(s, ())) for s in shows}
+            for hold_id in [hid for hid, h in self._holds.items() if h.show_id in shows]:
+                del self._holds[hold_id]
+            for h in loaded.values():
+                self._add(h)
+            for s in shows:
+                after = set(self._by_show.get(s, ()))
+                if after != before[s]:
+                    broker.seat_event(s, held=sorted(after - before[s]), released=sorted(before[s] - after))
+
+    def expires_in(self, h: Hold) -> float:
+        return max(0.0, h.expires_at - self.clock())
+
+    def clear(self):
+        with self._lock:
+            self._holds.clear()
+            self._by_show.clear()
+            self._heap.clear()
+
+
+store = HoldStore()
@@ -0,0 +1,137 @@
+"""
+Idempotency keys for the booking endpoints.
+
+A client that sends `Idempotency-Key: <key>` with POST /bookings/,
+/book_group/ or /book_group_seats/ gets the original response back for
+every retry with the same key, without the booking being attempted again.
+Replays carry an `Idempotent-Replayed: true` header.
+
+Keys are stored per (endpoint, key) in the idempotency_keys table, so every
+worker process sees the same ones. The first request for a key claims it
+with an insert (the primary key lets exactly one claim win, whichever worker
+makes it), runs, and stores its response, which is then replayed for
+IDEMPOTENCY_TTL (default 24h). A duplicate that arrives while the first is
+still running waits for its result: on the first request's future in the
+same process, by polling the row from another worker. A claim is a lease of
+IDEMPOTENCY_LEASE seconds, so a key whose request never finished (worker
+killed, client went away) is taken over once the lease runs out.
+
+Each key keeps a fingerprint of the request body: reusing a key with a
+different body is rejected with 422. Successful responses and 4xx outcomes
+(seat taken, show not found) are stored; exceptions are not and drop the
+claim, so a retry after a server error runs again.
+
+Every PRUNE_SECONDS a keyed request deletes the expired keys, and the table
+is capped at IDEMPOTENCY_MAX_KEYS rows (stored responses closest to expiry
+go first).
+
+    IDEMPOTENCY_TTL=86400          seconds a stored response is replayed
+    IDEMPOTENCY_LEASE=60           seconds a running request keeps its claim
+    IDEMPOTENCY_MAX_KEYS=1000000   rows kept in idempotency_keys
+"""
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+import crud_async
+from database import AsyncSessionLocal
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "60"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "1000000"))
+MAX_KEY_LENGTH = 255
+PRUNE_SECONDS = 60
+WAIT_POLL = 0.05  # seconds between checks on a key another worker is running
+
+
+class KeyReused(Exception):
+    """
+    The key was already used with a different request body.
+    """
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL, lease: int = IDEMPOTENCY_LEASE,
+                 max_keys: int = IDEMPOTENCY_MAX_KEYS, clock=time.monotonic):
+        self.ttl = ttl
+        self.lease = lease
+        self.max_keys = max_keys
+        self.clock = clock
+        self.executions = 0
+        self.replays = 0
+        self.coalesced = 0
+        self._next_prune = 0
+        self._inflight = weakref.WeakKeyDictionary()  # event loop -> {(scope, key): (fingerprint, future)}
+
+    @staticmethod
+    def fingerprint(body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    async def execute(self, scope: str, key: str, body: bytes, run):
+        """
+        (status, body bytes, replayed) for `key` under `scope`. `run` is a coroutine factory
+        returning (status, body bytes); it is called at most once per key while the result is kept.
+        """
+        skey = (scope, key)
+        fp = self.fingerprint(body)
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(loop)
+        if inflight is None:
+            inflight = self._inflight[loop] = {}
+        pending = inflight.get(skey)
+        if pending is not None:
+            pending_fp, fut = pending
+            if pending_fp != fp:
+                raise KeyReused()
+            self.coalesced += 1
+            status, out = await asyncio.shield(fut)
+            return status, out, True
+        fut = loop.create_future()
+        inflight[skey] = (fp, fut)
+        try:
+            async with AsyncSessionLocal() as db:
+                status, out, replayed = await self._claim_and_run(db, scope, key, fp, run)
+            fut.set_result((status, out))
+            return status, out, replayed
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # retrieved here, so an unawaited future doesn't log it
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()  # the first request was cancelled (client went away)
+            del inflight[skey]
+
+    async def _claim_and_run(self, db, scope: str, key: str, fp: str, run):
+        if self.clock() >= self._next_prune:
+            self._next_prune = self.clock() + PRUNE_SECONDS
+            await crud_async.prune_idempotency_keys(db, self.max_keys)
+        waited = False
+        while True:
+            row = await crud_async.claim_idempotency_key(db, scope, key, fp, self.lease)
+            if row is None:
+                break
+            if row.fingerprint != fp:
+                raise KeyReused()
+            if row.status is not None:
+                self.replays += 1
+                return row.status, row.body, True
+            if not waited:
+                self.coalesced += 1  # another worker is running it
+                waited = True
+            await asyncio.sleep(WAIT_POLL)
+        self.executions += 1
+        try:
+            status, out = await run()
+        except Exception:
+            await crud_async.release_idempotency_key(db, scope, key)
+            raise
+        await crud_async.finish_idempotency_key(db, scope, key, status, out, self.ttl)
+        return status, out, False
+
+    def metrics(self):
+        return {"executions": self.executions, "replays": self.replays, "coalesced": self.coalesced}
+
+
+store = IdempotencyStore()
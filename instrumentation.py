@@ -0,0 +1,241 @@
+"""
+Per-request DB instrumentation and Prometheus metrics.
+
+For every HTTP request the ASGI middleware opens a RequestStats in a
+contextvar. SQLAlchemy event hooks fill it in: cursor events on every engine
+built by database.make_engine / make_async_engine count statements and DB
+time, the ORM execute hook counts the rows queries return, and the mapper
+load hook counts ORM objects hydrated. When the request ends, the numbers go
+into histograms labelled by route template (e.g. "/user_bookings/{user_id}").
+GET /metrics serves them in the Prometheus text format.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters on
+the "moviebooking.slow_query" logger, with or without a request.
+Outside a request (scripts, background allocation) only the slow-query log
+is active.
+
+    METRICS=0            disable the middleware and hooks
+    SLOW_QUERY_MS=200    slow-query threshold in milliseconds
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper, Session
+from database import _env_bool
+
+METRICS = _env_bool("METRICS", True)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+slow_log = logging.getLogger("moviebooking.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000, 10000)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "rows", "objects")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.objects = 0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets, labels=("route",)):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for values, s in sorted(series.items()):
+            lbl = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values))
+            cumulative = 0
+            for bound, n in zip(self.buckets, s):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{lbl},le="{bound}"}} {cumulative}')
+            out.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {s[-1]}')
+            out.append(f"{self.name}_sum{{{lbl}}} {s[-2]}")
+            out.append(f"{self.name}_count{{{lbl}}} {s[-1]}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), n: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + n
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for lv, v in sorted(values.items()):
+            lbl = ",".join(f'{k}="{_escape(x)}"' for k, x in zip(self.labels, lv))
+            out.append(f"{self.name}{{{lbl}}} {v}" if lbl else f"{self.name} {v}")
+        return out
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_seconds = Histogram("http_request_duration_seconds", "Request latency", LATENCY_BUCKETS, ("route", "method"))
+db_statements = Histogram("db_statements_per_request", "SQL statements executed per request", COUNT_BUCKETS)
+db_seconds = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per request", LATENCY_BUCKETS)
+db_rows = Histogram("db_rows_per_request", "Rows returned by SELECTs or written by DML per request", COUNT_BUCKETS)
+orm_objects = Histogram("orm_objects_per_request", "ORM objects hydrated per request", COUNT_BUCKETS)
+requests_total = Counter("http_requests_total", "Requests by route, method and status", ("route", "method", "status"))
+slow_queries = Counter("db_slow_queries_total", f"Statements slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)")
+
+HISTOGRAMS = (request_seconds, db_statements, db_seconds, db_rows, orm_objects)
+
+
+# ---------- SQLAlchemy hooks ----------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    st = _record(elapsed, statement, parameters)
+    if st is not None and context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        st.rows += max(cursor.rowcount, 0)
+
+
+def _handle_error(ctx):
+    # after_cursor_execute never runs for a statement that raises (e.g. a unique-constraint
+    # conflict), so its start time is popped here; fetch / commit errors come without a statement
+    conn = ctx.connection
+    if conn is None or ctx.statement is None or not conn.info.get("query_start"):
+        return
+    _record(time.perf_counter() - conn.info["query_start"].pop(), ctx.statement, ctx.parameters)
+
+
+def _record(elapsed, statement, parameters):
+    st = _current.get()
+    if st is not None:
+        st.statements += 1
+        st.db_time += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc()
+        slow_log.warning("slow query %.1f ms: %s | params=%.500r", elapsed * 1000, " ".join(statement.split()), parameters)
+    return st
+
+
+def _do_orm_execute(state):
+    st = _current.get()
+    if st is None or not state.is_select:
+        return None
+    opts = state.execution_options
+    if opts.get("yield_per") or opts.get("stream_results"):
+        return None  # streamed on purpose; don't buffer it to count rows
+    # freeze() buffers the rows the caller was about to fetch anyway; hand back an equivalent result
+    frozen = state.invoke_statement().freeze()
+    st.rows += len(frozen.data)
+    return frozen()
+
+
+def _on_load(target, context):
+    st = _current.get()
+    if st is not None:
+        st.objects += 1
+
+
+def instrument_engine(engine):
+    """
+    Attach the statement hooks to a (sync) Engine. Called by database.make_engine / make_async_engine.
+    """
+    if METRICS and not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+if METRICS:
+    event.listen(Session, "do_orm_execute", _do_orm_execute)
+    event.listen(Mapper, "load", _on_load)
+
+
+# ---------- ASGI middleware ----------
+class MetricsMiddleware:
+    """
+    Times each HTTP request and records its DB counters under the matched route template.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS:
+            return await self.app(scope, receive, send)
+        st = RequestStats()
+        token = _current.set(st)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            if route != "/metrics":
+                record(route, scope["method"], status[0], time.perf_counter() - t0, st)
+
+
+def record(route: str, method: str, status: int, seconds: float, st: RequestStats):
+    request_seconds.observe((route, method), seconds)
+    db_statements.observe((route,), st.statements)
+    db_seconds.observe((route,), st.db_time)
+    db_rows.observe((route,), st.rows)
+    orm_objects.observe((route,), st.objects)
+    requests_total.inc((route, method, str(status)))
+
+
+def render(extra_gauges=None) -> str:
+    """
+    Every metric in the Prometheus text exposition format. `extra_gauges` maps name -> (help, value).
+    """
+    lines = []
+    for h in HISTOGRAMS:
+        lines += h.render()
+    lines += requests_total.render()
+    lines += slow_queries.render()
+    for name, (help, value) in (extra_gauges or {}).items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -1,18 +1,97 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
-import crud, schemas, models
-from database import Base, engine, get_db
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+import asyncio
+import codecs
+import csv
+import gzip
+import json
+import crud, crud_async, schemas, models, holds, provisioning, cache, migrations, seatmap, waitlist, instrumentation, booking_queue, idempotency, fastjson, bus
+from broker import broker
+from database import engine, get_async_db, SessionLocal, AsyncSessionLocal
 
-# Create DB tables
-Base.metadata.create_all(bind=engine)
+try:
+    import brotli  # optional: br Content-Encoding for the packed seat formats
+except ImportError:
+    brotli = None
+
+# Create / upgrade DB tables (see migrations.py)
+migrations.upgrade(engine)
+# follow the other workers' writes to keep seat maps and cached lists current (see bus.py)
+bus.start(engine)
 
 # FastAPI instance
 app = FastAPI(title="Movie Booking API")
+# per-request query count / DB time / rows / ORM objects, served at /metrics (see instrumentation.py)
+app.add_middleware(instrumentation.MetricsMiddleware)
+
+# Fast JSON path (FAST_JSON=1, see fastjson.py): row tuples encoded directly, checked against the response models here
+if fastjson.FAST_JSON:
+    for name, schema, fields, sample in (
+        ("movies", schemas.Movie, crud.LIST_FIELDS[models.Movie], (1, "Title", 12.5)),
+        ("theaters", schemas.Theater, crud.LIST_FIELDS[models.Theater], (1, "Theater")),
+        ("halls", schemas.Hall, crud.LIST_FIELDS[models.Hall], (1, "Hall", 1)),
+        ("shows", schemas.Show, crud.LIST_FIELDS[models.Show], (1, "18:00", datetime(2026, 1, 1, 18, 0), 1, 1)),
+        ("users", schemas.User, crud.LIST_FIELDS[models.User], (1, "Name", "name@example.com")),
+        ("bookings", schemas.Booking, crud.LIST_FIELDS[models.Booking], (1, 2, 3, 4)),
+        ("seats", schemas.Seat, crud.LIST_FIELDS[models.Seat], (1, "A", 1, 1, True)),
+        ("available_seats", schemas.AvailableSeat, ("seat_id", "seat"), (1, "A1")),
+    ):
+        fastjson.verify(name, schema, fields, sample)
+
+def _fast_rows(fields, rows, limit=None):
+    headers = {"X-Next-After": str(rows[-1].id)} if limit is not None and len(rows) == limit else None
+    return Response(content=fastjson.rows(fields, rows), media_type="application/json", headers=headers)
+
+# List endpoints: keyset pagination (?after_id=&limit=) or NDJSON streaming (?stream=true)
+MAX_PAGE = 1000
+
+def _list_response(response: Response, rows, limit):
+    # next page cursor rides in a header so the body stays a plain list
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-After"] = str(rows[-1].id)
+    return rows
+
+async def _cached_list(request: Request, tag: str, load, limit=None):
+    """
+    Read-through cache (see cache.py): pre-serialized JSON + ETag, 304 on If-None-Match.
+    `load` is a coroutine factory returning projected rows.
+    """
+    ckey = cache.responses.key_for(tag, request.url.path + "?" + request.url.query)
+    hit = cache.responses.get(ckey)
+    if hit is None:
+        rows = await load()
+        if fastjson.enabled(tag.split(":")[0]):
+            body = fastjson.rows(rows[0]._fields, rows) if rows else b"[]"
+        else:
+            body = json.dumps([dict(r._mapping) for r in rows], separators=(",", ":"), default=fastjson._default).encode()
+        next_after = rows[-1].id if limit is not None and len(rows) == limit else None
+        hit = cache.responses.put(ckey, body, next_after)
+    etag, next_after, body = hit
+    headers = {"ETag": etag}
+    if next_after is not None:
+        headers["X-Next-After"] = next_after
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _ndjson(model, after_id):
+    def gen():
+        # own session: the request's session is closed before the body is streamed
+        db = SessionLocal()
+        try:
+            for rows in crud.stream_rows(db, model, after_id):
+                yield "".join(json.dumps(r, default=fastjson._default) + "\n" for r in rows)
+        finally:
+            db.close()
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
 
 # Root endpoint with friendly HTML
 @app.get("/", response_class=HTMLResponse, tags=["Root"])
-def read_root():
+async def read_root():
     html_content = """
     <html>
         <head>
@@ -32,141 +111,543 @@ def read_root():
 
 # Movies
 @app.post("/movies/", response_model=schemas.Movie)
-def create_movie(movie: schemas.MovieCreate, db: Session = Depends(get_db)):
-    return crud.create_movie(db, movie)
+async def create_movie(movie: schemas.MovieCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.create_movie(db, movie)
 
 @app.get("/movies/", response_model=list[schemas.Movie])
-def list_movies(db: Session = Depends(get_db)):
-    return crud.list_movies(db)
+async def list_movies(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.Movie, after_id)
+    return await _cached_list(request, "movies", lambda: crud_async.list_movies(db, after_id, limit), limit)
 
 # Theaters
 @app.post("/theaters/", response_model=schemas.Theater)
-def create_theater(theater: schemas.TheaterCreate, db: Session = Depends(get_db)):
-    return crud.create_theater(db, theater)
+async def create_theater(theater: schemas.TheaterCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.create_theater(db, theater)
 
 @app.get("/theaters/", response_model=list[schemas.Theater])
-def list_theaters(db: Session = Depends(get_db)):
-    return crud.list_theaters(db)
+async def list_theaters(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.Theater, after_id)
+    return await _cached_list(request, "theaters", lambda: crud_async.list_theaters(db, after_id, limit), limit)
 
 # Halls (auto-seed seats)
 @app.post("/halls/", response_model=schemas.Hall)
-def create_hall(hall: schemas.HallCreate, db: Session = Depends(get_db)):
-    # default rows=5, seats_per_row=6 (change by editing crud.create_hall call)
-    return crud.create_hall(db, hall, num_rows=5, seats_per_row=6)
+async def create_hall(hall: schemas.HallCreate, db: AsyncSession = Depends(get_async_db)):
+    # default rows=5, seats_per_row=6 unless the request carries a layout
+    res = await crud_async.create_hall(db, hall, num_rows=5, seats_per_row=6)
+    if isinstance(res, dict) and res.get("error"):
+        raise HTTPException(status_code=400, detail=res["error"])
+    return res
 
 @app.get("/halls/", response_model=list[schemas.Hall])
-def list_halls(db: Session = Depends(get_db)):
-    return crud.list_halls(db)
+async def list_halls(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.Hall, after_id)
+    return await _cached_list(request, "halls", lambda: crud_async.list_halls(db, after_id, limit), limit)
+
+# Bulk provisioning: NDJSON (one record per line) or CSV with a header row.
+# Record fields: theater, hall, rows, seats_per_row, row_counts, layout, movie, price, time
+async def _lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    lineno = 0
+    async for chunk in request.stream():
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            lineno += 1
+            if line.strip():
+                yield lineno, line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf.strip():
+        yield lineno + 1, buf.rstrip("\r")
+
+@app.post("/import/", response_model=schemas.ImportResult, summary="Provision theaters, halls and shows from a streamed NDJSON/CSV upload")
+async def bulk_import(
+    request: Request,
+    batch_size: int = Query(provisioning.IMPORT_BATCH, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    is_csv = "csv" in request.headers.get("content-type", "")
+    st = provisioning.ImportState()
+    header = None
+    batch = []
+    async for lineno, line in _lines(request):
+        if is_csv:
+            row = [v.strip() for v in next(csv.reader([line]))]
+            if header is None:
+                header = row
+                continue
+            rec = dict(zip(header, row))
+        else:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                rec = None
+            if not isinstance(rec, dict):
+                st.errors.append((lineno, "Invalid JSON object"))
+                continue
+        batch.append((lineno, rec))
+        if len(batch) >= batch_size:
+            await crud_async.import_batch(db, batch, st)
+            batch = []
+    if batch:
+        await crud_async.import_batch(db, batch, st)
+    return {"created": st.created, "errors": [{"line": line, "error": err} for line, err in sorted(st.errors)]}
 
 # Shows
 @app.post("/shows/", response_model=schemas.Show)
-def create_show(show: schemas.ShowCreate, db: Session = Depends(get_db)):
-    return crud.create_show(db, show)
+async def create_show(show: schemas.ShowCreate, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.create_show(db, show)
+    if isinstance(res, dict) and res.get("error"):
+        raise HTTPException(status_code=400, detail=res["error"])
+    return res
+
+@app.get("/shows/search", response_model=list[schemas.ShowSearchResult], summary="Shows by movie / theater / time window with seats remaining")
+async def search_shows(
+    movie_id: Optional[int] = None,
+    theater_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="earliest start time (inclusive)"),
+    end: Optional[datetime] = Query(None, description="latest start time (exclusive)"),
+    min_seats: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    rows = await crud_async.search_shows(db, movie_id=movie_id, theater_id=theater_id, start=start, end=end, min_seats=min_seats, limit=limit)
+    return [schemas.ShowSearchResult(show_id=r.id, time=r.time, start_time=r.start_time, movie_id=r.movie_id, title=r.title,
+                                     theater_id=r.theater_id, hall_id=r.hall_id, hall=r.hall, capacity=r.capacity,
+                                     seats_remaining=r.seats_remaining) for r in rows]
 
 @app.get("/shows/", response_model=list[schemas.Show])
-def list_shows(db: Session = Depends(get_db)):
-    return crud.list_shows(db)
+async def list_shows(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.Show, after_id)
+    return await _cached_list(request, "shows", lambda: crud_async.list_shows(db, after_id, limit), limit)
 
 # Seats listing by hall
 @app.get("/seats/{hall_id}", response_model=list[schemas.Seat])
-def list_seats(hall_id: int, db: Session = Depends(get_db)):
-    return crud.list_seats_by_hall(db, hall_id)
+async def list_seats(hall_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await _cached_list(request, f"seats:{hall_id}", lambda: crud_async.list_seats_by_hall(db, hall_id))
 
 # Users
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    return crud.create_user(db, user)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.create_user(db, user)
 
 @app.get("/users/", response_model=list[schemas.User])
-def list_users(db: Session = Depends(get_db)):
-    return crud.list_users(db)
+async def list_users(
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.User, after_id)
+    return _list_response(response, await crud_async.list_users(db, after_id, limit), limit)
+
+# Bookings: optional Idempotency-Key header, retries replay the stored response (see idempotency.py)
+IDEMPOTENCY_KEY = Header(None, alias="Idempotency-Key", max_length=idempotency.MAX_KEY_LENGTH)
+
+async def _idempotent(scope: str, key: Optional[str], req, handler):
+    """
+    Run `handler()` once per idempotency key; without a key it just runs.
+    2xx and 4xx outcomes are stored and replayed as the same status and JSON body.
+    """
+    if key is None:
+        return await handler()
+
+    async def run():
+        try:
+            result = await handler()
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            return e.status_code, json.dumps({"detail": e.detail}).encode()
+        return 200, json.dumps(jsonable_encoder(result), separators=(",", ":")).encode()
+
+    try:
+        status, body, replayed = await idempotency.store.execute(scope, key, json.dumps(req.dict(), sort_keys=True).encode(), run)
+    except idempotency.KeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(content=body, status_code=status, media_type="application/json", headers=headers)
 
 # Bookings (single)
-@app.post("/bookings/", response_model=schemas.Booking)
-def create_booking(booking: schemas.BookingCreate, db: Session = Depends(get_db)):
-    res = crud.create_booking(db, booking)
+async def _create_booking(booking: schemas.BookingCreate, db: AsyncSession):
+    if booking_queue.ENABLED:
+        res = await booking_queue.submit(booking.user_id, booking.show_id, seat_ids=[booking.seat_id])
+        if not res["success"]:
+            raise HTTPException(status_code=400, detail=res.get("error", "Seat already booked for this show"))
+        return schemas.Booking(id=res["success"][0].id, **booking.dict())
+    res = await crud_async.create_booking(db, booking)
     if isinstance(res, dict) and res.get("error"):
         raise HTTPException(status_code=400, detail=res["error"])
-    return res
+    return schemas.Booking(id=res.id, **booking.dict())
+
+@app.post("/bookings/", response_model=schemas.Booking)
+async def create_booking(booking: schemas.BookingCreate, idempotency_key: Optional[str] = IDEMPOTENCY_KEY, db: AsyncSession = Depends(get_async_db)):
+    return await _idempotent("bookings", idempotency_key, booking, lambda: _create_booking(booking, db))
 
 @app.get("/bookings/", response_model=list[schemas.Booking])
-def list_bookings(db: Session = Depends(get_db)):
-    return crud.list_bookings(db)
+async def list_bookings(
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return _ndjson(models.Booking, after_id)
+    rows = await crud_async.list_bookings(db, after_id, limit)
+    if fastjson.enabled("bookings"):
+        return _fast_rows(crud.LIST_FIELDS[models.Booking], rows, limit)
+    return _list_response(response, rows, limit)
 
 # Cancel single booking
 @app.delete("/bookings/{booking_id}")
-def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
-    return crud.cancel_booking(db, booking_id)
+async def cancel_booking(booking_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.cancel_booking(db, booking_id)
+    background_tasks.add_task(_allocate_waitlists)
+    return res
 
 # Group booking - consecutive seats auto-find
-@app.post("/book_group/", summary="Book N consecutive seats for a show (auto-find)")
-def book_group_consecutive(req: schemas.GroupBookingRequest, db: Session = Depends(get_db)):
-    bookings = crud.book_consecutive_seats(db, req.show_id, req.num_seats, req.user_id)
+async def _book_group_consecutive(req: schemas.GroupBookingRequest, db: AsyncSession):
+    if booking_queue.ENABLED:
+        bookings = (await booking_queue.submit(req.user_id, req.show_id, num_seats=req.num_seats))["success"]
+    else:
+        bookings = await crud_async.book_consecutive_seats(db, req.show_id, req.num_seats, req.user_id)
     if bookings:
         return {"message": f"Booked {len(bookings)} seats", "bookings": [{"id": b.id, "seat_id": b.seat_id} for b in bookings]}
     # suggest alternate shows
-    show = db.query(models.Show).filter(models.Show.id == req.show_id).first()
-    suggestions = crud.suggest_alternate_shows_for_consecutive(db, show.movie_id, req.num_seats) if show else []
+    show = await crud_async.get_show(db, req.show_id)
+    suggestions = await crud_async.suggest_alternate_shows_for_consecutive(db, show.movie_id, req.num_seats) if show else []
     return {"error": "Could not find consecutive seats", "suggestions": suggestions}
 
+@app.post("/book_group/", summary="Book N consecutive seats for a show (auto-find)")
+async def book_group_consecutive(req: schemas.GroupBookingRequest, idempotency_key: Optional[str] = IDEMPOTENCY_KEY, db: AsyncSession = Depends(get_async_db)):
+    return await _idempotent("book_group", idempotency_key, req, lambda: _book_group_consecutive(req, db))
+
 # Group booking by explicit seat ids (friends choose seats)
-@app.post("/book_group_seats/", summary="Book specific seat ids as a group")
-def book_group_seats(req: schemas.GroupSeatBookingRequest, db: Session = Depends(get_db)):
-    res = crud.book_specific_seats(db, req.user_id, req.show_id, req.seat_ids)
+async def _book_group_seats(req: schemas.GroupSeatBookingRequest, db: AsyncSession):
+    if booking_queue.ENABLED:
+        res = await booking_queue.submit(req.user_id, req.show_id, seat_ids=req.seat_ids, all_or_nothing=req.all_or_nothing)
+    else:
+        res = await crud_async.book_specific_seats(db, req.user_id, req.show_id, req.seat_ids, all_or_nothing=req.all_or_nothing)
     return {
         "success_count": len(res["success"]),
         "failed": res["failed"],
         "success_ids": [b.id for b in res["success"]]
     }
 
+@app.post("/book_group_seats/", summary="Book specific seat ids as a group")
+async def book_group_seats(req: schemas.GroupSeatBookingRequest, idempotency_key: Optional[str] = IDEMPOTENCY_KEY, db: AsyncSession = Depends(get_async_db)):
+    return await _idempotent("book_group_seats", idempotency_key, req, lambda: _book_group_seats(req, db))
+
 # Group cancellation (by booking ids)
 @app.delete("/group_cancellations/")
-def group_cancel(booking_ids: list[int], db: Session = Depends(get_db)):
-    cancelled = []
-    not_found = []
-    for bid in booking_ids:
-        b = db.query(models.Booking).filter(models.Booking.id == bid).first()
-        if b:
-            db.delete(b)
-            db.commit()
-            cancelled.append(bid)
-        else:
-            not_found.append(bid)
-    return {"cancelled": cancelled, "not_found": not_found}
+async def group_cancel(booking_ids: list[int], background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.cancel_bookings(db, booking_ids)
+    background_tasks.add_task(_allocate_waitlists)
+    return res
+
+# Waitlist: seats are booked automatically when a cancellation frees a match
+async def _allocate_waitlists():
+    for show_id in waitlist.take_pending():
+        async with AsyncSessionLocal() as db:
+            await crud_async.allocate_waitlist(db, show_id)
+
+def _waitlist_out(e):
+    return schemas.WaitlistEntry(
+        id=e.id, user_id=e.user_id, show_id=e.show_id, num_seats=e.num_seats, consecutive=e.consecutive,
+        priority=e.priority, status=e.status, seat_ids=waitlist.parse_seat_ids(e.seat_ids),
+        created_at=e.created_at, fulfilled_at=e.fulfilled_at,
+    )
+
+@app.post("/waitlist/", response_model=schemas.WaitlistEntry, summary="Wait for N seats of a show; booked automatically when they free up")
+async def join_waitlist(req: schemas.WaitlistCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.join_waitlist(db, req)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Show not found")
+    if isinstance(res, dict) and res.get("error"):
+        raise HTTPException(status_code=400, detail=res["error"])
+    background_tasks.add_task(_allocate_waitlists)
+    return _waitlist_out(res)
+
+@app.get("/waitlist/{entry_id}", response_model=schemas.WaitlistEntry)
+async def get_waitlist_entry(entry_id: int, db: AsyncSession = Depends(get_async_db)):
+    e = await crud_async.get_waitlist_entry(db, entry_id)
+    if e is None:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    return _waitlist_out(e)
+
+@app.delete("/waitlist/{entry_id}")
+async def leave_waitlist(entry_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await crud_async.leave_waitlist(db, entry_id):
+        raise HTTPException(status_code=404, detail="No waiting entry with this id")
+    return {"message": f"Waitlist entry {entry_id} cancelled"}
+
+# Seat holds (reserve -> confirm / release)
+def _hold_out(h):
+    return schemas.Hold(hold_id=h.hold_id, user_id=h.user_id, show_id=h.show_id, seat_ids=h.seat_ids, expires_in=holds.store.expires_in(h))
+
+@app.post("/holds/", response_model=schemas.Hold, summary="Hold seats for a few minutes before booking")
+async def create_hold(req: schemas.HoldCreate, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.hold_seats(db, req)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Show not found")
+    if isinstance(res, dict) and res.get("error"):
+        raise HTTPException(status_code=409, detail=res)
+    return _hold_out(res)
+
+@app.post("/holds/{hold_id}/confirm", summary="Book every seat of a hold")
+async def confirm_hold(hold_id: str, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.confirm_hold(db, hold_id)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    if not res["success"]:
+        raise HTTPException(status_code=409, detail={"error": "Seats no longer available", "failed": res["failed"]})
+    return {
+        "success_count": len(res["success"]),
+        "success_ids": [b.id for b in res["success"]]
+    }
+
+@app.delete("/holds/{hold_id}")
+async def release_hold(hold_id: str, db: AsyncSession = Depends(get_async_db)):
+    if await crud_async.release_hold(db, hold_id) is None:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    return {"message": f"Hold {hold_id} released"}
+
+# Seat formats: json (default), bitset (JSON header + base64 planes) or binary (octet-stream), see seatmap.py
+SEAT_FORMAT = Query("json", pattern="^(json|bitset|binary)$")
+COMPRESS_MIN = 256  # bytes; smaller bodies are sent as is
+
+def _compressed(request: Request, body: bytes, media_type: str):
+    accept = request.headers.get("accept-encoding", "")
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN:
+        if brotli is not None and "br" in accept:
+            body = brotli.compress(body)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def _packed_seats(request: Request, db: AsyncSession, show_id: int, kind: str, format: str):
+    res = await crud_async.seat_planes_for_show(db, show_id, kind)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Show not found")
+    if format == "binary":
+        return _compressed(request, seatmap.encode_binary(*res), "application/octet-stream")
+    body = json.dumps(seatmap.encode_bitset(*res), separators=(",", ":")).encode()
+    return _compressed(request, body, "application/json")
 
 # Available seats for show
-@app.get("/available_seats/{show_id}")
-def available_seats(show_id: int, db: Session = Depends(get_db)):
-    avail = crud.available_seats_for_show(db, show_id)
+@app.get("/available_seats/{show_id}", response_model=list[schemas.AvailableSeat])
+async def available_seats(show_id: int, request: Request, format: str = SEAT_FORMAT, db: AsyncSession = Depends(get_async_db)):
+    if format != "json":
+        return await _packed_seats(request, db, show_id, "available", format)
+    avail = await crud_async.available_seats_for_show(db, show_id)
     if avail is None:
         raise HTTPException(status_code=404, detail="Show not found")
-    return [{"seat_id": s.id, "seat": f"{s.row}{s.number}"} for s in avail]
+    seats = [{"seat_id": s.id, "seat": f"{s.row}{s.number}"} for s in avail]
+    if fastjson.enabled("available_seats"):
+        return Response(content=fastjson.dumps(seats), media_type="application/json")
+    return seats
 
 # Seat layout visualization (JSON + ASCII)
 @app.get("/seat_layout/{show_id}")
-def seat_layout(show_id: int, db: Session = Depends(get_db)):
-    res = crud.seat_layout_for_show(db, show_id)
+async def seat_layout(show_id: int, request: Request, format: str = SEAT_FORMAT, db: AsyncSession = Depends(get_async_db)):
+    if format != "json":
+        return await _packed_seats(request, db, show_id, "layout", format)
+    res = await crud_async.seat_layout_for_show(db, show_id)
     if res is None:
         raise HTTPException(status_code=404, detail="Show not found")
     return res
 
+# Live seat map: Server-Sent Events, one snapshot then deltas (see broker.py)
+SSE_KEEPALIVE = 10  # seconds between keep-alive comments (also sweeps expired holds)
+
+def _sse(event: str, seq: int, data) -> bytes:
+    return f"event: {event}\nid: {seq}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+@app.get("/seat_updates/{show_id}", summary="Stream seat changes for a show (text/event-stream)")
+async def seat_updates(show_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    sub = broker.subscribe(show_id)
+    # seq is read before the snapshot: deltas up to seq are already in it, later ones replay on top
+    seq = broker.seq(show_id)
+    snap = await crud_async.seat_snapshot_for_show(db, show_id)
+    if snap is None:
+        broker.unsubscribe(sub)
+        raise HTTPException(status_code=404, detail="Show not found")
+
+    async def events():
+        nonlocal seq, snap
+        try:
+            yield _sse("snapshot", seq, snap)
+            snap = None
+            while not await request.is_disconnected():
+                if sub.lagged:
+                    sub.resync()
+                    seq = broker.seq(show_id)
+                    async with AsyncSessionLocal() as fresh:
+                        yield _sse("snapshot", seq, await crud_async.seat_snapshot_for_show(fresh, show_id))
+                    continue
+                try:
+                    ev = await asyncio.wait_for(sub.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    holds.store.sweep()  # publishes holds that expired while nobody touched the store
+                    yield b": keep-alive\n\n"
+                    continue
+                if ev["seq"] > seq:
+                    yield _sse("delta", ev["seq"], ev)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Per-user notifications (waitlist fulfilment), Server-Sent Events
+@app.get("/notifications/{user_id}", summary="Stream notifications for a user (text/event-stream)")
+async def notifications(user_id: int, request: Request):
+    sub = broker.subscribe(("user", user_id))
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    ev = await asyncio.wait_for(sub.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield _sse(ev.get("type", "message"), ev["seq"], ev)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # User booking history
 @app.get("/user_bookings/{user_id}")
-def user_bookings(user_id: int, db: Session = Depends(get_db)):
-    res = crud.bookings_for_user(db, user_id)
+async def user_bookings(
+    user_id: int,
+    after_booking_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    movie_id: Optional[int] = None,
+    show_id: Optional[int] = None,
+    include_archived: bool = Query(False, description="also list bookings of archived past shows"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    res = await crud_async.bookings_for_user(db, user_id, after_booking_id=after_booking_id, limit=limit, movie_id=movie_id,
+                                             show_id=show_id, include_archived=include_archived)
     if res is None:
         raise HTTPException(status_code=404, detail="User not found")
     return res
 
 # Analytics per movie
 @app.get("/analytics/movie/{movie_id}")
-def analytics_movie(movie_id: int, db: Session = Depends(get_db)):
-    res = crud.movie_analytics(db, movie_id)
+async def analytics_movie(movie_id: int, include_archived: bool = False, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.movie_analytics(db, movie_id, include_archived=include_archived)
     if res is None:
         raise HTTPException(status_code=404, detail="Movie not found")
     return res
 
-# Seed demo (movie, theater, hall, show, seats)
+@app.get("/analytics/top_movies")
+async def analytics_top_movies(n: int = Query(10, ge=1, le=100), by: str = Query("tickets", pattern="^(tickets|revenue)$"), db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.top_movies(db, n, by)
+
+@app.get("/analytics/show/{show_id}/occupancy")
+async def analytics_show_occupancy(show_id: int, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.show_occupancy(db, show_id)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Show not found")
+    return res
+
+@app.get("/analytics/hall/{hall_id}/occupancy")
+async def analytics_hall_occupancy(hall_id: int, db: AsyncSession = Depends(get_async_db)):
+    res = await crud_async.hall_occupancy(db, hall_id)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Hall not found or has no shows")
+    return res
+
+@app.get("/analytics/movie/{movie_id}/sales")
+async def analytics_movie_sales(
+    movie_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: str = Query("hour", pattern="^(hour|day)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await crud_async.sales_series(db, movie_id, start, end, bucket)
+
+# Recompute rollups from the raw tables (also: python analytics.py rebuild)
+@app.post("/analytics/rebuild")
+async def analytics_rebuild(db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.rebuild_analytics(db)
+
+# Response cache hit/miss counters
+@app.get("/cache/metrics")
+async def cache_metrics():
+    return cache.responses.metrics()
+
+# Prometheus scrape endpoint: per-route latency and DB load histograms, slow queries, cache counters
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    c = cache.responses.metrics()
+    idem = idempotency.store.metrics()
+    changes = bus.metrics()
+    return instrumentation.render({
+        "cache_hits": ("Response cache hits", c["hits"]),
+        "cache_misses": ("Response cache misses", c["misses"]),
+        "cache_invalidations": ("Response cache tag invalidations", c["invalidations"]),
+        "cache_evictions": ("Response cache LRU evictions", c["evictions"]),
+        "seat_update_subscribers": ("Open /seat_updates and /notifications streams", broker.subscribers()),
+        "idempotent_replays": ("Booking requests answered from a stored Idempotency-Key response", idem["replays"]),
+        "idempotent_coalesced": ("Booking requests that waited on an in-flight duplicate key", idem["coalesced"]),
+        "change_log_version": ("Latest change_log version applied by this worker", changes["version"]),
+        "change_events_applied": ("change_log events applied by this worker", changes["applied"]),
+        "change_log_resyncs": ("Full in-memory state resets after missed change_log events", changes["resyncs"]),
+    })
+
+# Seed demo data: a small demo by default, or a parameterized synthetic dataset (see seed.py)
 @app.post("/seed_demo/")
-def seed_demo(db: Session = Depends(get_db)):
-    return crud.seed_demo(db)
+async def seed_demo(
+    movies: int = Query(3, ge=1, le=1000),
+    theaters: int = Query(1, ge=0, le=1000),
+    halls: int = Query(1, ge=1, le=100, description="halls per theater"),
+    seats: int = Query(100, ge=1, le=provisioning.MAX_ROWS * provisioning.MAX_SEATS_PER_ROW, description="seats per hall"),
+    shows: int = Query(3, ge=0, le=1000, description="shows per hall"),
+    users: int = Query(10, ge=0, le=1_000_000),
+    occupancy: float = Query(0.0, ge=0.0, le=1.0, description="share of every show's seats to book"),
+    seed: int = 42,
+    db: AsyncSession = Depends(get_async_db),
+):
+    res = await crud_async.seed_demo(db, movies=movies, theaters=theaters, halls=halls, seats=seats, shows=shows,
+                                     users=users, occupancy=occupancy, seed=seed)
+    if res.get("error"):
+        raise HTTPException(status_code=400, detail=res["error"])
+    return res
@@ -0,0 +1,187 @@
+"""
+Schema migrations, replacing the bare Base.metadata.create_all at startup.
+
+Each migration is an idempotent function of a connection, applied once in
+version order and recorded in the schema_migrations table. They are written to
+be safe when several workers start at the same time: every step checks the
+current schema before changing it.
+
+    python migrations.py upgrade     # apply pending migrations
+    python migrations.py status      # list applied / pending
+"""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, false, inspect, select, text
+from sqlalchemy.orm import Session
+import models, analytics, provisioning
+from database import Base
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _ensure_indexes(conn, *tables):
+    for table in tables:
+        live = {c["name"] for c in inspect(conn).get_columns(table)}
+        for idx in Base.metadata.tables[table].indexes:
+            # indexes on columns a later migration adds are created by that migration
+            if all(c.name in live for c in idx.columns):
+                idx.create(conn, checkfirst=True)
+
+
+# ---------- Migrations (append only) ----------
+@migration(1, "baseline: create missing tables")
+def _baseline(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+@migration(2, "bookings: price and created_at")
+def _booking_price(conn):
+    _add_column(conn, "bookings", "price", "FLOAT")
+    _add_column(conn, "bookings", "created_at", "TIMESTAMP")
+
+
+@migration(3, "seats: accessible flag")
+def _seat_accessible(conn):
+    # 0 on SQLite, false on PostgreSQL (which rejects an integer default for a boolean)
+    _add_column(conn, "seats", "accessible", f"BOOLEAN NOT NULL DEFAULT {false().compile(dialect=conn.dialect)}")
+
+
+@migration(4, "indexes on hot foreign keys")
+def _fk_indexes(conn):
+    _ensure_indexes(conn, "bookings", "shows", "halls")
+
+
+@migration(5, "populate analytics rollups for existing data")
+def _rollups(conn):
+    with Session(bind=conn, join_transaction_mode="create_savepoint") as db:
+        analytics.backfill(db)
+
+
+@migration(6, "waitlist table")
+def _waitlist(conn):
+    models.WaitlistEntry.__table__.create(conn, checkfirst=True)
+    _ensure_indexes(conn, "waitlist")
+
+
+@migration(7, "shows: start_time and search indexes")
+def _show_start_time(conn):
+    _add_column(conn, "shows", "start_time", "TIMESTAMP")
+    # rows whose time already holds a full ISO datetime get it as their start; "HH:MM" has no date
+    for show_id, time in conn.execute(text("SELECT id, time FROM shows WHERE start_time IS NULL AND length(time) > 5")).all():
+        _, start = provisioning.show_times(time)
+        if start is None:
+            continue
+        conn.execute(models.Show.__table__.update().where(models.Show.id == show_id).values(start_time=start))
+    _ensure_indexes(conn, "shows")
+    # superseded by the composite indexes (same leading column)
+    for name in ("ix_shows_movie_id", "ix_shows_hall_id"):
+        if name in {i["name"] for i in inspect(conn).get_indexes("shows")}:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+
+@migration(8, "bookings archive tables")
+def _bookings_archive(conn):
+    models.ArchivedBooking.__table__.create(conn, checkfirst=True)
+    models.ArchivedMovieSales.__table__.create(conn, checkfirst=True)
+    _ensure_indexes(conn, "bookings_archive")
+
+
+@migration(9, "change log for cross-worker invalidation")
+def _change_log(conn):
+    models.Change.__table__.create(conn, checkfirst=True)
+
+
+@migration(10, "bookings: never reuse ids (SQLite AUTOINCREMENT)")
+def _booking_autoincrement(conn):
+    if conn.dialect.name != "sqlite":
+        return  # PostgreSQL sequences never hand an id out twice
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'bookings'")).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    # SQLite can't add AUTOINCREMENT to a table: rebuild it (nothing references bookings.id)
+    conn.execute(text("ALTER TABLE bookings RENAME TO bookings_old"))
+    for idx in inspect(conn).get_indexes("bookings_old"):
+        conn.execute(text(f"DROP INDEX {idx['name']}"))
+    models.Booking.__table__.create(conn)
+    cols = ", ".join(c.name for c in models.Booking.__table__.columns)
+    conn.execute(text(f"INSERT INTO bookings ({cols}) SELECT {cols} FROM bookings_old"))
+    conn.execute(text("DROP TABLE bookings_old"))
+    # start above every id ever handed out, archived ones included
+    top = conn.execute(text(
+        "SELECT max(coalesce((SELECT max(id) FROM bookings), 0), coalesce((SELECT max(id) FROM bookings_archive), 0))"
+    )).scalar()
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'bookings'"))
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('bookings', :seq)"), {"seq": top})
+
+
+@migration(11, "idempotency keys shared by all workers")
+def _idempotency_keys(conn):
+    models.IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+@migration(12, "seat holds shared by all workers")
+def _seat_holds(conn):
+    models.SeatHold.__table__.create(conn, checkfirst=True)
+
+
+# ---------- Runner ----------
+def applied(conn):
+    _meta.create_all(bind=conn)
+    return {r.version for r in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade(engine):
+    """
+    Apply every pending migration, each in its own transaction. Returns the versions applied.
+    """
+    done = []
+    with engine.begin() as conn:
+        have = applied(conn)
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in have:
+            continue
+        with engine.begin() as conn:
+            if conn.execute(select(schema_migrations.c.version).where(schema_migrations.c.version == version)).first():
+                continue  # another worker got there first
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        done.append(version)
+    return done
+
+
+def status(engine):
+    with engine.begin() as conn:
+        have = applied(conn)
+    return [(version, name, version in have) for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0])]
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if cmd == "upgrade":
+        print("applied:", upgrade(engine) or "nothing to do")
+    elif cmd == "status":
+        for version, name, ok in status(engine):
+            print(f"{version:4d} {'applied' if ok else 'pending':8s} {name}")
+    else:
+        sys.exit("usage: python migrations.py [upgrade|status]")
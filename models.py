@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, UniqueConstraint
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -19,7 +20,7 @@ class Hall(Base):
     __tablename__ = "halls"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    theater_id = Column(Integer, ForeignKey("theaters.id"))
+    theater_id = Column(Integer, ForeignKey("theaters.id"), index=True)
     theater = relationship("Theater", back_populates="halls")
     shows = relationship("Show", back_populates="hall", cascade="all, delete-orphan")
     seats = relationship("Seat", back_populates="hall", cascade="all, delete-orphan")
@@ -27,19 +28,29 @@ class Hall(Base):
 class Show(Base):
     __tablename__ = "shows"
     id = Column(Integer, primary_key=True, index=True)
-    time = Column(String, nullable=False)  # keep as string for simplicity (e.g., "12:00")
+    time = Column(String, nullable=False)  # display time, e.g. "12:00" (legacy rows have only this)
+    start_time = Column(DateTime)  # real start; NULL for legacy rows created with just "HH:MM"
+    # movie_id / hall_id lookups use the leading column of the composite indexes below
     movie_id = Column(Integer, ForeignKey("movies.id"))
     hall_id = Column(Integer, ForeignKey("halls.id"))
     movie = relationship("Movie", back_populates="shows")
     hall = relationship("Hall", back_populates="shows")
     bookings = relationship("Booking", back_populates="show", cascade="all, delete-orphan")
 
+    # show search: "movie X in a time window", "what's on in these halls", "everything tonight"
+    __table_args__ = (
+        Index("ix_shows_movie_start", "movie_id", "start_time"),
+        Index("ix_shows_hall_start", "hall_id", "start_time"),
+        Index("ix_shows_start_time", "start_time"),
+    )
+
 class Seat(Base):
     __tablename__ = "seats"
     id = Column(Integer, primary_key=True, index=True)
     row = Column(String, nullable=False)   # e.g., "A"
     number = Column(Integer, nullable=False)  # e.g., 1
-    hall_id = Column(Integer, ForeignKey("halls.id"))
+    accessible = Column(Boolean, nullable=False, default=False)  # wheelchair / companion seat
+    hall_id = Column(Integer, ForeignKey("halls.id"))  # indexed by unique_seat_in_hall (hall_id first)
     hall = relationship("Hall", back_populates="seats")
 
     # unique seat in a hall by row+number
@@ -57,15 +68,116 @@ class User(Base):
 class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    show_id = Column(Integer, ForeignKey("shows.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)  # history lookups; (user_id, id) via rowid
+    show_id = Column(Integer, ForeignKey("shows.id"))  # indexed by unique_show_seat_booking (show_id first)
     seat_id = Column(Integer, ForeignKey("seats.id"))
+    price = Column(Float)  # ticket price at booking time (NULL for rows booked before it was recorded)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="bookings")
     show = relationship("Show", back_populates="bookings")
     seat = relationship("Seat")
 
-    # prevent double-booking a seat for the same show at DB level
+    # prevent double-booking a seat for the same show at DB level; AUTOINCREMENT so SQLite never
+    # hands out the id of a deleted (cancelled or archived) booking again
     __table_args__ = (
         UniqueConstraint("show_id", "seat_id", name="unique_show_seat_booking"),
+        {"sqlite_autoincrement": True},
+    )
+
+# ---------- Waitlist (served by crud.allocate_waitlist after cancellations) ----------
+class WaitlistEntry(Base):
+    __tablename__ = "waitlist"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    show_id = Column(Integer, ForeignKey("shows.id"), nullable=False)
+    num_seats = Column(Integer, nullable=False)
+    consecutive = Column(Boolean, nullable=False, default=True)  # same row, adjacent numbers
+    priority = Column(Integer, nullable=False, default=0)        # higher first, then FIFO
+    status = Column(String, nullable=False, default="waiting")   # waiting | fulfilled | cancelled
+    seat_ids = Column(String)  # comma-separated seat ids booked on fulfilment
+    created_at = Column(DateTime, default=datetime.utcnow)
+    fulfilled_at = Column(DateTime)
+
+    # queue scan: waiting entries of one show in priority / arrival order
+    __table_args__ = (
+        Index("ix_waitlist_queue", "show_id", "status", "priority", "id"),
     )
+
+# ---------- Archive (bookings of past shows moved out of the hot table, see archive.py) ----------
+class ArchivedBooking(Base):
+    __tablename__ = "bookings_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)  # the original booking id
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)  # history lookups; (user_id, id) via rowid
+    show_id = Column(Integer, ForeignKey("shows.id"), index=True)
+    seat_id = Column(Integer, ForeignKey("seats.id"))
+    price = Column(Float)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+# ---------- Change log (in-memory state invalidation across worker processes, see bus.py) ----------
+class Change(Base):
+    __tablename__ = "change_log"
+    id = Column(Integer, primary_key=True)  # the event's version: commit order on SQLite
+    entity = Column(String, nullable=False)  # movie | theater | hall | show | seats | holds | waitlist | catalog
+    entity_id = Column(Integer)              # seats, holds: the show id; waitlist: the entry id
+    op = Column(String, nullable=False)      # changed | booked | freed | held | released | fulfilled
+    seat_ids = Column(String)                # comma-separated, for seats events
+    origin = Column(String, nullable=False)  # writing process (bus.ORIGIN)
+    created_at = Column(DateTime, nullable=False)
+
+# ---------- Seat holds (shared by every worker, see holds.py) ----------
+class SeatHold(Base):
+    __tablename__ = "seat_holds"
+    show_id = Column(Integer, ForeignKey("shows.id"), primary_key=True)
+    seat_id = Column(Integer, ForeignKey("seats.id"), primary_key=True)  # one live hold per seat
+    hold_id = Column(String, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# ---------- Idempotency keys (booking retries, shared by every worker, see idempotency.py) ----------
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    scope = Column(String, primary_key=True)        # endpoint
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String, nullable=False)    # hash of the request body
+    status = Column(Integer)                        # NULL while the first request is still running
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # claim lease, then the replay TTL
+
+# ---------- Analytics rollups (maintained incrementally by crud, see analytics.py) ----------
+class ShowSales(Base):
+    __tablename__ = "show_sales"
+    show_id = Column(Integer, ForeignKey("shows.id"), primary_key=True)
+    movie_id = Column(Integer, nullable=False, index=True)
+    hall_id = Column(Integer, nullable=False, index=True)
+    capacity = Column(Integer, nullable=False, default=0)
+    tickets = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+class MovieSales(Base):
+    __tablename__ = "movie_sales"
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    tickets = Column(Integer, nullable=False, default=0, index=True)
+    revenue = Column(Float, nullable=False, default=0, index=True)
+
+class ArchivedMovieSales(Base):
+    # the archived part of movie_sales (which counts every booking, live or archived)
+    __tablename__ = "movie_sales_archive"
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    tickets = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+class HallSales(Base):
+    __tablename__ = "hall_sales"
+    hall_id = Column(Integer, ForeignKey("halls.id"), primary_key=True)
+    capacity = Column(Integer, nullable=False, default=0)  # seats x shows scheduled in the hall
+    tickets = Column(Integer, nullable=False, default=0)
+
+class SalesBucket(Base):
+    __tablename__ = "sales_buckets"
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # start of the hour the tickets were booked in
+    tickets = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
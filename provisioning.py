@@ -0,0 +1,218 @@
+"""
+Hall layouts and bulk provisioning of theaters, halls and shows.
+
+A hall's seats can be described as
+  - rows x seats_per_row (the old fixed grid),
+  - row_counts: seats per row, e.g. [8, 10, 10, 12],
+  - a compact layout string: one token per row separated by "/", where
+    "S" is a seat, "A" an accessible seat and "." a gap (aisle / missing seat).
+    Gaps still use up a seat number, so a consecutive-seat search never
+    spans an aisle. Example: "SSSS..SSSS/SSSS..SSSS/AA......AA".
+Rows are labelled A, B, ... Z, AA, AB, ...
+"""
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models, analytics, cache, bus
+
+MAX_ROWS = 100
+MAX_SEATS_PER_ROW = 200
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def row_label(i: int) -> str:
+    label = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        label = chr(65 + r) + label
+    return label
+
+
+def parse_layout(layout: str):
+    """
+    Compact layout string -> list of rows, each a list of (number, accessible).
+    """
+    rows = []
+    for token in layout.replace("\n", "/").split("/"):
+        token = token.strip()
+        if not token:
+            continue
+        seats = []
+        for pos, ch in enumerate(token.upper(), start=1):
+            if ch == "S":
+                seats.append((pos, False))
+            elif ch == "A":
+                seats.append((pos, True))
+            elif ch not in "._":
+                raise LayoutError(f"Unknown layout character {ch!r} (use S, A or .)")
+        rows.append(seats)
+    return rows
+
+
+def hall_seats(rows: int = None, seats_per_row: int = None, row_counts=None, layout: str = None):
+    """
+    Seat spec for a hall as (row, number, accessible) tuples. Precedence: layout, row_counts, rows x seats_per_row.
+    """
+    if layout:
+        spec = parse_layout(layout)
+    elif row_counts:
+        spec = [[(n, False) for n in range(1, c + 1)] for c in row_counts]
+    else:
+        spec = [[(n, False) for n in range(1, (seats_per_row or 0) + 1)] for _ in range(rows or 0)]
+    if not spec or not any(spec):
+        raise LayoutError("Hall layout has no seats")
+    if len(spec) > MAX_ROWS or any(len(r) and r[-1][0] > MAX_SEATS_PER_ROW for r in spec):
+        raise LayoutError(f"Hall layout exceeds {MAX_ROWS} rows or {MAX_SEATS_PER_ROW} seats per row")
+    return [(row_label(i), n, acc) for i, row in enumerate(spec) for n, acc in row]
+
+
+def show_times(time: str = None, start_time=None):
+    """
+    (display time, start datetime or None) from the legacy "HH:MM" string and/or a start time.
+    An ISO datetime given as `time` is parsed; any other free-form time ("12:00:00", "7pm")
+    is kept as the display string with no start time. Aware datetimes are stored as naive UTC.
+    """
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+    if start_time is None and time and len(str(time)) > 5:
+        try:
+            start_time = datetime.fromisoformat(str(time))
+            time = None
+        except ValueError:
+            pass
+    if start_time is not None and start_time.tzinfo is not None:
+        start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+    if not time:
+        if start_time is None:
+            raise ValueError("Show needs a start_time or a time")
+        time = start_time.strftime("%H:%M")
+    return str(time), start_time
+
+
+def insert_seats(db: Session, hall_id: int, seats):
+    """
+    One executemany INSERT for every seat of a hall (no per-seat ORM objects). Caller commits.
+    """
+    db.execute(insert(models.Seat), [
+        {"hall_id": hall_id, "row": row, "number": n, "accessible": acc} for row, n, acc in seats
+    ])
+
+
+# ---------- Bulk import ----------
+IMPORT_BATCH = 200
+
+
+class ImportState:
+    """
+    name -> id lookups carried across batches so repeated theaters/halls/movies cost one query each.
+    """
+    def __init__(self):
+        self.theaters = {}
+        self.halls = {}
+        self.movies = {}
+        self.created = {"theaters": 0, "halls": 0, "movies": 0, "shows": 0, "seats": 0}
+        self.pending = dict.fromkeys(self.created, 0)  # counts for the record being imported
+        self.errors = []
+
+
+def _theater_id(db: Session, st: ImportState, name: str):
+    if name not in st.theaters:
+        t = db.query(models.Theater.id).filter(models.Theater.name == name).first()
+        if t is None:
+            t = models.Theater(name=name)
+            db.add(t)
+            db.flush()
+            st.pending["theaters"] += 1
+        st.theaters[name] = t.id
+    return st.theaters[name]
+
+
+def _hall_id(db: Session, st: ImportState, theater_id: int, rec: dict):
+    key = (theater_id, rec["hall"])
+    if key not in st.halls:
+        h = db.query(models.Hall.id).filter(models.Hall.theater_id == theater_id, models.Hall.name == rec["hall"]).first()
+        if h is None:
+            seats = hall_seats(
+                rows=_int(rec.get("rows")), seats_per_row=_int(rec.get("seats_per_row")),
+                row_counts=_counts(rec.get("row_counts")), layout=rec.get("layout") or None,
+            )
+            h = models.Hall(name=rec["hall"], theater_id=theater_id)
+            db.add(h)
+            db.flush()
+            insert_seats(db, h.id, seats)
+            st.pending["halls"] += 1
+            st.pending["seats"] += len(seats)
+        st.halls[key] = h.id
+    return st.halls[key]
+
+
+def _movie_id(db: Session, st: ImportState, rec: dict):
+    title = rec["movie"]
+    if title not in st.movies:
+        m = db.query(models.Movie.id).filter(models.Movie.title == title).first()
+        if m is None:
+            if rec.get("price") in (None, ""):
+                raise LayoutError(f"New movie {title!r} needs a price")
+            m = models.Movie(title=title, price=float(rec["price"]))
+            db.add(m)
+            db.flush()
+            st.pending["movies"] += 1
+        st.movies[title] = m.id
+    return st.movies[title]
+
+
+def _int(v):
+    return int(v) if v not in (None, "") else None
+
+
+def _counts(v):
+    if v in (None, ""):
+        return None
+    if isinstance(v, str):
+        return [int(x) for x in v.replace(";", " ").replace(",", " ").split()]
+    return [int(x) for x in v]
+
+
+def import_batch(db: Session, records, st: ImportState):
+    """
+    Provision one batch of records in a single transaction. Each record is a dict with
+    `theater`, optional `hall` (+ rows/seats_per_row/row_counts/layout), and optional
+    `movie` (+ price when new) and `time` ("HH:MM" or an ISO datetime) for a show in that hall.
+    Bad records are skipped and reported in st.errors as (line, message).
+    """
+    for line, rec in records:
+        st.pending = dict.fromkeys(st.created, 0)
+        try:
+            with db.begin_nested():
+                if not rec.get("theater"):
+                    raise LayoutError("Missing theater")
+                theater_id = _theater_id(db, st, rec["theater"])
+                if rec.get("hall"):
+                    hall_id = _hall_id(db, st, theater_id, rec)
+                    if rec.get("movie") and rec.get("time"):
+                        time, start = show_times(str(rec["time"]))
+                        show = models.Show(time=time, start_time=start, movie_id=_movie_id(db, st, rec), hall_id=hall_id)
+                        db.add(show)
+                        db.flush()
+                        analytics.register_show(db, show)
+                        st.pending["shows"] += 1
+        except (LayoutError, ValueError, TypeError, KeyError, IntegrityError) as e:
+            # the savepoint is rolled back, so lookups cached for this record may point at
+            # rows that no longer exist -> forget them all, they are re-queried on demand
+            st.theaters.clear()
+            st.halls.clear()
+            st.movies.clear()
+            st.errors.append((line, str(e)))
+            continue
+        for k, v in st.pending.items():
+            st.created[k] += v
+    bus.publish(db, "catalog")
+    db.commit()
+    # new rows in any catalog table; new halls have no cached seat lists yet
+    cache.invalidate("theaters", "halls", "movies", "shows")
+    return st
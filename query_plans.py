@@ -0,0 +1,212 @@
+"""
+Query-plan regression check: runs every crud entry point against a small seeded
+SQLite database, captures the SQL it issues and fails if EXPLAIN QUERY PLAN
+shows a full table scan. It also checks that booking history is loaded with the
+same number of statements for a user with one booking as for one with many.
+
+    python query_plans.py            # exit status 1 on any unindexed scan or N+1
+    python query_plans.py -v         # also print every plan
+
+Listing / streaming / rebuild paths read whole tables by design; they are
+listed in FULL_SCAN_OK and still printed with -v. tests/test_query_plans.py
+runs the same scenario under pytest and also checks which index each hot
+lookup uses.
+"""
+import os, sys, tempfile, threading
+from datetime import datetime
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'plans.db')}"
+
+from sqlalchemy import event
+import crud, schemas, models, analytics, migrations, seatmap, holds, archive, bus
+from database import SessionLocal, engine
+
+FULL_SCAN_OK = {
+    "list_movies", "list_theaters", "list_halls", "list_shows", "list_users", "list_bookings",
+    "stream_rows", "top_movies", "rebuild",
+}
+HISTORY_SIZE = 20  # bookings for the "many" side of the history statement-count check
+
+
+def _ours():
+    # bus.py's listener polls on its own thread when the app is running (tests/)
+    return threading.current_thread().name != "bus-listener"
+
+
+class Capture:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if _ours() and not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            self.statements.append((statement, parameters))
+
+
+def _on_connection(fn):
+    # the listener runs on its own connection, outside any session
+    with engine.connect() as conn:
+        return fn(conn)
+
+
+def _seed(db):
+    m = crud.create_movie(db, schemas.MovieCreate(title="Plan", price=10.0))
+    t = crud.create_theater(db, schemas.TheaterCreate(name="Plan Theater"))
+    h = crud.create_hall(db, schemas.HallCreate(name="H1", theater_id=t.id, rows=4, seats_per_row=8))
+    s = crud.create_show(db, schemas.ShowCreate(start_time="2026-01-01T18:00:00", movie_id=m.id, hall_id=h.id))
+    u = crud.create_user(db, schemas.UserCreate(name="plan", email="plan@example.com"))
+    return m.id, h.id, s.id, u.id
+
+
+def scenario(db, movie_id, hall_id, show_id, user_id):
+    """
+    (name, callable) for every crud/analytics entry point the routes use.
+    """
+    seats = [r.id for r in crud.list_seats_by_hall(db, hall_id)]
+    theater_id = db.get(models.Hall, hall_id).theater_id
+    held, made, queued = [], [], []
+    return [
+        ("list_movies", lambda: crud.list_movies(db, after_id=0, limit=10)),
+        ("list_theaters", lambda: crud.list_theaters(db, limit=10)),
+        ("list_halls", lambda: crud.list_halls(db, limit=10)),
+        ("list_shows", lambda: crud.list_shows(db, limit=10)),
+        ("list_users", lambda: crud.list_users(db, limit=10)),
+        ("list_bookings", lambda: crud.list_bookings(db, limit=10)),
+        ("get_show", lambda: crud.get_show(db, show_id)),
+        ("search_shows_movie", lambda: crud.search_shows(db, movie_id=movie_id, start=datetime(2026, 1, 1), end=datetime(2026, 1, 2))),
+        ("search_shows_theater", lambda: crud.search_shows(db, theater_id=theater_id, start=datetime(2026, 1, 1), min_seats=2)),
+        ("search_shows_window", lambda: crud.search_shows(db, start=datetime(2026, 1, 1), end=datetime(2026, 1, 2))),
+        ("list_seats_by_hall", lambda: crud.list_seats_by_hall(db, hall_id)),
+        ("create_booking", lambda: made.append(crud.create_booking(db, schemas.BookingCreate(user_id=user_id, show_id=show_id, seat_id=seats[0])).id)),
+        ("book_specific_seats", lambda: made.extend(r.id for r in crud.book_specific_seats(db, user_id, show_id, seats[1:3])["success"])),
+        ("book_consecutive_seats", lambda: crud.book_consecutive_seats(db, show_id, 2, user_id)),
+        ("suggest_alternate_shows", lambda: crud.suggest_alternate_shows_for_consecutive(db, movie_id, 2)),
+        ("available_seats_for_show", lambda: crud.available_seats_for_show(db, show_id)),
+        ("seat_layout_for_show", lambda: crud.seat_layout_for_show(db, show_id)),
+        ("hold_seats", lambda: held.append(crud.hold_seats(db, schemas.HoldCreate(user_id=user_id, show_id=show_id, seat_ids=seats[10:12])))),
+        ("holds_reload", lambda: _on_connection(holds.store.reload)),
+        ("get_hold_from_table", lambda: (holds.store.clear(), holds.store.get(db, held[0].hold_id))),
+        ("confirm_hold", lambda: crud.confirm_hold(db, held[0].hold_id)),
+        ("bookings_for_user", lambda: crud.bookings_for_user(db, user_id)),
+        ("bookings_for_user_page", lambda: crud.bookings_for_user(db, user_id, after_booking_id=0, limit=10, movie_id=movie_id)),
+        ("movie_analytics", lambda: crud.movie_analytics(db, movie_id)),
+        ("show_occupancy", lambda: analytics.show_occupancy(db, show_id)),
+        ("hall_occupancy", lambda: analytics.hall_occupancy(db, hall_id)),
+        ("sales_series", lambda: analytics.sales_series(db, movie_id)),
+        ("top_movies", lambda: analytics.top_movies(db)),
+        ("join_waitlist", lambda: queued.append(crud.join_waitlist(db, schemas.WaitlistCreate(user_id=user_id, show_id=show_id, num_seats=2)).id)),
+        ("cancel_booking", lambda: crud.cancel_booking(db, made[0])),
+        ("cancel_bookings", lambda: crud.cancel_bookings(db, made[1:3])),
+        ("allocate_waitlist", lambda: crud.allocate_waitlist(db, show_id)),
+        ("get_waitlist_entry", lambda: crud.get_waitlist_entry(db, queued[0])),
+        ("archive_move", lambda: archive.move(db, datetime(2026, 1, 2))),
+        ("seatmap_load_archived", lambda: seatmap.load(db, show_id)),
+        ("bookings_for_user_archived", lambda: crud.bookings_for_user(db, user_id, after_booking_id=0, limit=10, include_archived=True)),
+        ("movie_analytics_live", lambda: crud.movie_analytics(db, movie_id, include_archived=False)),
+        ("bus_poll", lambda: _on_connection(bus.Listener(engine).poll)),
+        ("bus_prune", lambda: _on_connection(bus.Listener(engine).prune)),
+        ("stream_rows", lambda: list(crud.stream_rows(db, models.Booking))),
+        ("rebuild", lambda: analytics.rebuild(db)),
+    ]
+
+
+def statement_count(db, call):
+    """
+    Statements sent to the database while `call` runs (identity map cleared first,
+    so lazy loads can't be served from it).
+    """
+    count = [0]
+
+    def counter(*_):
+        if _ours():
+            count[0] += 1
+    db.expire_all()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return count[0]
+
+
+def history_counts(db, movie_id, hall_id, many=HISTORY_SIZE):
+    """
+    (name, statements with 1 booking, statements with `many`) for each bookings_for_user shape.
+    """
+    show = crud.create_show(db, schemas.ShowCreate(start_time="2030-01-01T18:00:00", movie_id=movie_id, hall_id=hall_id))
+    user_id = crud.create_user(db, schemas.UserCreate(name="history", email="history@example.com")).id
+    seats = [r.id for r in crud.list_seats_by_hall(db, hall_id)][:many]
+    shapes = [
+        ("bookings_for_user", lambda: crud.bookings_for_user(db, user_id)),
+        ("bookings_for_user_page", lambda: crud.bookings_for_user(db, user_id, after_booking_id=0, limit=many, movie_id=movie_id)),
+        ("bookings_for_user_archived", lambda: crud.bookings_for_user(db, user_id, include_archived=True)),
+    ]
+    crud.book_specific_seats(db, user_id, show.id, seats[:1])
+    one = [statement_count(db, call) for _, call in shapes]
+    crud.book_specific_seats(db, user_id, show.id, seats[1:])
+    assert len(crud.bookings_for_user(db, user_id)["bookings"]) == many
+    return [(name, a, statement_count(db, call)) for (name, call), a in zip(shapes, one)]
+
+
+def full_scans(conn, statement, parameters):
+    """
+    Plan lines that scan a table without an index (SQLite EXPLAIN QUERY PLAN wording).
+    """
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    detail = [r[-1] for r in rows]
+    bad = [d for d in detail if d.startswith("SCAN") and "USING" not in d and "CONSTANT ROW" not in d]
+    return detail, bad
+
+
+def plans(db, ids):
+    """
+    (name, statement, plan lines, unindexed scans) for every statement the scenario issues.
+    """
+    seatmap.invalidate()
+    holds.store.clear()
+    capture = Capture()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        checks = []
+        for name, call in scenario(db, *ids):
+            capture.statements.clear()
+            call()
+            checks.append((name, list(capture.statements)))
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    found = []
+    with engine.connect() as conn:
+        for name, statements in checks:
+            for statement, parameters in statements:
+                found.append((name, statement, *full_scans(conn, statement, parameters)))
+    return found
+
+
+def main(verbose=False):
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    failures = 0
+    try:
+        ids = _seed(db)
+        for name, statement, detail, bad in plans(db, ids):
+            allowed = name in FULL_SCAN_OK
+            if bad and not allowed:
+                failures += 1
+            if verbose or (bad and not allowed):
+                flag = "FULL SCAN" if bad and not allowed else ("scan ok" if bad else "ok")
+                print(f"[{flag}] {name}: {' '.join(statement.split())[:160]}")
+                for d in detail:
+                    print(f"    {d}")
+        for name, one, many in history_counts(db, ids[0], ids[1]):
+            if one != many:
+                failures += 1
+            if verbose or one != many:
+                print(f"[{'N+1' if one != many else 'ok'}] {name}: {one} statement(s) for 1 booking, {many} for {HISTORY_SIZE}")
+    finally:
+        db.close()
+    print(f"{failures} failure(s)" if failures else "query plans OK")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(verbose="-v" in sys.argv[1:]) else 0)
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import datetime
+from holds import MAX_TTL
 
 # Movie
 class MovieBase(BaseModel):
@@ -32,8 +34,11 @@ class HallBase(BaseModel):
     theater_id: int
 
 class HallCreate(HallBase):
-    # optional layout parameters could be added later
-    pass
+    # optional layout (see provisioning.py); precedence: layout, row_counts, rows x seats_per_row
+    rows: Optional[int] = Field(None, ge=1)
+    seats_per_row: Optional[int] = Field(None, ge=1)
+    row_counts: Optional[List[int]] = None
+    layout: Optional[str] = None  # e.g. "SSSS..SSSS/SSSS..SSSS/AA......AA"
 
 class Hall(HallBase):
     id: int
@@ -46,19 +51,38 @@ class ShowBase(BaseModel):
     movie_id: int
     hall_id: int
 
-class ShowCreate(ShowBase):
-    pass
+class ShowCreate(BaseModel):
+    # give start_time (a datetime) and/or the legacy "HH:MM" time; an ISO datetime in `time` also works
+    time: Optional[str] = None
+    start_time: Optional[datetime] = None
+    movie_id: int
+    hall_id: int
 
 class Show(ShowBase):
     id: int
+    start_time: Optional[datetime] = None
     class Config:
         orm_mode = True
 
+# Show search result: one show with its seats remaining (from the show_sales counter)
+class ShowSearchResult(BaseModel):
+    show_id: int
+    time: str
+    start_time: Optional[datetime] = None
+    movie_id: int
+    title: str
+    theater_id: int
+    hall_id: int
+    hall: str
+    capacity: int
+    seats_remaining: int
+
 # Seat
 class SeatBase(BaseModel):
     row: str
     number: int
     hall_id: int
+    accessible: bool = False
 
 class SeatCreate(SeatBase):
     pass
@@ -68,6 +92,11 @@ class Seat(SeatBase):
     class Config:
         orm_mode = True
 
+# Free seat of a show (GET /available_seats/{show_id})
+class AvailableSeat(BaseModel):
+    seat_id: int
+    seat: str  # row label + number, e.g. "C12"
+
 # User
 class UserBase(BaseModel):
     name: str
@@ -106,3 +135,44 @@ class GroupSeatBookingRequest(BaseModel):
     user_id: int
     show_id: int
     seat_ids: List[int]
+    # True -> book every seat or none; False -> book whatever is free (legacy behaviour)
+    all_or_nothing: bool = False
+
+# Seat hold (temporary reservation before booking)
+class HoldCreate(BaseModel):
+    user_id: int
+    show_id: int
+    seat_ids: List[int] = Field(..., min_length=1)
+    ttl_seconds: Optional[int] = Field(None, ge=1, le=MAX_TTL)  # default holds.DEFAULT_TTL
+
+class Hold(BaseModel):
+    hold_id: str
+    user_id: int
+    show_id: int
+    seat_ids: List[int]
+    expires_in: float
+
+# Waitlist: wait for N seats of a sold-out show, booked automatically when seats free up
+class WaitlistCreate(BaseModel):
+    user_id: int
+    show_id: int
+    num_seats: int
+    consecutive: bool = True
+    priority: int = 0
+
+class WaitlistEntry(BaseModel):
+    id: int
+    user_id: int
+    show_id: int
+    num_seats: int
+    consecutive: bool
+    priority: int
+    status: str
+    seat_ids: List[int] = []
+    created_at: Optional[datetime] = None
+    fulfilled_at: Optional[datetime] = None
+
+# Bulk import summary
+class ImportResult(BaseModel):
+    created: dict
+    errors: List[dict]
@@ -0,0 +1,377 @@
+"""
+In-memory seat maps: one bitmap per show.
+
+Each hall row is a Python int where bit N stands for seat number N, so
+availability, the layout and "N adjacent seats" are answered with word-level
+bit operations instead of walking Seat ORM objects. The hall's row/number
+layout is indexed once per hall; every show keeps its booked bits plus the
+free stretches ("gap runs") of each row, so a consecutive-seat search costs
+O(rows). A show's map is loaded from the DB on first use (or after
+invalidation) and then kept in sync by the crud functions that create or
+delete bookings, which also publish each change to broker.py. Bookings
+written by other worker processes are applied by bus.py.
+
+Maps and hall indexes are kept in LRU caches of SEATMAP_MAX_SHOWS (5000) and
+SEATMAP_MAX_HALLS (1000) entries, so past shows fall out instead of living
+for the life of the process; an evicted map reloads on its next read.
+"""
+import base64
+import itertools
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict, namedtuple
+import models, broker
+
+SeatRef = namedtuple("SeatRef", ["id", "row", "number"])
+
+
+def _bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def free_runs(free: int):
+    """
+    List of (start_number, length) for each stretch of consecutive set bits in `free`, in order.
+    """
+    runs = []
+    starts = free & ~(free << 1)
+    ends = free & ~(free >> 1)
+    for a, b in zip(_bits(starts), _bits(ends)):
+        runs.append((a, b - a + 1))
+    return runs
+
+
+def row_order(row: str):
+    """
+    Sort key for row labels in hall order: A..Z, then AA, AB, ... (see provisioning.row_label).
+    """
+    return len(row), row
+
+
+class HallIndex:
+    """
+    Seat layout of one hall: row -> sorted seat numbers, plus seat id lookups.
+    Shared by every show in the hall and cached per hall_id.
+    """
+    def __init__(self, hall_id: int, seats):
+        """
+        seats: iterable of (seat_id, row, number).
+        """
+        self.hall_id = hall_id
+        self.exists = {}   # row -> mask of seat numbers present in the hall
+        self.ids = {}      # (row, number) -> seat id
+        self.pos = {}      # seat id -> (row, number)
+        for sid, row, number in seats:
+            self.exists[row] = self.exists.get(row, 0) | (1 << number)
+            self.ids[(row, number)] = sid
+            self.pos[sid] = (row, number)
+        self.rows = sorted(self.exists, key=row_order)
+        self.numbers = {row: list(_bits(self.exists[row])) for row in self.rows}
+
+
+class SeatMap:
+    def __init__(self, show_id: int, hall: HallIndex, booked_ids):
+        """
+        hall: the show's HallIndex; booked_ids: seat ids booked for the show.
+        """
+        self.show_id = show_id
+        self.hall = hall
+        self.hall_id = hall.hall_id
+        self.rows = hall.rows
+        self.booked = {row: 0 for row in hall.rows}   # row -> mask of booked seat numbers
+        self.runs = {}      # row -> [(start_number, length), ...] free stretches
+        self.longest = {}   # row -> longest free stretch
+        for sid in booked_ids:
+            p = hall.pos.get(sid)
+            if p is not None:
+                self.booked[p[0]] |= (1 << p[1])
+        for row in self.rows:
+            self._reindex(row)
+
+    def _reindex(self, row: str):
+        runs = free_runs(self.free_mask(row))
+        self.runs[row] = runs
+        self.longest[row] = max((n for _, n in runs), default=0)
+
+    def mark(self, seat_ids, booked: bool):
+        touched = set()
+        for sid in seat_ids:
+            p = self.hall.pos.get(sid)
+            if p is None:
+                continue
+            row, number = p
+            if booked:
+                self.booked[row] |= (1 << number)
+            else:
+                self.booked[row] &= ~(1 << number)
+            touched.add(row)
+        for row in touched:
+            self._reindex(row)
+
+    def is_booked(self, seat_id: int) -> bool:
+        p = self.hall.pos.get(seat_id)
+        return p is not None and bool(self.booked[p[0]] >> p[1] & 1)
+
+    def free_mask(self, row: str) -> int:
+        return self.hall.exists[row] & ~self.booked[row]
+
+    def _held_masks(self, held):
+        masks = {}
+        for sid in held or ():
+            p = self.hall.pos.get(sid)
+            if p is not None:
+                masks[p[0]] = masks.get(p[0], 0) | (1 << p[1])
+        return masks
+
+    def available(self, held=None):
+        """
+        Free seats in row/number order; seat ids in `held` (see holds.py) count as unavailable.
+        """
+        ids = self.hall.ids
+        hm = self._held_masks(held)
+        out = []
+        for row in self.rows:
+            for n in _bits(self.free_mask(row) & ~hm.get(row, 0)):
+                out.append(SeatRef(ids[(row, n)], row, n))
+        return out
+
+    def layout(self, held=None):
+        hm = self._held_masks(held)
+        layout = {}
+        ascii_lines = []
+        for row in self.rows:
+            booked = self.booked[row]
+            h = hm.get(row, 0)
+            cells = {}
+            for n in self.hall.numbers[row]:
+                cells[n] = "Booked" if booked >> n & 1 else ("Held" if h >> n & 1 else "Available")
+            layout[row] = cells
+            # numbers missing from the hall (aisles, gaps) render as blanks
+            top = self.hall.numbers[row][-1] if self.hall.numbers[row] else 0
+            ascii_lines.append(f"{row} " + "".join(_CELL[cells[n]] if n in cells else "   " for n in range(1, top + 1)))
+        return {"layout": layout, "ascii": "\n".join(ascii_lines)}
+
+    def snapshot(self, held=None):
+        """
+        Compact state for push clients: per row the seat numbers, their ids and one
+        state letter per seat (X booked, H held, A available).
+        """
+        hm = self._held_masks(held)
+        ids = self.hall.ids
+        rows = []
+        for row in self.rows:
+            booked = self.booked[row]
+            h = hm.get(row, 0)
+            numbers = self.hall.numbers[row]
+            rows.append({
+                "row": row,
+                "numbers": numbers,
+                "ids": [ids[(row, n)] for n in numbers],
+                "state": "".join("X" if booked >> n & 1 else ("H" if h >> n & 1 else "A") for n in numbers),
+            })
+        return {"show_id": self.show_id, "hall_id": self.hall_id, "rows": rows}
+
+    def planes(self, kind: str = "layout", held=None):
+        """
+        Row masks for the packed formats: "layout" -> present / booked / held planes,
+        "available" -> one plane of free, unheld seats.
+        """
+        hm = self._held_masks(held)
+        if kind == "available":
+            names = ("available",)
+            masks = [[self.free_mask(r) & ~hm.get(r, 0) for r in self.rows]]
+        else:
+            names = ("present", "booked", "held")
+            masks = [
+                [self.hall.exists[r] for r in self.rows],
+                [self.booked[r] for r in self.rows],
+                [hm.get(r, 0) & ~self.booked[r] for r in self.rows],
+            ]
+        header = {
+            "show_id": self.show_id,
+            "hall_id": self.hall_id,  # seat ids by (row, number): /seats/{hall_id}
+            "rows": self.rows,
+            "lengths": [self.hall.numbers[r][-1] if self.hall.numbers[r] else 0 for r in self.rows],
+            "planes": list(names),
+        }
+        return header, masks
+
+    def find_consecutive(self, num_seats: int, held=None):
+        """
+        First (row, [SeatRef, ...]) block of `num_seats` free seats with consecutive numbers, else None.
+        Rows whose longest free stretch is too short are skipped without looking at their bits.
+        """
+        if num_seats <= 0:
+            return None
+        hm = self._held_masks(held)
+        for row in self.rows:
+            if self.longest[row] < num_seats:
+                continue
+            runs = self.runs[row] if row not in hm else free_runs(self.free_mask(row) & ~hm[row])
+            for start, length in runs:
+                if length >= num_seats:
+                    return row, [SeatRef(self.hall.ids[(row, n)], row, n) for n in range(start, start + num_seats)]
+        return None
+
+
+_CELL = {"Booked": "[X]", "Held": "[H]", "Available": "[ ]"}
+
+
+# ---------- Packed bitset encoding ----------
+# Each row of a plane is ceil(length / 8) bytes; seat number n is bit (n - 1) % 8
+# of byte (n - 1) // 8 (least significant bit first). Planes follow each other,
+# rows in header order.
+def pack_planes(header, masks) -> bytes:
+    out = bytearray()
+    for plane in masks:
+        for mask, length in zip(plane, header["lengths"]):
+            out += (mask >> 1).to_bytes((length + 7) // 8, "little")
+    return bytes(out)
+
+
+def encode_bitset(header, masks) -> dict:
+    """
+    JSON-friendly form: the header plus one base64 string per plane.
+    """
+    data = dict(header)
+    data["bits"] = {name: base64.b64encode(pack_planes(header, [plane])).decode() for name, plane in zip(header["planes"], masks)}
+    return data
+
+
+def encode_binary(header, masks) -> bytes:
+    """
+    application/octet-stream form: 4-byte big-endian header length, JSON header, packed planes.
+    """
+    head = json.dumps(header, separators=(",", ":")).encode()
+    return struct.pack(">I", len(head)) + head + pack_planes(header, masks)
+
+
+# ---------- Per-process registry ----------
+# Bounded LRU caches: past or rarely read shows fall out and reload from the DB on demand.
+MAX_SHOWS = int(os.getenv("SEATMAP_MAX_SHOWS", "5000"))
+MAX_HALLS = int(os.getenv("SEATMAP_MAX_HALLS", "1000"))
+
+_lock = threading.RLock()
+_halls = OrderedDict()  # hall_id -> HallIndex
+_maps = OrderedDict()   # show_id -> SeatMap
+# show_id -> write generation, guards against storing a map loaded before a concurrent write.
+# Generations come from one counter; a show without an entry reads as _gen_floor, which is
+# raised past every generation dropped from _gen, so a dropped entry can't match an old read.
+_gen = OrderedDict()
+_gen_counter = itertools.count(1)
+_gen_floor = 0
+
+
+def _generation(show_id: int) -> int:
+    return _gen.get(show_id, _gen_floor)
+
+
+def _bump(show_id: int):
+    """
+    Record a write to a show's bookings. Caller holds _lock.
+    """
+    global _gen_floor
+    _gen[show_id] = next(_gen_counter)
+    _gen.move_to_end(show_id)
+    while len(_gen) > 4 * MAX_SHOWS:
+        _, g = _gen.popitem(last=False)
+        _gen_floor = max(_gen_floor, g)
+
+
+def _put(cache, key, value, limit):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def hall_index(db, hall_id: int) -> HallIndex:
+    with _lock:
+        hi = _halls.get(hall_id)
+        if hi is not None:
+            _halls.move_to_end(hall_id)
+    if hi is None:
+        seats = db.query(models.Seat.id, models.Seat.row, models.Seat.number).filter(models.Seat.hall_id == hall_id).all()
+        hi = HallIndex(hall_id, seats)
+        with _lock:
+            _put(_halls, hall_id, hi, MAX_HALLS)
+    return hi
+
+
+def load(db, show_id: int):
+    show = db.query(models.Show.id, models.Show.hall_id).filter(models.Show.id == show_id).first()
+    if not show:
+        return None
+    hall = hall_index(db, show.hall_id)
+    booked = [r[0] for r in db.query(models.Booking.seat_id).filter(models.Booking.show_id == show_id).all()]
+    # seats of archived bookings (archive.py) stay sold
+    booked += [r[0] for r in db.query(models.ArchivedBooking.seat_id).filter(models.ArchivedBooking.show_id == show_id).all()]
+    return SeatMap(show_id, hall, booked)
+
+
+def get(db, show_id: int):
+    """
+    Return the cached SeatMap for a show, loading it from the DB on a miss. None if the show doesn't exist.
+    """
+    with _lock:
+        sm = _maps.get(show_id)
+        gen = _generation(show_id)
+        if sm is not None:
+            _maps.move_to_end(show_id)
+    if sm is not None:
+        return sm
+    sm = load(db, show_id)
+    if sm is None:
+        return None
+    with _lock:
+        if _generation(show_id) == gen:
+            _put(_maps, show_id, sm, MAX_SHOWS)
+    return sm
+
+
+def mark_booked(show_id: int, seat_ids):
+    with _lock:
+        _bump(show_id)
+        sm = _maps.get(show_id)
+        if sm is not None:
+            sm.mark(seat_ids, True)
+    broker.seat_event(show_id, booked=seat_ids)
+
+
+def mark_free(show_id: int, seat_ids):
+    with _lock:
+        _bump(show_id)
+        sm = _maps.get(show_id)
+        if sm is not None:
+            sm.mark(seat_ids, False)
+    broker.seat_event(show_id, freed=seat_ids)
+
+
+def invalidate_hall(hall_id: int):
+    """
+    Drop a hall's seat index and every show map built on it (e.g. after its seats change).
+    """
+    with _lock:
+        _halls.pop(hall_id, None)
+        for k in [k for k, sm in _maps.items() if sm.hall_id == hall_id]:
+            _bump(k)
+            del _maps[k]
+
+
+def invalidate(show_id: int = None):
+    global _gen_floor
+    with _lock:
+        if show_id is None:
+            # every generation handed out so far is now stale, loaded or not
+            _gen.clear()
+            _gen_floor = next(_gen_counter)
+            _maps.clear()
+            _halls.clear()
+        else:
+            _bump(show_id)
+            _maps.pop(show_id, None)
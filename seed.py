@@ -0,0 +1,194 @@
+"""
+Deterministic synthetic datasets for demos and capacity testing.
+
+    python seed.py                                   # small demo dataset
+    python seed.py --theaters 50 --halls 10 --seats 300 --shows 20 --users 100000 --occupancy 0.7
+
+Creates `movies` movies, `theaters` theaters with `halls` halls of `seats`
+seats each, `shows` shows per hall (five slots a day from --start), `users`
+users, and books `occupancy` of every show's seats to random users.
+
+Everything goes in with executemany INSERTs, never through ORM objects
+(bookings go straight to the driver on SQLite). Bookings are generated show
+by show and flushed every `batch` rows, so memory stays bounded by the seat
+ids and user ids, not the booking count. The rollups for the new shows are
+added from counts kept while generating (analytics.register_bulk) instead
+of a full rebuild, and the catalog's response cache tags are invalidated.
+
+The same parameters and --seed on an empty database produce the same rows
+and ids. On a database that already has data the ids are offset, but the
+generated choices are the same.
+"""
+import math
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+import models, analytics, provisioning, cache, bus
+
+DEFAULT_START = datetime(2026, 1, 1)
+SLOTS = (10, 13, 16, 19, 22)  # show start hours
+PRICES = (8.0, 10.0, 12.5, 15.0)
+BOOKING_BATCH = 50000
+LOAD_CACHE_KIB = -262144  # negative: KiB, i.e. 256 MB
+SALE_MINUTES = range(1, 14 * 24 * 60)
+
+
+def hall_rows(seats: int):
+    """
+    Row lengths for a roughly 2:1 hall of exactly `seats` seats.
+    """
+    per_row = min(provisioning.MAX_SEATS_PER_ROW, max(1, math.ceil(math.sqrt(seats * 2))))
+    full, rest = divmod(seats, per_row)
+    return [per_row] * full + ([rest] if rest else [])
+
+
+def _insert_bookings(db: Session, rows):
+    """
+    executemany INSERT of (user_id, show_id, seat_id, price, created_at) tuples. Caller commits.
+    """
+    conn = db.connection()
+    if conn.dialect.name == "sqlite":
+        # straight to the driver: skips per-row bind processing, dates in SQLAlchemy's SQLite format
+        conn.exec_driver_sql(
+            "INSERT INTO bookings (user_id, show_id, seat_id, price, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(u, s, seat, p, at.isoformat(" ", "microseconds")) for u, s, seat, p, at in rows],
+        )
+    else:
+        conn.execute(models.Booking.__table__.insert(), [
+            {"user_id": u, "show_id": s, "seat_id": seat, "price": p, "created_at": at} for u, s, seat, p, at in rows
+        ])
+
+
+def _next_id(db: Session, model) -> int:
+    return (db.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def generate(db: Session, movies: int = 3, theaters: int = 1, halls: int = 1, seats: int = 100, shows: int = 3,
+             users: int = 10, occupancy: float = 0.0, seed: int = 42, start: datetime = DEFAULT_START,
+             batch: int = BOOKING_BATCH):
+    """
+    Insert a synthetic dataset and return what was created. Raises ValueError for negative
+    counts, shows without movies or an occupancy outside 0-1, and provisioning.LayoutError
+    (a ValueError) for hall sizes that don't fit the layout limits.
+    """
+    counts = {"movies": movies, "theaters": theaters, "halls": halls, "seats": seats, "shows": shows, "users": users}
+    for name, n in counts.items():
+        if n < 0:
+            raise ValueError(f"{name} must not be negative")
+    if batch < 1:
+        raise ValueError("batch must be at least 1")
+    if not movies and theaters and halls and shows:
+        raise ValueError("shows need at least one movie")
+    if not 0.0 <= occupancy <= 1.0:
+        raise ValueError("occupancy must be between 0 and 1")
+    rows = hall_rows(seats)
+    layout = provisioning.hall_seats(row_counts=rows)  # validates the size before anything is written
+    rnd = random.Random(seed)
+
+    # titles, theater names and emails are unique: number them after the existing rows
+    first_movie = _next_id(db, models.Movie)
+    movie_ids = db.execute(insert(models.Movie).returning(models.Movie.id), [
+        {"title": f"Movie {n}", "price": rnd.choice(PRICES)} for n in range(first_movie, first_movie + movies)
+    ]).scalars().all() if movies else []
+    price = dict(db.execute(select(models.Movie.id, models.Movie.price).where(models.Movie.id.in_(movie_ids))).all())
+
+    first_user = _next_id(db, models.User)
+    user_ids = []
+    for lo in range(0, users, batch):
+        user_ids += db.execute(insert(models.User).returning(models.User.id), [
+            {"name": f"User {n}", "email": f"user{n}@demo.example"}
+            for n in range(first_user + lo, first_user + min(users, lo + batch))
+        ]).scalars().all()
+
+    first_theater = _next_id(db, models.Theater)
+    hall_seats, show_rows = {}, []
+    for t in range(first_theater, first_theater + theaters):
+        theater_id = db.execute(insert(models.Theater).returning(models.Theater.id), [{"name": f"Theater {t}"}]).scalar_one()
+        hall_ids = db.execute(insert(models.Hall).returning(models.Hall.id), [
+            {"name": f"Hall {h + 1}", "theater_id": theater_id} for h in range(halls)
+        ]).scalars().all() if halls else []
+        for hall_id in hall_ids:
+            provisioning.insert_seats(db, hall_id, layout)
+            hall_seats[hall_id] = db.execute(
+                select(models.Seat.id).where(models.Seat.hall_id == hall_id).order_by(models.Seat.id)
+            ).scalars().all()
+            for s in range(shows):
+                at = start + timedelta(days=s // len(SLOTS), hours=SLOTS[s % len(SLOTS)])
+                show_rows.append({"time": at.strftime("%H:%M"), "start_time": at,
+                                  "movie_id": rnd.choice(movie_ids), "hall_id": hall_id})
+    show_ids = db.execute(insert(models.Show).returning(models.Show.id), show_rows).scalars().all() if show_rows else []
+
+    rollups, buckets, booked = [], {}, 0
+    pending = []
+    conn = db.connection()
+    cache_size = None
+    if conn.dialect.name == "sqlite":
+        # a page cache big enough for the bookings indexes while they take random inserts (this connection only)
+        cache_size = conn.exec_driver_sql("PRAGMA cache_size").scalar()
+        conn.exec_driver_sql(f"PRAGMA cache_size={LOAD_CACHE_KIB}")
+    try:
+        for show_id, row in zip(show_ids, show_rows):
+            hall = hall_seats[row["hall_id"]]
+            p = price[row["movie_id"]]
+            n = round(len(hall) * occupancy) if user_ids else 0
+            rollups.append({"show_id": show_id, "movie_id": row["movie_id"], "hall_id": row["hall_id"],
+                            "capacity": len(hall), "tickets": n, "revenue": n * p})
+            if not n:
+                continue
+            # sold at some minute in the two weeks before the show
+            ago = rnd.choices(SALE_MINUTES, k=n)
+            users_ = rnd.choices(user_ids, k=n)
+            at = row["start_time"]
+            for seat_id, user_id, m in zip(sorted(rnd.sample(hall, n)), users_, ago):
+                pending.append((user_id, show_id, seat_id, p, at - timedelta(minutes=m)))
+            hour = analytics.hour_bucket(at)
+            for h, k in Counter((at.minute - m) // 60 for m in ago).items():
+                b = buckets.setdefault((row["movie_id"], hour + timedelta(hours=h)), [0, 0.0])
+                b[0] += k
+                b[1] += k * p
+            if len(pending) >= batch:
+                _insert_bookings(db, pending)
+                booked += len(pending)
+                pending = []
+        if pending:
+            _insert_bookings(db, pending)
+            booked += len(pending)
+        analytics.register_bulk(db, rollups, buckets)
+        bus.publish(db, "catalog")
+        for h in hall_seats:
+            bus.publish(db, "hall", h)
+    finally:
+        if cache_size is not None:
+            # restored on the same connection before it goes back to the pool, also when the load fails
+            conn.exec_driver_sql(f"PRAGMA cache_size={cache_size}")
+    db.commit()
+
+    cache.invalidate("movies", "theaters", "halls", "shows", "users", *(f"seats:{h}" for h in hall_seats))
+    return {"movies": len(movie_ids), "theaters": theaters, "halls": len(hall_seats),
+            "seats": seats * len(hall_seats), "shows": len(show_ids), "users": len(user_ids), "bookings": booked}
+
+
+if __name__ == "__main__":
+    import argparse, time
+    from database import SessionLocal, engine
+    import migrations
+    ap = argparse.ArgumentParser(description="Load a deterministic synthetic dataset")
+    ap.add_argument("--movies", type=int, default=3)
+    ap.add_argument("--theaters", type=int, default=1)
+    ap.add_argument("--halls", type=int, default=1, help="halls per theater")
+    ap.add_argument("--seats", type=int, default=100, help="seats per hall")
+    ap.add_argument("--shows", type=int, default=3, help="shows per hall")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--occupancy", type=float, default=0.0, help="share of each show's seats to book (0-1)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--start", type=datetime.fromisoformat, default=DEFAULT_START, help="first show day (ISO date)")
+    args = ap.parse_args()
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        print(generate(db, **vars(args)), f"in {time.perf_counter() - t0:.1f}s")
+    finally:
+        db.close()
@@ -0,0 +1,18 @@
+"""
+Test setup: the whole session runs against a throwaway SQLite file, so DATABASE_URL
+is set here, before anything imports database.py.
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+    with TestClient(main.app) as c:
+        yield c
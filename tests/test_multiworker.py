@@ -0,0 +1,21 @@
+"""
+benchmarks/multiworker_consistency.py as a test: several worker processes on one
+database must agree on seats, cached lists, holds and waitlist notifications.
+Run in a subprocess, since it spawns the workers and picks its own database.
+"""
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.slow
+def test_workers_stay_consistent():
+    env = {k: v for k, v in os.environ.items() if k not in ("DATABASE_URL", "MW_DATABASE_URL")}
+    r = subprocess.run(
+        [sys.executable, os.path.join("benchmarks", "multiworker_consistency.py"), "--seconds", "2", "--rounds", "10"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert r.returncode == 0, r.stdout + r.stderr
@@ -0,0 +1,117 @@
+"""
+SQL statements per request on the API's hot paths, against fixed budgets.
+
+Seat maps are warm, as they are in a running worker, and the response cache is
+cleared before each request, so the cached lists are measured on a miss. A
+change that adds a query per row, per seat or per booking fails here; a change
+that legitimately needs another statement updates the budget in the same commit.
+"""
+import threading
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+import cache
+from database import engine, async_engine
+
+ENGINES = (engine, async_engine.sync_engine)  # on SQLite crud runs on the sync engine (crud_async.py)
+
+READ_BUDGETS = [
+    ("/movies/", 1),
+    ("/theaters/", 1),
+    ("/halls/", 1),
+    ("/shows/", 1),
+    ("/shows/search?movie_id={movie}", 1),
+    ("/users/", 1),
+    ("/bookings/", 1),
+    ("/seats/{hall}", 1),
+    ("/available_seats/{show}", 0),
+    ("/seat_layout/{show}", 0),
+    ("/user_bookings/{user}", 2),
+    ("/analytics/movie/{movie}", 3),
+    ("/analytics/top_movies", 1),
+    ("/analytics/show/{show}/occupancy", 1),
+    ("/analytics/hall/{hall}/occupancy", 1),
+    ("/analytics/movie/{movie}/sales", 1),
+]
+
+
+@contextmanager
+def counting():
+    n = [0]
+
+    def count(*_):
+        if threading.current_thread().name != "bus-listener":  # polls on its own schedule
+            n[0] += 1
+    for eng in ENGINES:
+        event.listen(eng, "before_cursor_execute", count)
+    try:
+        yield n
+    finally:
+        for eng in ENGINES:
+            event.remove(eng, "before_cursor_execute", count)
+
+
+@pytest.fixture(scope="module")
+def ids(client):
+    def post(path, body):
+        r = client.post(path, json=body)
+        r.raise_for_status()
+        return r.json()["id"]
+    movie = post("/movies/", {"title": "Query budget", "price": 10.0})
+    theater = post("/theaters/", {"name": "Query budget"})
+    hall = post("/halls/", {"name": "Q", "theater_id": theater, "rows": 10, "seats_per_row": 10})
+    # far in the future: other tests archive past shows
+    show = post("/shows/", {"movie_id": movie, "hall_id": hall, "start_time": "2030-01-01T18:00:00"})
+    user = post("/users/", {"name": "budget", "email": "budget@example.com"})
+    seats = [s["seat_id"] for s in client.get(f"/available_seats/{show}").json()]
+    return {"show": show, "hall": hall, "movie": movie, "user": user, "seats": seats}
+
+
+def statements(client, ids, method, url, **kwargs):
+    client.get(f"/available_seats/{ids['show']}")  # the show's seat map is loaded
+    cache.responses.clear()
+    with counting() as n:
+        r = client.request(method, url, **kwargs)
+    assert r.status_code < 400, r.text
+    return n[0], r
+
+
+@pytest.mark.parametrize("path,budget", READ_BUDGETS)
+def test_read_budget(client, ids, path, budget):
+    n, _ = statements(client, ids, "GET", path.format(**ids))
+    assert n <= budget, f"GET {path}: {n} statements, budget {budget}"
+
+
+def test_booking_budgets(client, ids):
+    show, user, seats = ids["show"], ids["user"], ids["seats"]
+    n, r = statements(client, ids, "POST", "/bookings/", json={"user_id": user, "show_id": show, "seat_id": seats[0]})
+    assert n <= 10, f"POST /bookings/: {n} statements"
+    booking_id = r.json()["id"]
+    n, _ = statements(client, ids, "POST", "/book_group/", json={"user_id": user, "show_id": show, "num_seats": 3})
+    assert n <= 9, f"POST /book_group/: {n} statements"
+    n, _ = statements(client, ids, "POST", "/book_group_seats/", json={"user_id": user, "show_id": show, "seat_ids": seats[20:23]})
+    assert n <= 9, f"POST /book_group_seats/: {n} statements"
+    n, _ = statements(client, ids, "POST", "/bookings/", json={"user_id": user, "show_id": show, "seat_id": seats[24]},
+                      headers={"Idempotency-Key": "query-count"})
+    assert n <= 15, f"POST /bookings/ with an Idempotency-Key: {n} statements"
+    n, _ = statements(client, ids, "DELETE", f"/bookings/{booking_id}")
+    assert n <= 9, f"DELETE /bookings/{{id}}: {n} statements"
+
+
+def test_hold_budgets(client, ids):
+    show, user, seats = ids["show"], ids["user"], ids["seats"]
+    n, r = statements(client, ids, "POST", "/holds/", json={"user_id": user, "show_id": show, "seat_ids": seats[30:32]})
+    assert n <= 3, f"POST /holds/: {n} statements"
+    n, _ = statements(client, ids, "POST", f"/holds/{r.json()['hold_id']}/confirm")
+    assert n <= 11, f"POST /holds/{{id}}/confirm: {n} statements"
+
+
+def test_booking_history_is_not_n_plus_one(client, ids):
+    show, seats = ids["show"], ids["seats"]
+    user = client.post("/users/", json={"name": "history", "email": "budget-history@example.com"}).json()["id"]
+    client.post("/bookings/", json={"user_id": user, "show_id": show, "seat_id": seats[40]}).raise_for_status()
+    one, _ = statements(client, ids, "GET", f"/user_bookings/{user}")
+    client.post("/book_group_seats/", json={"user_id": user, "show_id": show, "seat_ids": seats[41:61]}).raise_for_status()
+    many, r = statements(client, ids, "GET", f"/user_bookings/{user}")
+    assert len(r.json()["bookings"]) == 21
+    assert many == one, f"/user_bookings: {one} statements for 1 booking, {many} for 21"
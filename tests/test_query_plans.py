@@ -0,0 +1,66 @@
+"""
+EXPLAIN QUERY PLAN for every crud entry point (the scenario of query_plans.py):
+no unindexed scan outside FULL_SCAN_OK, and the hot lookups use the index that
+was added for them. Dropping or reshaping one of those indexes fails here.
+"""
+import re
+import pytest
+
+INDEXES = [
+    ("search_shows_movie", "ix_shows_movie_start"),
+    ("search_shows_theater", "ix_shows_hall_start"),
+    ("search_shows_window", "ix_shows_start_time"),
+    ("suggest_alternate_shows", "ix_shows_movie_start"),
+    ("list_seats_by_hall", "sqlite_autoindex_seats_1"),
+    ("create_booking", "sqlite_autoindex_bookings_1"),
+    ("create_booking", "ix_bookings_archive_show_id"),
+    ("create_booking", "sqlite_autoindex_seat_holds_1"),
+    ("hold_seats", "ix_seat_holds_expires_at"),
+    ("get_hold_from_table", "ix_seat_holds_hold_id"),
+    ("bookings_for_user", "ix_bookings_user_id"),
+    ("bookings_for_user_archived", "ix_bookings_archive_user_id"),
+    ("allocate_waitlist", "ix_waitlist_queue"),
+    ("archive_move", "ix_shows_start_time"),
+    ("top_movies", "ix_movie_sales_tickets"),
+    ("sales_series", "sqlite_autoindex_sales_buckets_1"),
+]
+
+
+@pytest.fixture(scope="module")
+def query_plans(client):
+    # imported after the app, so it runs on the test database set up in conftest.py
+    import query_plans
+    return query_plans
+
+
+@pytest.fixture(scope="module")
+def seeded(query_plans):
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        yield db, query_plans._seed(db)
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def plans(query_plans, seeded):
+    return query_plans.plans(*seeded)
+
+
+def test_no_unindexed_scans(query_plans, plans):
+    bad = [(name, statement, scans) for name, statement, _, scans in plans if scans and name not in query_plans.FULL_SCAN_OK]
+    assert not bad
+
+
+@pytest.mark.parametrize("name,index", INDEXES)
+def test_uses_index(plans, name, index):
+    used = [d for n, _, detail, _ in plans if n == name for d in detail]
+    assert used, f"{name} issued no statements"
+    assert any(re.search(rf"INDEX {index}\b", d) for d in used), f"{name} doesn't use {index}:\n" + "\n".join(used)
+
+
+def test_booking_history_is_not_n_plus_one(query_plans, seeded, plans):
+    db, (movie_id, hall_id, _, _) = seeded
+    for name, one, many in query_plans.history_counts(db, movie_id, hall_id):
+        assert one == many, f"{name}: {one} statements for 1 booking, {many} for {query_plans.HISTORY_SIZE}"
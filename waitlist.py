@@ -0,0 +1,63 @@
+"""
+Waitlist plumbing: which shows have freed seats, how a waiting entry is matched
+against a show's seat map, and user notifications.
+
+Instead of re-polling /book_group/ for a sold-out show, a user registers a
+waitlist entry (N seats, consecutive or not). crud's cancel functions report
+the shows they freed seats in with `seats_freed`; main schedules
+crud.allocate_waitlist for those shows as a background task, which books
+matching entries (priority, then FIFO) and notifies their users through the
+broker (topic ("user", user_id), streamed by /notifications/{user_id}). The
+other workers notify the users connected to them when the change_log event
+of the allocation arrives (see bus.py).
+"""
+import threading
+from broker import broker
+
+ALLOCATE_SCAN = 200  # waiting entries looked at per allocation pass
+
+_lock = threading.Lock()
+_pending = set()  # show ids with seats freed since the last allocation pass
+
+
+def seats_freed(show_id: int):
+    with _lock:
+        _pending.add(show_id)
+
+
+def take_pending():
+    """
+    Show ids to allocate for, clearing the set.
+    """
+    with _lock:
+        shows = sorted(_pending)
+        _pending.clear()
+    return shows
+
+
+def pick_seats(sm, num_seats: int, consecutive: bool, held=None):
+    """
+    Seat ids for one waitlist entry from a SeatMap, or None if it can't be served yet.
+    """
+    if num_seats <= 0:
+        return None
+    if consecutive:
+        found = sm.find_consecutive(num_seats, held=held)
+        return [s.id for s in found[1]] if found else None
+    avail = sm.available(held=held)
+    return [s.id for s in avail[:num_seats]] if len(avail) >= num_seats else None
+
+
+def parse_seat_ids(value):
+    return [int(x) for x in value.split(",")] if value else []
+
+
+def notify(user_id: int, event: dict):
+    broker.publish(("user", user_id), event)
+
+
+def fulfilled(user_id: int, entry_id: int, show_id: int, seat_ids, booking_ids):
+    notify(user_id, {
+        "type": "waitlist_fulfilled", "entry_id": entry_id, "show_id": show_id,
+        "seat_ids": seat_ids, "booking_ids": booking_ids,
+    })